@@ -0,0 +1,202 @@
+"""
+Benchmarks de la API SICETAC.
+
+Usa las tablas reales de Supabase (mismas variables de entorno que la API):
+
+    python bench_sicetac.py --workers 1 2 4 8 --repeticiones 3
+
+- Snapshot por shards: para cada número de workers reporta el mejor tiempo,
+  el speedup contra 1 worker y verifica que el resultado sea idéntico al
+  secuencial.
+- Serialización: tiempo de `dumps_json` (orjson) contra la ruta anterior
+  (conversión recursiva de tipos numpy + json estándar) sobre respuestas de
+  consulta, lote y snapshot.
+- Formato de respuesta del lote: bytes y tiempo de decodificación en el
+  cliente para JSON, MessagePack y Arrow IPC (negociados con `Accept`).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from typing import Any
+
+import sicetac_service
+from respuesta_columnar import MEDIA_ARROW, MEDIA_JSON, MEDIA_MSGPACK, formatos_disponibles, serializar_columnar, tabla_columnar
+from respuesta_json import dumps_json, orjson
+
+
+def _medir(fn, repeticiones: int) -> tuple[float, Any]:
+    mejor = float("inf")
+    resultado = None
+    for _ in range(max(1, repeticiones)):
+        inicio = time.perf_counter()
+        resultado = fn()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor, resultado
+
+
+def bench_shards(
+    workers: list[int],
+    *,
+    repeticiones: int = 3,
+    carroceria: str = "GENERAL",
+    modo_viaje: str = "CARGADO",
+    filas_por_bloque: int | None = None,
+) -> list[dict[str, Any]]:
+    if filas_por_bloque is not None:
+        sicetac_service._SNAPSHOT_BLOQUE_RUTAS = filas_por_bloque
+    # Calentar caches (tablas, índices, tarifa) antes de medir.
+    referencia = sicetac_service.generar_snapshot(carroceria=carroceria, modo_viaje=modo_viaje, workers=1)
+
+    filas: list[dict[str, Any]] = []
+    base = None
+    for n in workers:
+        segundos, df = _medir(
+            lambda n=n: sicetac_service.generar_snapshot(carroceria=carroceria, modo_viaje=modo_viaje, workers=n),
+            repeticiones,
+        )
+        base = base or segundos
+        filas.append(
+            {
+                "workers": n,
+                "segundos": round(segundos, 4),
+                "speedup": round(base / segundos, 2),
+                "filas": len(df),
+                "identico": bool(df.equals(referencia)),
+            }
+        )
+    return filas
+
+
+def _convertir_nativos(d: Any):
+    # Ruta previa: recorrer la respuesta completa antes de json.dumps.
+    if isinstance(d, dict):
+        return {k: _convertir_nativos(v) for k, v in d.items()}
+    if isinstance(d, list):
+        return [_convertir_nativos(v) for v in d]
+    if hasattr(d, "item"):
+        return d.item()
+    return d
+
+
+def _payloads_serializacion(lanes: int) -> dict[str, Any]:
+    df_rutas = sicetac_service.get_table_df("rutas")
+    pares = (
+        df_rutas[["CODIGO_DANE_ORIGEN", "CODIGO_DANE_DESTINO"]]
+        .astype(str)
+        .drop_duplicates()
+        .head(lanes)
+        .itertuples(index=False)
+    )
+    consultas = [
+        sicetac_service.ConsultaInput(codigo_dane_origen=o, codigo_dane_destino=d)
+        for o, d in pares
+    ]
+    detalle = sicetac_service.calcular_sicetac(consultas[0].model_copy(update={"resumen": False}))
+    snapshot = sicetac_service.generar_snapshot().head(lanes * 10)
+    return {
+        "consulta": detalle,
+        "lote": sicetac_service.calcular_sicetac_lote(consultas),
+        "snapshot": {"filas": snapshot.to_dict(orient="records")},
+    }
+
+
+def bench_serializacion(*, lanes: int = 200, repeticiones: int = 20) -> list[dict[str, Any]]:
+    filas: list[dict[str, Any]] = []
+    for nombre, payload in _payloads_serializacion(lanes).items():
+        anterior, datos_anterior = _medir(
+            lambda payload=payload: json.dumps(_convertir_nativos(payload), ensure_ascii=False).encode("utf-8"),
+            repeticiones,
+        )
+        actual, datos_actual = _medir(lambda payload=payload: dumps_json(payload), repeticiones)
+        filas.append(
+            {
+                "payload": nombre,
+                "bytes": len(datos_actual),
+                "json_ms": round(anterior * 1000, 3),
+                "actual_ms": round(actual * 1000, 3),
+                "speedup": round(anterior / actual, 1) if actual else None,
+            }
+        )
+    return filas
+
+
+def _decodificador(media: str):
+    if media == MEDIA_ARROW:
+        import pyarrow as pa
+
+        return lambda datos: pa.ipc.open_stream(datos).read_all()
+    if media == MEDIA_MSGPACK:
+        import msgpack
+
+        return lambda datos: msgpack.unpackb(datos, raw=False)
+    return orjson.loads if orjson is not None else json.loads
+
+
+def bench_formatos(*, lanes: int = 200, repeticiones: int = 20) -> list[dict[str, Any]]:
+    lote = _payloads_serializacion(lanes)["lote"]
+    filas: list[dict[str, Any]] = []
+    base = None
+    for media in formatos_disponibles():
+        if media == MEDIA_JSON:
+            codificar = lambda: dumps_json(lote)
+        else:
+            codificar = lambda media=media: serializar_columnar(tabla_columnar(lote["resultados"]), media)
+        cod_seg, datos = _medir(codificar, repeticiones)
+        dec_seg, _ = _medir(lambda datos=datos, media=media: _decodificador(media)(datos), repeticiones)
+        base = base or len(datos)
+        filas.append(
+            {
+                "formato": {MEDIA_ARROW: "arrow", MEDIA_MSGPACK: "msgpack"}.get(media, "json"),
+                "bytes": len(datos),
+                "vs_json": round(len(datos) / base, 3),
+                "codif_ms": round(cod_seg * 1000, 3),
+                "decod_ms": round(dec_seg * 1000, 3),
+            }
+        )
+    return filas
+
+
+def _imprimir(titulo: str, filas: list[dict[str, Any]]) -> None:
+    print(f"\n{titulo}")
+    if not filas:
+        return
+    columnas = list(filas[0].keys())
+    print("  ".join(f"{c:>10}" for c in columnas))
+    for fila in filas:
+        print("  ".join(f"{str(fila[c]):>10}" for c in columnas))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks de la API SICETAC")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--carroceria", default="GENERAL")
+    parser.add_argument("--modo", default="CARGADO")
+    parser.add_argument("--bloque", type=int, default=None, help="rutas por bloque/shard")
+    parser.add_argument("--lanes", type=int, default=200, help="carriles del payload de lote en serialización")
+    args = parser.parse_args()
+
+    _imprimir(
+        "Snapshot por shards",
+        bench_shards(
+            args.workers,
+            repeticiones=args.repeticiones,
+            carroceria=args.carroceria,
+            modo_viaje=args.modo,
+            filas_por_bloque=args.bloque,
+        ),
+    )
+    _imprimir(
+        f"Serialización JSON ({'orjson' if orjson is not None else 'json estándar'})",
+        bench_serializacion(lanes=args.lanes, repeticiones=args.repeticiones * 5),
+    )
+    _imprimir(
+        f"Formato de respuesta del lote ({args.lanes} carriles)",
+        bench_formatos(lanes=args.lanes, repeticiones=args.repeticiones * 5),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Semántica de cache HTTP (ETag / Cache-Control / 304).
+
+Los listados de referencia (`/municipios`, `/opciones/*`) se serializan una
+sola vez por generación de su tabla y se sirven como bytes; las cotizaciones
+usan un ETag derivado de la generación de datos y del cuerpo de la consulta,
+de modo que un `If-None-Match` vigente responde `304` sin recalcular. Una
+cotización que cayó al modelo porque un lookup falló no lleva ETag y se marca
+`no-store`: el mismo validador no puede cubrirla a ella y a la del lookup.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from fastapi.responses import Response
+
+from respuesta_json import dumps_json
+
+CACHE_CONTROL_REFERENCIA = os.getenv("SICETAC_CACHE_CONTROL_REFERENCIA", "public, max-age=300").strip()
+CACHE_CONTROL_CONSULTA = os.getenv("SICETAC_CACHE_CONTROL_CONSULTA", "private, no-cache").strip()
+CACHE_CONTROL_DEGRADADA = "no-store"
+
+
+def calcular_etag(*partes: Any) -> str:
+    digest = hashlib.sha1("\x1f".join(str(p) for p in partes).encode("utf-8")).hexdigest()[:24]
+    return f'"{digest}"'
+
+
+def coincide_etag(if_none_match: str | None, etag: str) -> bool:
+    """Comparación débil de `If-None-Match` (acepta `*`, listas y prefijo `W/`)."""
+    if not if_none_match:
+        return False
+    for candidato in if_none_match.split(","):
+        candidato = candidato.strip()
+        if candidato == "*":
+            return True
+        if candidato.startswith("W/"):
+            candidato = candidato[2:]
+        if candidato == etag:
+            return True
+    return False
+
+
+def encabezados_cache(etag: str, cache_control: str, vary: str | None = None) -> dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if vary:
+        headers["Vary"] = vary
+    return headers
+
+
+def encabezados_consulta(etag: str, errores_lookup: list[str], vary: str | None = None) -> dict[str, str]:
+    """Encabezados de una cotización; sin ETag si algún lookup falló al calcularla."""
+    if not errores_lookup:
+        return encabezados_cache(etag, CACHE_CONTROL_CONSULTA, vary)
+    headers = {"Cache-Control": CACHE_CONTROL_DEGRADADA}
+    if vary:
+        headers["Vary"] = vary
+    return headers
+
+
+def no_modificado(etag: str, cache_control: str, vary: str | None = None) -> Response:
+    return Response(status_code=304, headers=encabezados_cache(etag, cache_control, vary))
+
+
+@dataclass
+class _Payload:
+    generacion: str
+    cuerpo: bytes
+    etag: str
+
+
+class PayloadsReferencia:
+    """Cuerpos JSON ya serializados por nombre, reconstruidos al cambiar la generación."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._payloads: dict[str, _Payload] = {}
+
+    def obtener(self, nombre: str, generacion: str, construir: Callable[[], Any]) -> tuple[bytes, str]:
+        payload = self._payloads.get(nombre)
+        if payload is not None and payload.generacion == generacion:
+            return payload.cuerpo, payload.etag
+        with self._lock:
+            payload = self._payloads.get(nombre)
+            if payload is None or payload.generacion != generacion:
+                cuerpo = dumps_json(construir())
+                payload = _Payload(generacion=generacion, cuerpo=cuerpo, etag=calcular_etag(nombre, hashlib.sha1(cuerpo).hexdigest()))
+                self._payloads[nombre] = payload
+        return payload.cuerpo, payload.etag
+
+    def clear(self) -> None:
+        with self._lock:
+            self._payloads.clear()
+
+
+PAYLOADS_REFERENCIA = PayloadsReferencia()
+
+
+def respuesta_referencia(
+    nombre: str,
+    generacion: str,
+    construir: Callable[[], Any],
+    if_none_match: str | None,
+) -> Response:
+    cuerpo, etag = PAYLOADS_REFERENCIA.obtener(nombre, generacion, construir)
+    if coincide_etag(if_none_match, etag):
+        return no_modificado(etag, CACHE_CONTROL_REFERENCIA)
+    return Response(
+        content=cuerpo,
+        media_type="application/json",
+        headers=encabezados_cache(etag, CACHE_CONTROL_REFERENCIA),
+    )
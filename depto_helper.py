@@ -1,5 +1,19 @@
 import pandas as pd
 from difflib import get_close_matches
+import re
+import unicodedata
+
+# Nombres cortos de uso común -> nombre oficial (normalizado) del departamento.
+_ALIAS_DEPARTAMENTOS = {
+    "VALLE": "VALLE DEL CAUCA",
+    "GUAJIRA": "LA GUAJIRA",
+    "NORTE SANTANDER": "NORTE DE SANTANDER",
+    "SAN ANDRES": "ARCHIPIELAGO DE SAN ANDRES, PROVIDENCIA Y SANTA CATALINA",
+    "SAN ANDRES Y PROVIDENCIA": "ARCHIPIELAGO DE SAN ANDRES, PROVIDENCIA Y SANTA CATALINA",
+    "DC": "BOGOTA, D.C.",
+    "DISTRITO CAPITAL": "BOGOTA, D.C.",
+}
+
 
 class DeptoHelper:
     def __init__(self, source):
@@ -9,22 +23,73 @@ class DeptoHelper:
             self.df = pd.read_excel(source)
         self.variantes = [col for col in self.df.columns if col.startswith('VARIANTE') or col == 'DEPARTAMENTO']
         self.col_id = 'ID DEPTO'
-        
-    def buscar_id(self, nombre):
-        nombre = str(nombre).strip().upper()
+        self._construir_indice()
+
+    @classmethod
+    def desde_municipios(cls, df_municipios, columna='departamento'):
+        """
+        Arma la tabla de departamentos a partir de la columna `departamento`
+        de municipios (no hay tabla propia en Supabase), con variantes sin
+        puntuación, antes de la coma y los alias de `_ALIAS_DEPARTAMENTOS`.
+        """
+        nombres = []
+        if columna in df_municipios.columns:
+            nombres = [str(v).strip() for v in df_municipios[columna].dropna().unique() if str(v).strip()]
+        alias_por_nombre = {}
+        for alias, oficial in _ALIAS_DEPARTAMENTOS.items():
+            alias_por_nombre.setdefault(oficial, []).append(alias)
+
+        filas = []
+        for id_depto, nombre in enumerate(sorted(nombres), start=1):
+            norm = cls._normalizar(nombre)
+            fila = {
+                'ID DEPTO': id_depto,
+                'DEPARTAMENTO': nombre,
+                'VARIANTE_1': re.sub(r"\s+", " ", norm.replace(".", "").replace(",", " ")).strip(),
+                'VARIANTE_2': norm.split(",")[0].strip(),
+            }
+            for i, alias in enumerate(alias_por_nombre.get(norm, []), start=3):
+                fila[f'VARIANTE_{i}'] = alias
+            filas.append(fila)
+        return cls(pd.DataFrame(filas) if filas else pd.DataFrame(columns=['ID DEPTO', 'DEPARTAMENTO']))
+
+    @staticmethod
+    def _normalizar(valor):
+        text = str(valor or "").strip().upper()
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(ch for ch in text if not unicodedata.combining(ch))
+        return re.sub(r"\s+", " ", text)
+
+    def _construir_indice(self):
+        # Hash nombre normalizado -> ID, respetando el orden de columnas y
+        # filas de la búsqueda original (gana la primera coincidencia).
+        self._indice = {}
+        self._opciones = {}
+        ids = self.df[self.col_id].tolist() if self.col_id in self.df.columns else []
         for col in self.variantes:
-            if col in self.df.columns:
-                match = self.df[self.df[col].astype(str).str.upper().fillna('') == nombre]
-                if not match.empty:
-                    return int(match.iloc[0][self.col_id])
+            por_nombre = {}
+            for valor, id_depto in zip(self.df[col].tolist(), ids):
+                if valor is None or (isinstance(valor, float) and pd.isna(valor)):
+                    continue
+                nombre = self._normalizar(valor)
+                if nombre:
+                    por_nombre.setdefault(nombre, int(id_depto))
+            for nombre, id_depto in por_nombre.items():
+                self._indice.setdefault(nombre, id_depto)
+            self._opciones[col] = por_nombre
+
+    def buscar_id(self, nombre):
+        nombre = self._normalizar(nombre)
+        if not nombre:
+            return None
+        id_depto = self._indice.get(nombre)
+        if id_depto is not None:
+            return id_depto
         for col in self.variantes:
-            if col in self.df.columns:
-                opciones = self.df[col].dropna().astype(str).str.upper().unique().tolist()
-                cercanos = get_close_matches(nombre, opciones, n=1, cutoff=0.8)
-                if cercanos:
-                    match = self.df[self.df[col].astype(str).str.upper() == cercanos[0]]
-                    if not match.empty:
-                        return int(match.iloc[0][self.col_id])
+            por_nombre = self._opciones.get(col) or {}
+            cercanos = get_close_matches(nombre, por_nombre, n=1, cutoff=0.8)
+            if cercanos:
+                return por_nombre[cercanos[0]]
         return None
 
     def buscar_nombre(self, id_depto):
@@ -0,0 +1,131 @@
+"""
+Grafo de rutas SICE para componer carriles no registrados.
+
+Los municipios (códigos DANE) son nodos y cada fila de `rutas` es una arista
+en ambos sentidos, con peso en km totales y en horas (con las velocidades de
+referencia por terreno, si se dan). Con varias rutas para un mismo par se
+conserva la de menor peso. La adyacencia se guarda en CSR (`indptr`,
+`destinos`, pesos por arista) y los caminos se buscan con Dijkstra.
+
+Para los municipios con más conexiones (hubs) se precalculan los árboles de
+caminos mínimos, así una consulta con origen o destino en un hub es una
+lectura de predecesores. No hay coordenadas en `municipios`, por lo que no se
+usa A*.
+"""
+from __future__ import annotations
+
+import heapq
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from modelo_vectorizado import km_por_terreno
+from peajes_matriz import limpiar_ids
+
+PESOS = ("km", "horas")
+
+
+class GrafoRutas:
+    def __init__(self, df_rutas: pd.DataFrame, velocidades: np.ndarray | None = None, hubs: int = 20):
+        columnas = ("CODIGO_DANE_ORIGEN", "CODIGO_DANE_DESTINO")
+        if df_rutas is None or df_rutas.empty or any(c not in df_rutas.columns for c in columnas):
+            df_rutas = pd.DataFrame(columns=[*columnas, "ID_SICE"])
+        origen = limpiar_ids(df_rutas["CODIGO_DANE_ORIGEN"]).to_numpy(dtype=str)
+        destino = limpiar_ids(df_rutas["CODIGO_DANE_DESTINO"]).to_numpy(dtype=str)
+        self.km_terreno = km_por_terreno(df_rutas)
+        km = self.km_terreno.sum(axis=-1)
+        if velocidades is not None:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                horas = np.where(np.asarray(velocidades) > 0, self.km_terreno / np.asarray(velocidades), 0.0).sum(axis=-1)
+        else:
+            horas = np.full(len(km), np.nan)
+
+        codigos, self.nodos = pd.factorize(pd.Series(np.concatenate([origen, destino])), sort=True)
+        u, v = codigos[: len(origen)], codigos[len(origen):]
+        filas = np.arange(len(origen))
+        validas = (u != v) & (km > 0) & (origen != "") & (destino != "")
+        # Aristas en ambos sentidos; por (u, v) se conserva la de menor km.
+        u, v, filas = np.concatenate([u[validas], v[validas]]), np.concatenate([v[validas], u[validas]]), np.concatenate([filas[validas]] * 2)
+        orden = np.lexsort((km[filas], v, u))
+        u, v, filas = u[orden], v[orden], filas[orden]
+        unicas = np.ones(len(u), dtype=bool)
+        unicas[1:] = (u[1:] != u[:-1]) | (v[1:] != v[:-1])
+        u, v, filas = u[unicas], v[unicas], filas[unicas]
+
+        self._pos = {k: i for i, k in enumerate(self.nodos)}
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(u, minlength=len(self.nodos)))])
+        self.origenes = u
+        self.destinos = v
+        self.filas = filas
+        self.pesos = {"km": km[filas], "horas": horas[filas]}
+
+        grado = np.diff(self.indptr)
+        self.hubs = [int(n) for n in np.argsort(-grado, kind="stable")[:max(0, hubs)] if grado[n] > 0]
+        self._arboles = {hub: self._dijkstra(hub) for hub in self.hubs}
+
+    def __len__(self) -> int:
+        return len(self.filas)
+
+    def _dijkstra(self, fuente: int, objetivo: int | None = None, peso: str = "km") -> tuple[np.ndarray, np.ndarray]:
+        pesos = self.pesos[peso]
+        dist = np.full(len(self.nodos), np.inf)
+        pred = np.full(len(self.nodos), -1, dtype=np.int64)
+        dist[fuente] = 0.0
+        cola = [(0.0, fuente)]
+        while cola:
+            d, n = heapq.heappop(cola)
+            if d > dist[n]:
+                continue
+            if n == objetivo:
+                break
+            for e in range(self.indptr[n], self.indptr[n + 1]):
+                nd = d + pesos[e]
+                m = self.destinos[e]
+                if nd < dist[m]:
+                    dist[m] = nd
+                    pred[m] = e
+                    heapq.heappush(cola, (nd, m))
+        return dist, pred
+
+    def _aristas(self, pred: np.ndarray, fuente: int, objetivo: int) -> list[int] | None:
+        aristas = []
+        n = objetivo
+        while n != fuente:
+            e = pred[n]
+            if e < 0:
+                return None
+            aristas.append(int(e))
+            n = self.origenes[e]
+        return aristas[::-1]
+
+    def camino(self, origen: Any, destino: Any, peso: str = "km") -> list[tuple[int, str, str]] | None:
+        """
+        Tramos [(fila en rutas, DANE desde, DANE hasta)] del camino mínimo, en
+        el sentido del viaje; None si no hay conexión.
+        """
+        if peso not in PESOS:
+            raise ValueError(f"Peso '{peso}' no soportado. Usa: {', '.join(PESOS)}")
+        if peso == "horas" and np.isnan(self.pesos["horas"]).any():
+            raise ValueError("El grafo no tiene velocidades de referencia para pesar por horas")
+        o = self._pos.get(str(origen))
+        d = self._pos.get(str(destino))
+        if o is None or d is None or o == d:
+            return None
+
+        invertido = False
+        if peso == "km" and o in self._arboles:
+            aristas = self._aristas(self._arboles[o][1], o, d)
+        elif peso == "km" and d in self._arboles:
+            # Grafo simétrico: el camino desde el hub destino se recorre al revés.
+            aristas = self._aristas(self._arboles[d][1], d, o)
+            invertido = True
+        else:
+            aristas = self._aristas(self._dijkstra(o, d, peso)[1], o, d)
+        if aristas is None:
+            return None
+
+        tramos = [(int(self.filas[e]), str(self.nodos[self.origenes[e]]), str(self.nodos[self.destinos[e]])) for e in aristas]
+        if invertido:
+            tramos = [(fila, hasta, desde) for fila, desde, hasta in tramos[::-1]]
+        return tramos
@@ -1,22 +1,54 @@
 import os
-from io import BytesIO
 
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import BaseModel
 
 from sicetac_service import (
     ConsultaInput,
+    ConsultaLoteInput,
+    HistorialInput,
+    SensibilidadInput,
     SicetacError,
+    ViajeInput,
     calcular_sicetac as calcular_sicetac_service,
     calcular_sicetac_resumen,
+    calcular_sicetac_lote,
+    calcular_sensibilidad,
+    calcular_historial,
+    calcular_viaje,
     _refresh_cache,
-    generar_snapshot,
+    actualizar_cubo_od,
+    cubo_stats,
+    generacion_datos,
+    mes_vigente,
+    peajes_stats,
+    sugerir_municipios,
+    variantes_snapshot,
     get_sice_column_options,
 )
-from supabase_data import get_client, get_table_df
+from cache_http import (
+    CACHE_CONTROL_CONSULTA,
+    calcular_etag,
+    coincide_etag,
+    encabezados_consulta,
+    no_modificado,
+    respuesta_referencia,
+)
+from respuesta_columnar import MEDIA_JSON, negociar_formato, respuesta_columnar
+from respuesta_json import RespuestaJSON
+import resultados_cerrados
+from snapshot_export import FORMATOS
+from snapshot_jobs import SNAPSHOT_JOBS
+from supabase_data import (
+    get_lookup_cache_stats,
+    get_singleflight_stats,
+    get_table_df,
+    get_table_generation,
+    seguimiento_lookups,
+)
 
-app = FastAPI(title="API SICETAC", version="1.7")
+app = FastAPI(title="API SICETAC", version="1.7", default_response_class=RespuestaJSON)
 
 cors_origins = os.getenv("CORS_ORIGINS", "*")
 origins = [o.strip() for o in cors_origins.split(",") if o.strip()]
@@ -29,35 +61,116 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def _etag_consulta(endpoint: str, data: BaseModel, media: str) -> str:
+    return calcular_etag(generacion_datos(), endpoint, media, data.model_dump_json())
+
+
 @app.post("/consulta")
-def calcular_sicetac_endpoint(data: ConsultaInput):
+def calcular_sicetac_endpoint(
+    data: ConsultaInput,
+    accept: str | None = Header(default=None),
+    if_none_match: str | None = Header(default=None),
+):
     try:
-        if data.resumen:
-            respuesta = calcular_sicetac_resumen(data)
-        else:
-            respuesta = calcular_sicetac_service(data)
-        return JSONResponse(content=respuesta)
+        media = negociar_formato(accept)
+        etag = _etag_consulta("consulta", data, media)
+        if coincide_etag(if_none_match, etag):
+            return no_modificado(etag, CACHE_CONTROL_CONSULTA, vary="Accept")
+        with seguimiento_lookups() as errores_lookup:
+            if data.resumen:
+                respuesta = calcular_sicetac_resumen(data)
+            else:
+                respuesta = calcular_sicetac_service(data)
+        headers = encabezados_consulta(etag, errores_lookup, vary="Accept")
+        if media != MEDIA_JSON:
+            return respuesta_columnar([respuesta], media, headers=headers)
+        return RespuestaJSON(content=respuesta, headers=headers)
 
     except HTTPException as ex:
         raise ex
     except SicetacError as ex:
         raise HTTPException(status_code=ex.status_code, detail=ex.detail)
     except Exception as e:
-        return JSONResponse(content={"error": str(e)}, status_code=500)
+        return RespuestaJSON(content={"error": str(e)}, status_code=500)
 
 
 @app.post("/consulta_resumen")
-def calcular_sicetac_resumen_endpoint(data: ConsultaInput):
+def calcular_sicetac_resumen_endpoint(
+    data: ConsultaInput,
+    accept: str | None = Header(default=None),
+    if_none_match: str | None = Header(default=None),
+):
     try:
-        respuesta = calcular_sicetac_resumen(data)
-        return JSONResponse(content=respuesta)
+        media = negociar_formato(accept)
+        etag = _etag_consulta("consulta_resumen", data, media)
+        if coincide_etag(if_none_match, etag):
+            return no_modificado(etag, CACHE_CONTROL_CONSULTA, vary="Accept")
+        with seguimiento_lookups() as errores_lookup:
+            respuesta = calcular_sicetac_resumen(data)
+        headers = encabezados_consulta(etag, errores_lookup, vary="Accept")
+        if media != MEDIA_JSON:
+            return respuesta_columnar([respuesta], media, headers=headers)
+        return RespuestaJSON(content=respuesta, headers=headers)
 
     except HTTPException as ex:
         raise ex
     except SicetacError as ex:
         raise HTTPException(status_code=ex.status_code, detail=ex.detail)
     except Exception as e:
-        return JSONResponse(content={"error": str(e)}, status_code=500)
+        return RespuestaJSON(content={"error": str(e)}, status_code=500)
+
+
+@app.post("/consulta_lote")
+def calcular_sicetac_lote_endpoint(
+    data: ConsultaLoteInput,
+    accept: str | None = Header(default=None),
+    if_none_match: str | None = Header(default=None),
+):
+    try:
+        media = negociar_formato(accept)
+        etag = _etag_consulta("consulta_lote", data, media)
+        if coincide_etag(if_none_match, etag):
+            return no_modificado(etag, CACHE_CONTROL_CONSULTA, vary="Accept")
+        with seguimiento_lookups() as errores_lookup:
+            lote = calcular_sicetac_lote(data.consultas)
+        headers = encabezados_consulta(etag, errores_lookup, vary="Accept")
+        if media != MEDIA_JSON:
+            return respuesta_columnar(lote["resultados"], media, headers=headers)
+        return RespuestaJSON(content=lote, headers=headers)
+    except SicetacError as ex:
+        raise HTTPException(status_code=ex.status_code, detail=ex.detail)
+    except Exception as e:
+        return RespuestaJSON(content={"error": str(e)}, status_code=500)
+
+
+@app.post("/sensibilidad")
+def sensibilidad_endpoint(data: SensibilidadInput):
+    try:
+        return RespuestaJSON(content=calcular_sensibilidad(data))
+    except SicetacError as ex:
+        raise HTTPException(status_code=ex.status_code, detail=ex.detail)
+    except Exception as e:
+        return RespuestaJSON(content={"error": str(e)}, status_code=500)
+
+
+@app.post("/historial")
+def historial_endpoint(data: HistorialInput):
+    try:
+        return RespuestaJSON(content=calcular_historial(data))
+    except SicetacError as ex:
+        raise HTTPException(status_code=ex.status_code, detail=ex.detail)
+    except Exception as e:
+        return RespuestaJSON(content={"error": str(e)}, status_code=500)
+
+
+@app.post("/viaje")
+def viaje_endpoint(data: ViajeInput):
+    try:
+        return RespuestaJSON(content=calcular_viaje(data))
+    except SicetacError as ex:
+        raise HTTPException(status_code=ex.status_code, detail=ex.detail)
+    except Exception as e:
+        return RespuestaJSON(content={"error": str(e)}, status_code=500)
 
 
 @app.get("/health")
@@ -65,60 +178,115 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/cache/stats")
+def cache_stats():
+    cerrados = resultados_cerrados.get_store()
+    return {
+        "singleflight": get_singleflight_stats(),
+        "lookups": get_lookup_cache_stats(),
+        "meses_cerrados": cerrados.stats() if cerrados is not None else None,
+        "peajes": peajes_stats(),
+        "cubo": cubo_stats(),
+    }
+
+
 @app.get("/opciones/carrocerias")
-def opciones_carrocerias():
-    return {"carrocerias": get_sice_column_options()}
+def opciones_carrocerias(if_none_match: str | None = Header(default=None)):
+    return respuesta_referencia(
+        "carrocerias",
+        "estatico",
+        lambda: {"carrocerias": get_sice_column_options()},
+        if_none_match,
+    )
+
+
+def _opciones_vehiculos_payload() -> dict:
+    df_vehiculos = get_table_df("vehiculos")
+    if df_vehiculos.empty:
+        return {"vehiculos": []}
+
+    columnas = [
+        col
+        for col in ["tipo_vehiculo", "configuracion_analisis", "detalle_tipo_vehiculo", "ejes_configuracion"]
+        if col in df_vehiculos.columns
+    ]
+    records = (
+        df_vehiculos[columnas]
+        .fillna("")
+        .drop_duplicates()
+        .to_dict(orient="records")
+    )
+    return {"vehiculos": records}
 
 
 @app.get("/opciones/vehiculos")
-def opciones_vehiculos():
+def opciones_vehiculos(if_none_match: str | None = Header(default=None)):
     try:
-        df_vehiculos = get_table_df("vehiculos")
-        if df_vehiculos.empty:
-            return {"vehiculos": []}
-
-        columnas = [
-            col
-            for col in ["tipo_vehiculo", "configuracion_analisis", "detalle_tipo_vehiculo", "ejes_configuracion"]
-            if col in df_vehiculos.columns
-        ]
-        records = (
-            df_vehiculos[columnas]
-            .fillna("")
-            .drop_duplicates()
-            .to_dict(orient="records")
+        return respuesta_referencia(
+            "vehiculos",
+            get_table_generation("vehiculos"),
+            _opciones_vehiculos_payload,
+            if_none_match,
         )
-        return {"vehiculos": records}
     except Exception as e:
-        return JSONResponse(content={"error": str(e)}, status_code=500)
+        return RespuestaJSON(content={"error": str(e)}, status_code=500)
+
+
+def _municipios_payload() -> dict:
+    df_municipios = get_table_df("municipios")
+    if df_municipios.empty:
+        return {"municipios": []}
+
+    columnas = [
+        col
+        for col in ["codigo_dane", "nombre_oficial", "variacion_1", "variacion_2", "variacion_3", "departamento"]
+        if col in df_municipios.columns
+    ]
+    records = (
+        df_municipios[columnas]
+        .fillna("")
+        .to_dict(orient="records")
+    )
+    return {"municipios": records}
 
 
 @app.get("/municipios")
-def listar_municipios():
+def listar_municipios(if_none_match: str | None = Header(default=None)):
     try:
-        df_municipios = get_table_df("municipios")
-        if df_municipios.empty:
-            return {"municipios": []}
-
-        columnas = [
-            col
-            for col in ["codigo_dane", "nombre_oficial", "variacion_1", "variacion_2", "variacion_3", "departamento"]
-            if col in df_municipios.columns
-        ]
-        records = (
-            df_municipios[columnas]
-            .fillna("")
-            .to_dict(orient="records")
+        return respuesta_referencia(
+            "municipios",
+            get_table_generation("municipios"),
+            _municipios_payload,
+            if_none_match,
         )
-        return {"municipios": records}
     except Exception as e:
-        return JSONResponse(content={"error": str(e)}, status_code=500)
+        return RespuestaJSON(content={"error": str(e)}, status_code=500)
+
+
+@app.get("/municipios/suggest")
+def sugerir_municipios_endpoint(q: str = "", limite: int = 10):
+    try:
+        return {"q": q, "sugerencias": sugerir_municipios(q, limite)}
+    except SicetacError as ex:
+        raise HTTPException(status_code=ex.status_code, detail=ex.detail)
+    except Exception as e:
+        return RespuestaJSON(content={"error": str(e)}, status_code=500)
 
 
 @app.post("/refresh")
-def refresh_cache():
-    _refresh_cache(force=True)
-    return {"status": "ok", "refreshed": True}
+def refresh_cache(completo: bool = False):
+    cambios = _refresh_cache(force=True, completo=completo)
+    return {"status": "ok", "refreshed": True, "cambios": cambios}
+
+
+@app.post("/cubo/generate")
+def cubo_generate(verificar_muestras: int = 25):
+    try:
+        return actualizar_cubo_od(verificar_muestras=verificar_muestras)
+    except SicetacError as ex:
+        raise HTTPException(status_code=ex.status_code, detail=ex.detail)
+    except Exception as e:
+        return RespuestaJSON(content={"error": str(e)}, status_code=500)
 
 
 @app.post("/consulta_texto")
@@ -163,39 +331,59 @@ def calcular_sicetac_texto(data: ConsultaInput):
     except SicetacError as ex:
         raise HTTPException(status_code=ex.status_code, detail=ex.detail)
     except Exception as e:
-        return JSONResponse(content={"error": str(e)}, status_code=500)
+        return RespuestaJSON(content={"error": str(e)}, status_code=500)
 
 
 @app.post("/snapshot/generate")
-def snapshot_generate():
+def snapshot_generate(
+    formato: str = "xlsx",
+    carroceria: str = "GENERAL",
+    modo_viaje: str = "CARGADO",
+    hojas: bool = False,
+    esperar: bool = False,
+):
+    formato = formato.strip().lower()
+    if formato not in FORMATOS:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {formato}. Usa uno de: {', '.join(FORMATOS)}")
     try:
-        df = generar_snapshot(horas=[0, 2, 4, 8])
-        if df.empty:
-            return JSONResponse(content={"error": "Snapshot vacío"}, status_code=500)
-
-        # Nombre del archivo
-        mes = int(df["mes"].iloc[0]) if "mes" in df.columns else "latest"
-        filename = f"sicetac_snapshot_{mes}_all.xlsx"
-
-        # Exportar a Excel en memoria
-        buf = BytesIO()
-        df.to_excel(buf, index=False)
-        buf.seek(0)
-
-        client = get_client()
-        bucket = client.storage.from_("snapshots")
-
-        # Upload (upsert)
-        bucket.upload(
-            filename,
-            buf.getvalue(),
-            {"content-type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "upsert": True},
+        variantes_snapshot(carroceria, modo_viaje)
+        # El cálculo y la subida corren en el pool de procesos; aquí solo se encola.
+        job, creado = SNAPSHOT_JOBS.enviar(
+            mes=mes_vigente(),
+            carroceria=carroceria,
+            modo_viaje=modo_viaje,
+            formato=formato,
+            hojas=hojas,
         )
-
-        public_url = bucket.get_public_url(filename)
-
-        return {"ok": True, "file": filename, "url": public_url}
+        if esperar:
+            SNAPSHOT_JOBS.esperar(job.id)
+            estado = SNAPSHOT_JOBS.estado(job)
+            if estado["estado"] != "completado":
+                return RespuestaJSON(content={"error": estado.get("error") or estado["estado"], "job_id": job.id}, status_code=500)
+            return {**estado["resultado"], "job_id": job.id}
+        return RespuestaJSON(content={**SNAPSHOT_JOBS.estado(job), "deduplicado": not creado}, status_code=202)
     except SicetacError as ex:
         raise HTTPException(status_code=ex.status_code, detail=ex.detail)
     except Exception as e:
-        return JSONResponse(content={"error": str(e)}, status_code=500)
+        return RespuestaJSON(content={"error": str(e)}, status_code=500)
+
+
+@app.get("/snapshot/jobs")
+def snapshot_jobs():
+    return {"jobs": SNAPSHOT_JOBS.listar()}
+
+
+@app.get("/snapshot/jobs/{job_id}")
+def snapshot_job(job_id: str):
+    job = SNAPSHOT_JOBS.obtener(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job de snapshot no encontrado")
+    return SNAPSHOT_JOBS.estado(job)
+
+
+@app.delete("/snapshot/jobs/{job_id}")
+def snapshot_job_cancel(job_id: str):
+    job = SNAPSHOT_JOBS.cancelar(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job de snapshot no encontrado")
+    return SNAPSHOT_JOBS.estado(job)
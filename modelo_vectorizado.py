@@ -0,0 +1,276 @@
+"""
+Versión vectorizada (numpy) de calcular_modelo_sicetac_extendido y
+calcular_modelo_sicetac_extendido_vacio.
+
+Los parámetros de un MES se compilan una sola vez en arreglos por vehículo
+(`TarifaMes`) y `evaluar_modelo` aplica las mismas fórmulas del modelo sobre
+arreglos con broadcasting, de modo que rutas × vehículos × horas × carrocerías
+se evalúan en una sola pasada.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from modelo_sicetac import mapeo_columnas_actualizado as _MAPEO_CARGADO
+from modelo_sicetac_vacio import mapeo_columnas_actualizado as _MAPEO_VACIO
+
+TERRENOS = ("plano", "ondulado", "montaña", "urbano", "despavimentado")
+KM_COLUMNAS = ("KM_PLANO", "KM_ONDULADO", "KM_MONTAÑOSO", "KM_URBANO", "KM_DESPAVIMENTADO")
+MODOS = ("CARGADO", "VACIO")
+
+_MAPEO_POR_MODO = {"CARGADO": _MAPEO_CARGADO, "VACIO": _MAPEO_VACIO}
+FACTOR_OTROS_COSTOS = {"CARGADO": 0.199824, "VACIO": 0.221824}
+FACTOR_IMPREVISTOS = 0.075
+HORAS_MES = 288
+
+
+@dataclass
+class TarifaMes:
+    mes: int
+    vehiculos: list[str]
+    velocidad: dict[str, np.ndarray]
+    consumo: dict[str, np.ndarray]
+    costos_variables: np.ndarray
+    valor_acpm: np.ndarray
+    carrocerias: list[str]
+    costo_fijo: np.ndarray
+    posiciones: dict[str, int] = field(default_factory=dict)
+
+    def __post_init__(self):
+        if not self.posiciones:
+            self.posiciones = {v: i for i, v in enumerate(self.vehiculos)}
+
+    def costo_fijo_para(self, carroceria: str | None) -> np.ndarray:
+        objetivo = normalizar_carroceria(carroceria)
+        try:
+            return self.costo_fijo[self.carrocerias.index(objetivo)]
+        except ValueError:
+            return np.full(len(self.vehiculos), np.nan)
+
+
+def normalizar_carroceria(carroceria: str | None) -> str:
+    return carroceria.upper().strip() if carroceria else "GENERAL"
+
+
+def _filtrar_mes(df: pd.DataFrame, mes: int) -> pd.DataFrame:
+    if df is None or df.empty or "MES" not in df.columns:
+        return pd.DataFrame()
+    return df[pd.to_numeric(df["MES"], errors="coerce") == int(mes)]
+
+
+def compilar_tarifa_mes(
+    df_parametros: pd.DataFrame,
+    df_costos_fijos: pd.DataFrame,
+    mes: int,
+    vehiculos: list[str] | None = None,
+) -> TarifaMes:
+    params_mes = _filtrar_mes(df_parametros, mes)
+    costos_mes = _filtrar_mes(df_costos_fijos, mes)
+
+    if vehiculos is None:
+        vehiculos = params_mes["TIPO_VEHICULO"].astype(str).unique().tolist() if not params_mes.empty else []
+    n = len(vehiculos)
+
+    # Igual que el modelo: primera fila por TIPO_VEHICULO exacto.
+    if not params_mes.empty:
+        params_mes = params_mes.drop_duplicates(subset="TIPO_VEHICULO", keep="first")
+        params_mes = params_mes.set_index(params_mes["TIPO_VEHICULO"].astype(str))
+    params_mes = params_mes.reindex(vehiculos) if not params_mes.empty else pd.DataFrame(index=vehiculos)
+
+    def _columna(nombre: str) -> np.ndarray:
+        if nombre not in params_mes.columns:
+            return np.full(n, np.nan)
+        return pd.to_numeric(params_mes[nombre], errors="coerce").to_numpy(dtype=float)
+
+    velocidad: dict[str, np.ndarray] = {}
+    consumo: dict[str, np.ndarray] = {}
+    for modo, mapeo in _MAPEO_POR_MODO.items():
+        velocidad[modo] = np.stack([_columna(mapeo[t]["velocidad"]) for t in TERRENOS], axis=-1) if n else np.empty((0, 5))
+        consumo[modo] = np.stack([_columna(mapeo[t]["consumo"]) for t in TERRENOS], axis=-1) if n else np.empty((0, 5))
+
+    carrocerias: list[str] = []
+    costo_fijo = np.empty((0, n))
+    if not costos_mes.empty and "TIPO_CARROCERIA" in costos_mes.columns:
+        costos_mes = costos_mes.assign(
+            _carroceria=costos_mes["TIPO_CARROCERIA"].astype(str).str.upper().str.strip(),
+            _vehiculo=costos_mes["TIPO_VEHICULO"].astype(str),
+        ).drop_duplicates(subset=["_vehiculo", "_carroceria"], keep="first")
+        carrocerias = costos_mes["_carroceria"].unique().tolist()
+        tabla = costos_mes.pivot(index="_carroceria", columns="_vehiculo", values="COSTO FIJO")
+        tabla = tabla.reindex(index=carrocerias, columns=vehiculos)
+        costo_fijo = tabla.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+
+    return TarifaMes(
+        mes=int(mes),
+        vehiculos=list(vehiculos),
+        velocidad=velocidad,
+        consumo=consumo,
+        costos_variables=_columna("COSTOS VARIABLES"),
+        valor_acpm=_columna("VALOR COMBUSTIBLE GALÓN ACPM"),
+        carrocerias=carrocerias,
+        costo_fijo=costo_fijo,
+    )
+
+
+def km_por_terreno(df_rutas: pd.DataFrame) -> np.ndarray:
+    if df_rutas is None or df_rutas.empty:
+        return np.empty((0, len(KM_COLUMNAS)))
+    columnas = [
+        pd.to_numeric(df_rutas[c], errors="coerce").fillna(0).to_numpy(dtype=float)
+        if c in df_rutas.columns else np.zeros(len(df_rutas))
+        for c in KM_COLUMNAS
+    ]
+    return np.stack(columnas, axis=-1)
+
+
+def evaluar_modelo(
+    *,
+    km,
+    velocidad,
+    consumo,
+    valor_acpm,
+    costos_variables,
+    costo_fijo,
+    peaje,
+    horas_logisticas=None,
+    modo: str = "CARGADO",
+) -> dict[str, np.ndarray]:
+    """
+    Aplica las fórmulas del modelo SICETAC con broadcasting.
+
+    `km`, `velocidad` y `consumo` llevan los 5 tipos de vía en el último eje;
+    el resto de argumentos deben ser compatibles con el shape resultante sin
+    ese eje. `horas_logisticas=None` (o NaN en un elemento) reproduce el
+    default de cada modelo.
+    """
+    modo = str(modo or "CARGADO").upper()
+    km = np.asarray(km, dtype=float)
+    velocidad = np.asarray(velocidad, dtype=float)
+    consumo = np.asarray(consumo, dtype=float)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        horas_via = np.where(velocidad != 0, km / velocidad, 0.0)
+        galones_via = np.where(consumo != 0, km / consumo, 0.0)
+    total_horas = horas_via.sum(axis=-1)
+    total_galones = galones_via.sum(axis=-1)
+
+    def _horas_default():
+        if modo == "VACIO":
+            return np.zeros_like(total_horas)
+        return np.where(total_horas < 8, 4.0, 8.0)
+
+    if horas_logisticas is None:
+        horas_log = _horas_default()
+    else:
+        horas_log = np.asarray(horas_logisticas, dtype=float)
+        if np.isnan(horas_log).any():
+            # NaN = default del modelo para ese elemento (barridos de escenarios).
+            horas_log = np.where(np.isnan(horas_log), _horas_default(), horas_log)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        recorridos = np.maximum(1, np.round(HORAS_MES / (total_horas + horas_log), 4))
+        costo_fijo_viaje = np.round(np.asarray(costo_fijo, dtype=float) / recorridos, 2)
+
+    combustible = np.round(total_galones * np.asarray(valor_acpm, dtype=float), 2)
+    peaje = np.asarray(peaje, dtype=float)
+    mantenimiento = np.round(km.sum(axis=-1) * np.asarray(costos_variables, dtype=float), 2)
+    imprevistos = np.round(mantenimiento * FACTOR_IMPREVISTOS, 2)
+    total_variable = np.round(combustible + peaje + mantenimiento + imprevistos, 2)
+    otros_costos = np.round((costo_fijo_viaje + total_variable) * FACTOR_OTROS_COSTOS.get(modo, FACTOR_OTROS_COSTOS["CARGADO"]), 2)
+    total_viaje = np.round(costo_fijo_viaje + total_variable + otros_costos, 2)
+
+    return {
+        "horas_recorrido": np.round(total_horas, 2),
+        "horas_logisticas": horas_log,
+        "recorridos_mes": recorridos,
+        "costo_fijo": costo_fijo_viaje,
+        "combustible": combustible,
+        "peajes": peaje,
+        "mantenimiento": mantenimiento,
+        "imprevistos": imprevistos,
+        "otros_costos": otros_costos,
+        "total_viaje": total_viaje,
+    }
+
+
+def cota_inferior_total(*, km, consumo, valor_acpm, costos_variables, peaje, modo: str = "CARGADO") -> np.ndarray:
+    """
+    Cota inferior de `total_viaje` sin horas ni costo fijo: costo variable
+    (combustible, peaje, mantenimiento, imprevistos) más sus otros costos. El
+    costo fijo por viaje nunca es negativo, así que ningún total la baja; se
+    descuenta un margen por los redondeos de `evaluar_modelo`.
+    """
+    modo = str(modo or "CARGADO").upper()
+    km = np.asarray(km, dtype=float)
+    consumo = np.asarray(consumo, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        galones = np.where(consumo != 0, km / consumo, 0.0).sum(axis=-1)
+    mantenimiento = km.sum(axis=-1) * np.asarray(costos_variables, dtype=float)
+    variable = galones * np.asarray(valor_acpm, dtype=float) + np.asarray(peaje, dtype=float) + mantenimiento * (1 + FACTOR_IMPREVISTOS)
+    factor = FACTOR_OTROS_COSTOS.get(modo, FACTOR_OTROS_COSTOS["CARGADO"])
+    return variable * (1 + factor) - 1.0
+
+
+def evaluar_totales(
+    tarifa: TarifaMes,
+    *,
+    km: np.ndarray,
+    peajes: np.ndarray,
+    horas: list[float],
+    carroceria: str | None,
+    modo: str = "CARGADO",
+    idx_vehiculos: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    Totales de viaje con shape (rutas, vehículos, horas).
+
+    `km` es (rutas, 5) y `peajes` (rutas, vehículos) alineado con
+    `idx_vehiculos` (por defecto todos los vehículos de la tarifa).
+    """
+    if idx_vehiculos is None:
+        idx_vehiculos = np.arange(len(tarifa.vehiculos))
+    return evaluar_totales_carrocerias(
+        tarifa,
+        km=km,
+        peajes=peajes,
+        horas=horas,
+        costo_fijo=tarifa.costo_fijo_para(carroceria)[idx_vehiculos][None, :],
+        modo=modo,
+        idx_vehiculos=idx_vehiculos,
+    )[0]
+
+
+def evaluar_totales_carrocerias(
+    tarifa: TarifaMes,
+    *,
+    km: np.ndarray,
+    peajes: np.ndarray,
+    horas: list[float],
+    costo_fijo: np.ndarray,
+    modo: str = "CARGADO",
+    idx_vehiculos: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    Totales de viaje con shape (carrocerías, rutas, vehículos, horas).
+
+    Distancias, peajes y horas se comparten entre carrocerías; solo cambia
+    `costo_fijo`, de shape (carrocerías, vehículos) alineado con `idx_vehiculos`.
+    """
+    modo = str(modo or "CARGADO").upper()
+    if idx_vehiculos is None:
+        idx_vehiculos = np.arange(len(tarifa.vehiculos))
+    resultado = evaluar_modelo(
+        km=km[None, :, None, None, :],
+        velocidad=tarifa.velocidad[modo][idx_vehiculos][None, None, :, None, :],
+        consumo=tarifa.consumo[modo][idx_vehiculos][None, None, :, None, :],
+        valor_acpm=tarifa.valor_acpm[idx_vehiculos][None, None, :, None],
+        costos_variables=tarifa.costos_variables[idx_vehiculos][None, None, :, None],
+        costo_fijo=np.asarray(costo_fijo, dtype=float)[:, None, :, None],
+        peaje=np.asarray(peajes, dtype=float)[None, :, :, None],
+        horas_logisticas=np.asarray(horas, dtype=float)[None, None, None, :],
+        modo=modo,
+    )
+    return resultado["total_viaje"]
@@ -0,0 +1,146 @@
+"""
+Matriz densa de peajes (ID_SICE × EJES_CONFIGURACION).
+
+Se construye vectorizada desde `peajes_vigentes`: los ID_SICE y las
+configuraciones de ejes se codifican como enteros y los valores quedan en un
+arreglo float64 con NaN donde no hay peaje. Si una clave aparece varias veces
+la política de duplicados decide el valor (`first` conserva el primero en el
+orden de la tabla, como el índice anterior; `sum` suma; `max` toma el mayor)
+y `conteo` guarda cuántas filas tenía cada clave.
+
+Acceso escalar con `valor` y por lotes con `gather`/`matriz`. Tras un
+refresh, `actualizar_ids` recalcula solo las filas de los ID_SICE que cambiaron.
+"""
+from __future__ import annotations
+
+import re
+from typing import Any, Iterable
+
+import numpy as np
+import pandas as pd
+
+POLITICAS = ("first", "sum", "max")
+_NO_DIGITOS = re.compile(r"\D")
+
+
+def limpiar_ids(valores: pd.Series) -> pd.Series:
+    # Igual que `_clean_id` del servicio, vectorizado: dígitos o el texto tal cual.
+    texto = valores.fillna("").astype(str).str.strip()
+    digitos = texto.str.replace(r"\D", "", regex=True)
+    return digitos.where(digitos != "", texto)
+
+
+def _limpiar_id(valor: Any) -> str:
+    # Versión escalar de `limpiar_ids` para el camino de cotización (sin pandas).
+    if valor is None or (isinstance(valor, float) and valor != valor):
+        return ""
+    texto = str(valor).strip()
+    return _NO_DIGITOS.sub("", texto) or texto
+
+
+class MatrizPeajes:
+    def __init__(self, df_peajes: pd.DataFrame | None, politica: str = "first"):
+        if politica not in POLITICAS:
+            raise ValueError(f"Política de duplicados '{politica}' no soportada. Usa: {', '.join(POLITICAS)}")
+        self.politica = politica
+        if df_peajes is None or df_peajes.empty or "ID_SICE" not in df_peajes.columns or "EJES_CONFIGURACION" not in df_peajes.columns:
+            df_peajes = pd.DataFrame(columns=["ID_SICE", "EJES_CONFIGURACION", "VALOR_PEAJE"])
+
+        ids, self.ids = pd.factorize(limpiar_ids(df_peajes["ID_SICE"]), sort=True)
+        ejes, self.ejes = pd.factorize(limpiar_ids(df_peajes["EJES_CONFIGURACION"]), sort=True)
+        valores = (
+            pd.to_numeric(df_peajes["VALOR_PEAJE"], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+            if "VALOR_PEAJE" in df_peajes.columns else np.zeros(len(df_peajes))
+        )
+        self._pos_id = {k: i for i, k in enumerate(self.ids)}
+        self._pos_ejes = {k: i for i, k in enumerate(self.ejes)}
+
+        forma = (len(self.ids), len(self.ejes))
+        plano = ids.astype(np.int64) * forma[1] + ejes
+        total = forma[0] * forma[1]
+        self.conteo = np.bincount(plano, minlength=total).reshape(forma)
+        if politica == "sum":
+            matriz = np.bincount(plano, weights=valores, minlength=total)
+        elif politica == "max":
+            matriz = np.full(total, -np.inf)
+            np.maximum.at(matriz, plano, valores)
+        else:
+            matriz = np.full(total, np.nan)
+            claves, primeras = np.unique(plano, return_index=True)
+            matriz[claves] = valores[primeras]
+        matriz = matriz.reshape(forma)
+        self.valores = np.where(self.conteo > 0, matriz, np.nan)
+
+    def __len__(self) -> int:
+        return int((self.conteo > 0).sum())
+
+    def duplicados(self) -> dict[str, Any]:
+        repetidas = self.conteo > 1
+        return {
+            "politica": self.politica,
+            "claves": len(self),
+            "claves_duplicadas": int(repetidas.sum()),
+            "filas_duplicadas": int((self.conteo[repetidas] - 1).sum()),
+        }
+
+    def actualizar_ids(self, df_peajes: pd.DataFrame | None, ids: Iterable[Any]) -> int:
+        """
+        Recalcula solo las filas de los ID_SICE indicados desde la tabla
+        vigente; los ID o configuraciones de ejes nuevos se agregan al final.
+        """
+        objetivo = {k for k in (_limpiar_id(i) for i in ids) if k}
+        if not objetivo:
+            return 0
+        if df_peajes is None or df_peajes.empty or "ID_SICE" not in df_peajes.columns:
+            df_peajes = pd.DataFrame(columns=["ID_SICE", "EJES_CONFIGURACION", "VALOR_PEAJE"])
+        parcial = MatrizPeajes(df_peajes[limpiar_ids(df_peajes["ID_SICE"]).isin(objetivo).to_numpy()], politica=self.politica)
+
+        nuevos_ids = [k for k in parcial.ids if k not in self._pos_id]
+        nuevos_ejes = [k for k in parcial.ejes if k not in self._pos_ejes]
+        if nuevos_ids or nuevos_ejes:
+            forma = (len(self.ids) + len(nuevos_ids), len(self.ejes) + len(nuevos_ejes))
+            valores = np.full(forma, np.nan)
+            conteo = np.zeros(forma, dtype=self.conteo.dtype)
+            valores[: self.valores.shape[0], : self.valores.shape[1]] = self.valores
+            conteo[: self.conteo.shape[0], : self.conteo.shape[1]] = self.conteo
+            self.ids = self.ids.append(pd.Index(nuevos_ids))
+            self.ejes = self.ejes.append(pd.Index(nuevos_ejes))
+            self._pos_id = {k: i for i, k in enumerate(self.ids)}
+            self._pos_ejes = {k: i for i, k in enumerate(self.ejes)}
+            self.valores, self.conteo = valores, conteo
+
+        filas = [self._pos_id[k] for k in objetivo if k in self._pos_id]
+        self.valores[filas, :] = np.nan
+        self.conteo[filas, :] = 0
+        if len(parcial.ids) and len(parcial.ejes):
+            destino = np.ix_([self._pos_id[k] for k in parcial.ids], [self._pos_ejes[k] for k in parcial.ejes])
+            self.valores[destino] = parcial.valores
+            self.conteo[destino] = parcial.conteo
+        return len(objetivo)
+
+    def codigos_id(self, ids: Iterable[Any]) -> np.ndarray:
+        return np.array([self._pos_id.get(k, -1) for k in limpiar_ids(pd.Series(list(ids), dtype=object))], dtype=int)
+
+    def codigos_ejes(self, ejes: Iterable[Any]) -> np.ndarray:
+        return np.array([self._pos_ejes.get(k, -1) for k in limpiar_ids(pd.Series(list(ejes), dtype=object))], dtype=int)
+
+    def valor(self, id_sice: Any, ejes: Any) -> float | None:
+        i = self._pos_id.get(_limpiar_id(id_sice))
+        j = self._pos_ejes.get(_limpiar_id(ejes))
+        if i is None or j is None or not self.conteo[i, j]:
+            return None
+        return float(self.valores[i, j])
+
+    def gather(self, codigos_id: np.ndarray, codigos_ejes: np.ndarray, faltante: float = np.nan) -> np.ndarray:
+        """Valores para arreglos de códigos con broadcasting; -1 o sin peaje -> `faltante`."""
+        codigos_id, codigos_ejes = np.broadcast_arrays(np.asarray(codigos_id), np.asarray(codigos_ejes))
+        validos = (codigos_id >= 0) & (codigos_ejes >= 0)
+        salida = np.full(codigos_id.shape, faltante, dtype=float)
+        if self.valores.size:
+            tomados = self.valores[np.where(validos, codigos_id, 0), np.where(validos, codigos_ejes, 0)]
+            salida = np.where(validos & ~np.isnan(tomados), tomados, salida)
+        return salida
+
+    def matriz(self, ids: Iterable[Any], ejes: Iterable[Any], faltante: float = np.nan) -> np.ndarray:
+        """(ids, ejes) con el peaje de cada ruta para cada configuración."""
+        return self.gather(self.codigos_id(ids)[:, None], self.codigos_ejes(ejes)[None, :], faltante=faltante)
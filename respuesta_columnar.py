@@ -0,0 +1,174 @@
+"""
+Respuesta columnar para clientes máquina.
+
+`/consulta`, `/consulta_resumen` y `/consulta_lote` negocian el formato con
+el header `Accept`. Además del JSON habitual entregan una tabla compacta
+—una fila por cotización/variante/vehículo de flota con códigos de ruta,
+vehículo y totales por hora— en Arrow IPC (`pyarrow`) o MessagePack (`msgpack`), sin repetir
+las llaves de texto ni el detalle de resolución en cada ítem.
+"""
+from __future__ import annotations
+
+from typing import Any
+
+from fastapi.responses import Response
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+MEDIA_JSON = "application/json"
+MEDIA_ARROW = "application/vnd.apache.arrow.stream"
+MEDIA_MSGPACK = "application/msgpack"
+
+_ALIAS_MEDIA = {
+    MEDIA_JSON: MEDIA_JSON,
+    MEDIA_ARROW: MEDIA_ARROW,
+    "application/vnd.apache.arrow.file": MEDIA_ARROW,
+    MEDIA_MSGPACK: MEDIA_MSGPACK,
+    "application/x-msgpack": MEDIA_MSGPACK,
+    "application/vnd.msgpack": MEDIA_MSGPACK,
+}
+
+COLUMNAS_BASE = [
+    "indice",
+    "status_code",
+    "error",
+    "route_code",
+    "codigo_dane_origen",
+    "codigo_dane_destino",
+    "configuracion",
+    "carroceria",
+    "modo_viaje",
+    "mes",
+    "id_sice",
+    "seleccion_variante",
+]
+
+
+def formatos_disponibles() -> list[str]:
+    disponibles = [MEDIA_JSON]
+    if pa is not None:
+        disponibles.append(MEDIA_ARROW)
+    if msgpack is not None:
+        disponibles.append(MEDIA_MSGPACK)
+    return disponibles
+
+
+def negociar_formato(accept: str | None) -> str:
+    """
+    Elige el media type según `Accept` (respetando `q`). Si no pide ningún
+    formato columnar disponible se responde JSON, como siempre.
+    """
+    disponibles = formatos_disponibles()
+    mejor, mejor_q = MEDIA_JSON, 0.0
+    for parte in (accept or "").split(","):
+        media, *parametros = [p.strip() for p in parte.split(";")]
+        media = _ALIAS_MEDIA.get(media.lower())
+        if media is None or media not in disponibles:
+            continue
+        q = 1.0
+        for parametro in parametros:
+            nombre, _, valor = parametro.partition("=")
+            if nombre.strip() == "q":
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        if q > mejor_q:
+            mejor, mejor_q = media, q
+    return mejor
+
+
+def _filas_respuesta(indice: int, respuesta: dict[str, Any]) -> list[dict[str, Any]]:
+    if "error" in respuesta:
+        error = respuesta["error"]
+        if isinstance(error, dict):
+            error = error.get("mensaje") or str(error)
+        return [{"indice": indice, "status_code": respuesta.get("status_code", 500), "error": error}]
+
+    resolved = respuesta.get("resolved_route") or {}
+    seleccion = respuesta.get("seleccion_variante")
+    base = {
+        "indice": indice,
+        "status_code": 200,
+        "error": None,
+        "route_code": resolved.get("route_code"),
+        "codigo_dane_origen": resolved.get("codigo_dane_origen"),
+        "codigo_dane_destino": resolved.get("codigo_dane_destino"),
+        "configuracion": respuesta.get("configuracion"),
+        "carroceria": respuesta.get("carroceria"),
+        "modo_viaje": respuesta.get("modo_viaje"),
+        "mes": respuesta.get("mes"),
+        "seleccion_variante": seleccion.get("politica") if seleccion else None,
+    }
+    if "variantes" in respuesta:
+        variantes = [(v, v.get("ID_SICE")) for v in respuesta["variantes"]]
+    else:
+        # Sin variantes o con una política de selección: la ruta elegida va en la raíz.
+        variantes = [(respuesta, (seleccion or respuesta).get("ID_SICE"))]
+    filas = []
+    for variante, id_sice in variantes:
+        fila = {**base, "id_sice": None if id_sice is None else str(id_sice)}
+        if "flota" in variante:
+            filas.extend(
+                {**fila, "configuracion": item.get("vehiculo"), **(item.get("totales") or {})}
+                for item in variante["flota"]
+            )
+        else:
+            filas.append({**fila, **(variante.get("totales") or {})})
+    return filas
+
+
+def tabla_columnar(respuestas: list[dict[str, Any]]) -> dict[str, list[Any]]:
+    """
+    Aplana respuestas de cotización a columnas: una fila por variante de
+    ruta (o una por respuesta si no hay variantes o la política eligió una),
+    una por vehículo en las consultas de flota y una por error de lote.
+    """
+    filas = [fila for i, respuesta in enumerate(respuestas) for fila in _filas_respuesta(i, respuesta)]
+    horas = sorted(
+        {k for fila in filas for k in fila if k.startswith("H") and k[1:].isdigit()},
+        key=lambda k: int(k[1:]),
+    )
+    columnas = COLUMNAS_BASE + horas
+    return {c: [fila.get(c) for fila in filas] for c in columnas}
+
+
+def _arrow_ipc(tabla: dict[str, list[Any]]) -> bytes:
+    tipos = {"indice": pa.int32(), "status_code": pa.int16(), "mes": pa.int32()}
+    campos = [
+        pa.field(c, tipos.get(c, pa.float64() if c not in COLUMNAS_BASE else pa.string()))
+        for c in tabla
+    ]
+    batch = pa.RecordBatch.from_pydict(tabla, schema=pa.schema(campos))
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def serializar_columnar(tabla: dict[str, list[Any]], media: str) -> bytes:
+    if media == MEDIA_ARROW:
+        return _arrow_ipc(tabla)
+    if media == MEDIA_MSGPACK:
+        return msgpack.packb(tabla, use_bin_type=True)
+    raise ValueError(f"Formato columnar no soportado: {media}")
+
+
+def respuesta_columnar(
+    respuestas: list[dict[str, Any]],
+    media: str,
+    headers: dict[str, str] | None = None,
+) -> Response:
+    return Response(
+        content=serializar_columnar(tabla_columnar(respuestas), media),
+        media_type=media,
+        headers=headers or {"Vary": "Accept"},
+    )
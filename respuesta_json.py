@@ -0,0 +1,70 @@
+"""
+Respuesta JSON de la API.
+
+Usa orjson (con soporte nativo de escalares y arreglos numpy) cuando está
+instalado; si no, cae a json de la librería estándar. En ambos casos los
+tipos que el serializador no conoce (numpy fuera de orjson, Timestamp, pd.NA,
+Decimal) se convierten al vuelo en `default`, sin recorrer la respuesta
+completa antes.
+"""
+from __future__ import annotations
+
+import json
+import math
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_OPCIONES_ORJSON = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS) if orjson is not None else 0
+
+
+def _nativo(valor: Any) -> Any:
+    if valor is pd.NA or valor is pd.NaT:
+        return None
+    if isinstance(valor, np.datetime64):
+        valor = pd.Timestamp(valor)
+        return None if valor is pd.NaT else valor.isoformat()
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return _sin_nan(float(valor))
+    if hasattr(valor, "tolist"):
+        return _sin_nan(valor.tolist())
+    if hasattr(valor, "item"):
+        return _sin_nan(valor.item())
+    raise TypeError(f"Tipo no serializable a JSON: {type(valor).__name__}")
+
+
+def _sin_nan(valor: Any) -> Any:
+    # json estándar no acepta NaN con allow_nan=False; orjson los emite como null.
+    if isinstance(valor, float) and not math.isfinite(valor):
+        return None
+    if isinstance(valor, dict):
+        return {k: _sin_nan(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_sin_nan(v) for v in valor]
+    return valor
+
+
+def dumps_json(contenido: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(contenido, default=_nativo, option=_OPCIONES_ORJSON)
+    try:
+        texto = json.dumps(contenido, default=_nativo, ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+    except ValueError:
+        texto = json.dumps(_sin_nan(contenido), default=_nativo, ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+    return texto.encode("utf-8")
+
+
+class RespuestaJSON(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps_json(content)
@@ -0,0 +1,147 @@
+"""
+Resultados de meses cerrados.
+
+Los MES anteriores al vigente en `parametros_vigentes`/`costos_fijos_vigentes`
+no cambian, así que sus totales se guardan en un SQLite local
+(`SICETAC_CERRADOS_PATH`) que sobrevive a `/refresh` y a reinicios del
+proceso. La clave es (MES, carril, vehículo, carrocería, modo, hora) más una
+huella de las entradas del carril (distancias y peaje): las tablas de rutas y
+peajes no están versionadas por mes, y si cambian la huella cambia y la
+entrada anterior simplemente deja de usarse. Si el refresh incremental
+detecta cambios en la tarifa de un mes cerrado, ese mes se purga; un
+refresh completo no compara tablas y purga todo el almacén.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any
+
+logger = logging.getLogger("resultados_cerrados")
+
+CERRADOS_PATH = os.getenv("SICETAC_CERRADOS_PATH", os.path.join("data", "cerrados.sqlite"))
+CERRADOS_VERSION = 1
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS resultados (
+    mes INTEGER NOT NULL,
+    carril TEXT NOT NULL,
+    vehiculo TEXT NOT NULL,
+    carroceria TEXT NOT NULL,
+    modo TEXT NOT NULL,
+    hora REAL NOT NULL,
+    huella TEXT NOT NULL,
+    total REAL NOT NULL,
+    PRIMARY KEY (mes, carril, vehiculo, carroceria, modo, hora, huella)
+)
+"""
+
+
+def huella_entradas(distancias: dict[str, Any], peaje: float) -> str:
+    h = hashlib.blake2b(digest_size=8)
+    h.update(str(CERRADOS_VERSION).encode())
+    for clave in sorted(distancias):
+        h.update(f"{clave}={float(distancias[clave] or 0):.4f};".encode())
+    h.update(f"peaje={float(peaje or 0):.2f}".encode())
+    return h.hexdigest()
+
+
+class ResultadosCerrados:
+    def __init__(self, ruta: str = CERRADOS_PATH):
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self.ruta = ruta
+        self._conn = sqlite3.connect(ruta, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_ESQUEMA)
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def obtener(
+        self,
+        *,
+        mes: int,
+        carril: str,
+        vehiculo: str,
+        carroceria: str,
+        modo: str,
+        huella: str,
+        horas: list[float],
+    ) -> dict[str, float] | None:
+        with self._lock:
+            filas = self._conn.execute(
+                "SELECT hora, total FROM resultados"
+                " WHERE mes = ? AND carril = ? AND vehiculo = ? AND carroceria = ? AND modo = ? AND huella = ?",
+                (int(mes), carril, vehiculo, carroceria, modo, huella),
+            ).fetchall()
+        por_hora = {float(h): float(t) for h, t in filas}
+        if any(float(h) not in por_hora for h in horas):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {f"H{h:g}": por_hora[float(h)] for h in horas}
+
+    def guardar(
+        self,
+        *,
+        mes: int,
+        carril: str,
+        vehiculo: str,
+        carroceria: str,
+        modo: str,
+        huella: str,
+        totales: dict[float, float | None],
+    ) -> None:
+        filas = [
+            (int(mes), carril, vehiculo, carroceria, modo, float(h), huella, float(t))
+            for h, t in totales.items()
+            if t is not None
+        ]
+        if not filas:
+            return
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO resultados VALUES (?, ?, ?, ?, ?, ?, ?, ?)", filas)
+            self._conn.commit()
+
+    def purgar_meses(self, meses: set[int]) -> int:
+        """Descarta meses cuya tarifa sí cambió (correcciones de la fuente)."""
+        if not meses:
+            return 0
+        with self._lock:
+            cursor = self._conn.executemany("DELETE FROM resultados WHERE mes = ?", [(int(m),) for m in meses])
+            self._conn.commit()
+        return cursor.rowcount
+
+    def purgar_todo(self) -> int:
+        """Descarta todos los meses (refresh completo: no se sabe qué cambió)."""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM resultados")
+            self._conn.commit()
+        return cursor.rowcount
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            filas, meses = self._conn.execute("SELECT COUNT(*), COUNT(DISTINCT mes) FROM resultados").fetchone()
+        return {"ruta": self.ruta, "filas": filas, "meses": meses, "hits": self.hits, "misses": self.misses}
+
+
+_STORE: ResultadosCerrados | None = None
+_STORE_ERROR = False
+
+
+def get_store() -> ResultadosCerrados | None:
+    """Store compartido del proceso; None si el archivo no se puede abrir."""
+    global _STORE, _STORE_ERROR
+    if _STORE is None and not _STORE_ERROR:
+        try:
+            _STORE = ResultadosCerrados()
+        except Exception as e:
+            _STORE_ERROR = True
+            logger.warning(f"⚠️ No se pudo abrir resultados cerrados {CERRADOS_PATH}: {e}")
+    return _STORE
@@ -0,0 +1,406 @@
+"""
+Cubo OD precalculado para el último MES.
+
+Guarda los totales de viaje de todas las rutas de `rutas` × vehículos de
+`configuracion_vehicular` × horas logísticas estándar × carrocerías × modo
+(CARGADO/VACIO) en arreglos float64 con ejes codificados como enteros, para
+cargarlos con `np.load(mmap_mode="r")` y responder un carril conocido con
+una lectura de arreglo.
+
+Estructura en disco (`SICETAC_CUBE_DIR/<MES>/`):
+
+- `totales.npy`: float64 (modo, carroceria, ruta, vehiculo, hora); el modelo
+  ya redondea a centavos, así que la lectura es el mismo valor que calcula
+- `rutas.npy`: int64 (ruta, 3) con CODIGO_DANE_ORIGEN, CODIGO_DANE_DESTINO, ID_SICE
+- `manifest.json`: ejes de vehículos/carrocerías/horas/modos y huellas por tajada
+
+Las huellas por vehículo, por (vehículo, carrocería) y por ruta permiten
+recalcular solo las tajadas afectadas cuando cambian `parametros_vigentes`,
+`costos_fijos_vigentes` o `peajes_vigentes`.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import time
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+
+from modelo_vectorizado import (
+    MODOS,
+    TarifaMes,
+    compilar_tarifa_mes,
+    evaluar_modelo,
+    km_por_terreno,
+    normalizar_carroceria,
+)
+from peajes_matriz import MatrizPeajes
+
+logger = logging.getLogger("sicetac_cubo")
+
+CUBO_DIR = os.getenv("SICETAC_CUBE_DIR", os.path.join("data", "cubo"))
+CUBO_HORAS = [0, 2, 4, 8]
+# float64: con float32 los totales en pesos pierden los centavos.
+CUBO_DTYPE = np.float64
+CUBO_VERSION = 2
+_BLOQUE_RUTAS = 2048
+
+
+@dataclass
+class CuboOD:
+    mes: int
+    vehiculos: list[str]
+    carrocerias: list[str]
+    horas: list[int]
+    modos: list[str]
+    totales: np.ndarray
+    rutas: np.ndarray
+    manifest: dict[str, Any]
+
+    def __post_init__(self):
+        self._pos_ruta = {tuple(int(x) for x in fila): i for i, fila in enumerate(self.rutas)}
+        self._pos_vehiculo = {v: i for i, v in enumerate(self.vehiculos)}
+        self._pos_carroceria = {c: i for i, c in enumerate(self.carrocerias)}
+        self._pos_hora = {float(h): i for i, h in enumerate(self.horas)}
+        self._pos_modo = {m: i for i, m in enumerate(self.modos)}
+
+    @property
+    def huella(self) -> str:
+        return self.manifest.get("huella", "")
+
+    def posicion_ruta(self, cod_origen: str, cod_destino: str, id_sice: Any) -> int | None:
+        clave = (_codigo_entero(cod_origen), _codigo_entero(cod_destino), _codigo_entero(id_sice))
+        return self._pos_ruta.get(clave)
+
+    def totales_para(
+        self,
+        *,
+        cod_origen: str,
+        cod_destino: str,
+        id_sice: Any,
+        vehiculo: str,
+        carroceria: str | None,
+        modo: str,
+        horas: list[float],
+    ) -> dict[str, float] | None:
+        r = self.posicion_ruta(cod_origen, cod_destino, id_sice)
+        v = self._pos_vehiculo.get(vehiculo)
+        c = self._pos_carroceria.get(normalizar_carroceria(carroceria))
+        m = self._pos_modo.get(str(modo or "").upper())
+        hs = [self._pos_hora.get(float(h)) for h in horas]
+        if r is None or v is None or c is None or m is None or any(h is None for h in hs):
+            return None
+        valores = self.totales[m, c, r, v, hs]
+        if np.isnan(valores).any():
+            return None
+        return {f"H{h:g}": round(float(x), 2) for h, x in zip(horas, valores)}
+
+
+def _codigo_entero(value: Any) -> int:
+    digits = re.sub(r"\D", "", str(value or "").strip().removesuffix(".0"))
+    return int(digits) if digits else -1
+
+
+def _hash_bytes(*arrays: np.ndarray) -> str:
+    h = hashlib.blake2b(digest_size=8)
+    for arr in arrays:
+        h.update(np.ascontiguousarray(arr, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+def rutas_codificadas(df_rutas: pd.DataFrame) -> np.ndarray:
+    if df_rutas is None or df_rutas.empty:
+        return np.empty((0, 3), dtype=np.int64)
+    columnas = ["CODIGO_DANE_ORIGEN", "CODIGO_DANE_DESTINO", "ID_SICE"]
+    return np.stack(
+        [df_rutas[c].map(_codigo_entero).to_numpy(dtype=np.int64) for c in columnas],
+        axis=-1,
+    )
+
+
+def matriz_peajes_rutas(
+    df_rutas: pd.DataFrame,
+    ejes_vehiculos: list[str],
+    peajes: MatrizPeajes,
+) -> np.ndarray:
+    """(ruta, vehículo) con el peaje de cada ruta para los ejes de cada vehículo (0 si no hay)."""
+    ids = df_rutas["ID_SICE"].tolist() if "ID_SICE" in df_rutas.columns else [None] * len(df_rutas)
+    return peajes.matriz(ids, ejes_vehiculos, faltante=0.0)
+
+
+def calcular_huellas(tarifa: TarifaMes, km: np.ndarray, peajes: np.ndarray) -> dict[str, Any]:
+    parametros = {
+        v: _hash_bytes(
+            *(tarifa.velocidad[m][i] for m in MODOS),
+            *(tarifa.consumo[m][i] for m in MODOS),
+            tarifa.costos_variables[i:i + 1],
+            tarifa.valor_acpm[i:i + 1],
+        )
+        for i, v in enumerate(tarifa.vehiculos)
+    }
+    costos_fijos = {
+        f"{v}|{c}": _hash_bytes(tarifa.costo_fijo[ci, vi:vi + 1])
+        for ci, c in enumerate(tarifa.carrocerias)
+        for vi, v in enumerate(tarifa.vehiculos)
+    }
+    rutas = [_hash_bytes(km[i], peajes[i]) for i in range(len(km))]
+    resumen = hashlib.blake2b(digest_size=8)
+    resumen.update(json.dumps([parametros, costos_fijos, rutas], sort_keys=True).encode())
+    return {
+        "parametros": parametros,
+        "costos_fijos": costos_fijos,
+        "rutas": rutas,
+        "huella": resumen.hexdigest(),
+    }
+
+
+def _directorio_mes(mes: int, directorio: str | None = None) -> str:
+    return os.path.join(directorio or CUBO_DIR, str(int(mes)))
+
+
+def cargar_cubo(mes: int, directorio: str | None = None) -> CuboOD | None:
+    base = _directorio_mes(mes, directorio)
+    try:
+        with open(os.path.join(base, "manifest.json"), encoding="utf-8") as fh:
+            manifest = json.load(fh)
+        if manifest.get("version") != CUBO_VERSION:
+            return None
+        totales = np.load(os.path.join(base, "totales.npy"), mmap_mode="r")
+        rutas = np.load(os.path.join(base, "rutas.npy"))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo cargar cubo OD {base}: {e}")
+        return None
+    return CuboOD(
+        mes=int(manifest["mes"]),
+        vehiculos=manifest["vehiculos"],
+        carrocerias=manifest["carrocerias"],
+        horas=manifest["horas"],
+        modos=manifest["modos"],
+        totales=totales,
+        rutas=rutas,
+        manifest=manifest,
+    )
+
+
+def _guardar_atomico(ruta: str, escribir: Callable[[Any], None], modo: str = "wb") -> None:
+    tmp = f"{ruta}.tmp"
+    with open(tmp, modo) as fh:
+        escribir(fh)
+    os.replace(tmp, ruta)
+
+
+def _evaluar_tajada(
+    totales: np.ndarray,
+    *,
+    tarifa: TarifaMes,
+    km: np.ndarray,
+    peajes: np.ndarray,
+    carrocerias: list[str],
+    horas: list[int],
+    idx_rutas: np.ndarray,
+    idx_vehiculos: np.ndarray,
+    idx_carrocerias: np.ndarray,
+) -> None:
+    if not len(idx_rutas) or not len(idx_vehiculos) or not len(idx_carrocerias):
+        return
+    costo_fijo = np.stack([tarifa.costo_fijo_para(carrocerias[c]) for c in idx_carrocerias])[:, idx_vehiculos]
+    horas_arr = np.asarray(horas, dtype=float)[None, None, None, :]
+    for inicio in range(0, len(idx_rutas), _BLOQUE_RUTAS):
+        bloque = idx_rutas[inicio:inicio + _BLOQUE_RUTAS]
+        for m, modo in enumerate(MODOS):
+            resultado = evaluar_modelo(
+                km=km[bloque][None, :, None, None, :],
+                velocidad=tarifa.velocidad[modo][idx_vehiculos][None, None, :, None, :],
+                consumo=tarifa.consumo[modo][idx_vehiculos][None, None, :, None, :],
+                valor_acpm=tarifa.valor_acpm[idx_vehiculos][None, None, :, None],
+                costos_variables=tarifa.costos_variables[idx_vehiculos][None, None, :, None],
+                costo_fijo=costo_fijo[:, None, :, None],
+                peaje=peajes[np.ix_(bloque, idx_vehiculos)][None, :, :, None],
+                horas_logisticas=horas_arr,
+                modo=modo,
+            )
+            totales[m][np.ix_(idx_carrocerias, bloque, idx_vehiculos)] = resultado["total_viaje"].astype(CUBO_DTYPE)
+
+
+def actualizar_cubo(
+    *,
+    mes: int,
+    df_vehiculos: pd.DataFrame,
+    df_parametros: pd.DataFrame,
+    df_costos_fijos: pd.DataFrame,
+    df_rutas: pd.DataFrame,
+    peajes_index: MatrizPeajes,
+    ejes_para: Callable[[str], str],
+    carrocerias: list[str] | None = None,
+    horas: list[int] | None = None,
+    directorio: str | None = None,
+) -> dict[str, Any]:
+    """
+    Construye o actualiza incrementalmente el cubo del MES indicado.
+
+    Si el cubo existente tiene los mismos ejes, solo se recalculan las tajadas
+    cuyas huellas cambiaron; en otro caso se reconstruye completo.
+    """
+    inicio = time.time()
+    horas = list(horas or CUBO_HORAS)
+    vehiculos = df_vehiculos["TIPO_VEHICULO"].astype(str).unique().tolist()
+    tarifa = compilar_tarifa_mes(df_parametros, df_costos_fijos, int(mes), vehiculos=vehiculos)
+    if carrocerias:
+        carrocerias = [normalizar_carroceria(c) for c in carrocerias]
+    else:
+        carrocerias = list(tarifa.carrocerias)
+
+    km = km_por_terreno(df_rutas)
+    peajes = matriz_peajes_rutas(df_rutas, [ejes_para(v) for v in vehiculos], peajes_index)
+    rutas = rutas_codificadas(df_rutas)
+    huellas = calcular_huellas(tarifa, km, peajes)
+
+    previo = cargar_cubo(mes, directorio)
+    mismos_ejes = (
+        previo is not None
+        and previo.vehiculos == vehiculos
+        and previo.carrocerias == carrocerias
+        and previo.horas == horas
+        and previo.modos == list(MODOS)
+        and np.array_equal(previo.rutas, rutas)
+    )
+
+    n_r, n_v, n_c = len(rutas), len(vehiculos), len(carrocerias)
+    if mismos_ejes:
+        if previo.huella == huellas["huella"]:
+            return {
+                "mes": int(mes),
+                "modo": "sin_cambios",
+                "rutas": n_r,
+                "vehiculos": n_v,
+                "carrocerias": n_c,
+                "segundos": round(time.time() - inicio, 3),
+            }
+        totales = np.array(previo.totales)
+        anteriores = previo.manifest.get("huellas", {})
+        sucio_v = np.array([anteriores.get("parametros", {}).get(v) != huellas["parametros"][v] for v in vehiculos], dtype=bool)
+        sucio_cv = np.array(
+            [[anteriores.get("costos_fijos", {}).get(f"{v}|{c}") != huellas["costos_fijos"].get(f"{v}|{c}") for v in vehiculos] for c in carrocerias],
+            dtype=bool,
+        ).reshape(n_c, n_v)
+        rutas_previas = anteriores.get("rutas", [])
+        sucio_r = np.array(
+            [i >= len(rutas_previas) or rutas_previas[i] != h for i, h in enumerate(huellas["rutas"])],
+            dtype=bool,
+        )
+        modo_build = "incremental"
+    else:
+        totales = np.full((len(MODOS), n_c, n_r, n_v, len(horas)), np.nan, dtype=CUBO_DTYPE)
+        sucio_v = np.ones(n_v, dtype=bool)
+        sucio_cv = np.zeros((n_c, n_v), dtype=bool)
+        sucio_r = np.zeros(n_r, dtype=bool)
+        modo_build = "completo"
+
+    todas_r = np.arange(n_r)
+    todas_v = np.arange(n_v)
+    todas_c = np.arange(n_c)
+    comunes = dict(tarifa=tarifa, km=km, peajes=peajes, carrocerias=carrocerias, horas=horas)
+
+    # 1) Vehículos con parámetros nuevos: todas las rutas y carrocerías.
+    _evaluar_tajada(totales, idx_rutas=todas_r, idx_vehiculos=np.flatnonzero(sucio_v), idx_carrocerias=todas_c, **comunes)
+    # 2) Costos fijos nuevos por (carrocería, vehículo) no cubiertos arriba.
+    sucio_cv &= ~sucio_v[None, :]
+    for c in np.flatnonzero(sucio_cv.any(axis=1)):
+        _evaluar_tajada(totales, idx_rutas=todas_r, idx_vehiculos=np.flatnonzero(sucio_cv[c]), idx_carrocerias=np.array([c]), **comunes)
+    # 3) Rutas con km o peajes nuevos, para los vehículos no recalculados.
+    _evaluar_tajada(totales, idx_rutas=np.flatnonzero(sucio_r), idx_vehiculos=np.flatnonzero(~sucio_v), idx_carrocerias=todas_c, **comunes)
+
+    base = _directorio_mes(mes, directorio)
+    os.makedirs(base, exist_ok=True)
+    _guardar_atomico(os.path.join(base, "totales.npy"), lambda fh: np.save(fh, totales))
+    _guardar_atomico(os.path.join(base, "rutas.npy"), lambda fh: np.save(fh, rutas))
+    manifest = {
+        "version": CUBO_VERSION,
+        "mes": int(mes),
+        "vehiculos": vehiculos,
+        "carrocerias": carrocerias,
+        "horas": horas,
+        "modos": list(MODOS),
+        "huella": huellas["huella"],
+        "huellas": {k: huellas[k] for k in ("parametros", "costos_fijos", "rutas")},
+        "generado_en": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    # El manifest se escribe al final: si el proceso muere antes, el cubo
+    # previo queda con huellas viejas y sus tajadas se recalculan.
+    _guardar_atomico(os.path.join(base, "manifest.json"), lambda fh: json.dump(manifest, fh), modo="w")
+
+    return {
+        "mes": int(mes),
+        "modo": modo_build,
+        "rutas": n_r,
+        "vehiculos": n_v,
+        "carrocerias": n_c,
+        "vehiculos_recalculados": int(sucio_v.sum()) if modo_build == "incremental" else n_v,
+        "rutas_recalculadas": int(sucio_r.sum()) if modo_build == "incremental" else n_r,
+        "tajadas_costo_fijo_recalculadas": int(sucio_cv.sum()),
+        "bytes": int(totales.nbytes),
+        "segundos": round(time.time() - inicio, 3),
+    }
+
+
+def verificar_cubo(
+    cubo: CuboOD,
+    calcular: Callable[..., float | None],
+    *,
+    muestras: int = 25,
+    semilla: int = 0,
+    tolerancia_relativa: float = 1e-5,
+) -> dict[str, Any]:
+    """
+    Compara celdas aleatorias del cubo contra el modelo de referencia.
+
+    `calcular(ruta_pos, vehiculo, carroceria, modo, horas)` debe devolver el
+    total del modelo escalar (calcular_modelo_sicetac_extendido / _vacio).
+    """
+    rng = random.Random(semilla)
+    n_m, n_c, n_r, n_v, n_h = cubo.totales.shape
+    revisadas = 0
+    max_rel = 0.0
+    fallas: list[dict[str, Any]] = []
+    intentos = 0
+    while revisadas < muestras and intentos < muestras * 10 and n_r and n_v and n_c:
+        intentos += 1
+        m, c, r, v, h = (rng.randrange(n) for n in (n_m, n_c, n_r, n_v, n_h))
+        valor_cubo = float(cubo.totales[m, c, r, v, h])
+        if np.isnan(valor_cubo):
+            continue
+        try:
+            valor_modelo = calcular(r, cubo.vehiculos[v], cubo.carrocerias[c], cubo.modos[m], cubo.horas[h])
+        except Exception as e:
+            fallas.append({"ruta": int(r), "vehiculo": cubo.vehiculos[v], "error": str(e)})
+            continue
+        if valor_modelo is None:
+            continue
+        revisadas += 1
+        rel = abs(valor_cubo - float(valor_modelo)) / max(abs(float(valor_modelo)), 1.0)
+        max_rel = max(max_rel, rel)
+        if rel > tolerancia_relativa:
+            fallas.append({
+                "ruta": int(r),
+                "vehiculo": cubo.vehiculos[v],
+                "carroceria": cubo.carrocerias[c],
+                "modo": cubo.modos[m],
+                "horas": cubo.horas[h],
+                "cubo": valor_cubo,
+                "modelo": float(valor_modelo),
+            })
+    return {
+        "ok": not fallas,
+        "muestras": revisadas,
+        "max_error_relativo": max_rel,
+        "fallas": fallas[:10],
+    }
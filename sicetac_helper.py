@@ -1,19 +1,33 @@
 import pandas as pd
+from bisect import bisect_left
 from difflib import get_close_matches
 import logging
 import re
 import unicodedata
 
+import numpy as np
+
+from depto_helper import DeptoHelper
+
 logging.basicConfig(level=logging.INFO)
 
 class SICETACHelper:
-    def __init__(self, municipios_source):
+    def __init__(self, municipios_source, depto_helper=None):
         if isinstance(municipios_source, pd.DataFrame):
             self.df_municipios = municipios_source.copy()
         else:
             self.df_municipios = pd.read_excel(municipios_source)
         self.columnas_municipios = ['nombre_oficial', 'variacion_1', 'variacion_2', 'variacion_3']
         self.codigo_municipio_col = 'codigo_dane'
+        self._depto_helper = depto_helper
+        self._indice_prefijos = None
+        self._indice_nombres = None
+
+    @property
+    def depto_helper(self):
+        if self._depto_helper is None:
+            self._depto_helper = DeptoHelper.desde_municipios(self.df_municipios)
+        return self._depto_helper
 
     def _clean_code(self, value):
         raw = str(value or "").strip()
@@ -46,6 +60,216 @@ class SICETACHelper:
         score -= len(nombre_oficial) / 100.0
         return score
 
+    def _construir_indice_prefijos(self):
+        # Arreglo ordenado de nombres normalizados (oficial y variaciones);
+        # una búsqueda por prefijo es un rango contiguo vía bisect.
+        df = self.df_municipios
+        columnas = [c for c in self.columnas_municipios if c in df.columns]
+        filas = {
+            "codigo": [self._clean_code(v) for v in df[self.codigo_municipio_col]] if self.codigo_municipio_col in df.columns else [None] * len(df),
+            "nombre": [None if pd.isna(v) else v for v in df["nombre_oficial"]] if "nombre_oficial" in df.columns else [None] * len(df),
+            "departamento": [None if pd.isna(v) else v for v in df["departamento"]] if "departamento" in df.columns else [None] * len(df),
+        }
+        nombres_oficiales = [self._normalize_name(v) for v in filas["nombre"]]
+
+        entradas = []
+        for col in columnas:
+            for fila, valor in enumerate(df[col].tolist()):
+                if valor is None or (isinstance(valor, float) and pd.isna(valor)):
+                    continue
+                clave = self._normalize_name(valor)
+                if not clave:
+                    continue
+                # Misma regla que `_candidate_priority`, sin el bono de
+                # coincidencia exacta, que depende del texto consultado.
+                oficial = nombres_oficiales[fila]
+                base = (100 if col == "nombre_oficial" else 0) + (10 if " " not in oficial else 0) - len(oficial) / 100.0
+                entradas.append((clave, fila, col, base))
+        entradas.sort(key=lambda e: e[0])
+
+        exactos = {}
+        for fila, oficial in enumerate(nombres_oficiales):
+            exactos.setdefault(oficial, []).append(fila)
+
+        self._indice_prefijos = {
+            "claves": [e[0] for e in entradas],
+            "filas": np.array([e[1] for e in entradas], dtype=np.int32),
+            "columnas": [e[2] for e in entradas],
+            "base": np.array([e[3] for e in entradas], dtype=np.float64),
+            "exactos": {k: np.array(v, dtype=np.int32) for k, v in exactos.items()},
+            **filas,
+        }
+        return self._indice_prefijos
+
+    def sugerir_municipios(self, texto, limite=10):
+        """
+        Municipios cuyo nombre oficial o variación empieza por `texto`
+        (normalizado), ordenados con las reglas de `_candidate_priority`.
+        Un resultado por código DANE, con la mejor coincidencia.
+        """
+        indice = self._indice_prefijos or self._construir_indice_prefijos()
+        prefijo = self._normalize_name(texto)
+        if not prefijo or limite <= 0:
+            return []
+        claves = indice["claves"]
+        inicio = bisect_left(claves, prefijo)
+        fin = bisect_left(claves, prefijo + "\uffff", lo=inicio)
+        if inicio == fin:
+            return []
+
+        filas = indice["filas"][inicio:fin]
+        puntajes = indice["base"][inicio:fin].copy()
+        exactos = indice["exactos"].get(prefijo)
+        if exactos is not None:
+            puntajes[np.isin(filas, exactos)] += 50
+        # Orden estable: a igual puntaje, orden alfabético de la coincidencia.
+        orden = np.argsort(-puntajes, kind="stable")
+
+        resultados = []
+        vistos = set()
+        for pos in orden.tolist():
+            fila = int(filas[pos])
+            codigo = indice["codigo"][fila]
+            if codigo in vistos:
+                continue
+            vistos.add(codigo)
+            resultados.append({
+                "codigo_dane": codigo,
+                "nombre_oficial": indice["nombre"][fila],
+                "departamento": indice["departamento"][fila],
+                "coincidencia": claves[inicio + pos],
+                "columna": indice["columnas"][inicio + pos],
+            })
+            if len(resultados) >= limite:
+                break
+        return resultados
+
+    def _construir_indice_nombres(self):
+        # Índices hash por nombre normalizado y por (nombre, ID de
+        # departamento); cada entrada conserva el orden columna -> fila de
+        # `_buscar_codigo`, así el desempate es el mismo.
+        df = self.df_municipios
+        columnas = [c for c in self.columnas_municipios if c in df.columns]
+        codigos = [self._clean_code(v) for v in df[self.codigo_municipio_col]] if self.codigo_municipio_col in df.columns else [None] * len(df)
+        nombres = [None if pd.isna(v) else v for v in df["nombre_oficial"]] if "nombre_oficial" in df.columns else [None] * len(df)
+        departamentos = [None if pd.isna(v) else v for v in df["departamento"]] if "departamento" in df.columns else [None] * len(df)
+        ids_depto = [self.depto_helper.buscar_id(d) if d is not None else None for d in departamentos]
+        oficiales = [self._normalize_name(v) for v in nombres]
+
+        por_nombre = {}
+        por_nombre_depto = {}
+        opciones = {}
+        for col in columnas:
+            opciones_col = []
+            for fila, valor in enumerate(df[col].tolist()):
+                if valor is None or (isinstance(valor, float) and pd.isna(valor)):
+                    continue
+                clave = self._normalize_name(valor)
+                if not clave:
+                    continue
+                por_nombre.setdefault(clave, []).append((fila, col))
+                por_nombre_depto.setdefault((clave, ids_depto[fila]), []).append((fila, col))
+                opciones_col.append(clave)
+            opciones[col] = list(dict.fromkeys(opciones_col))
+
+        por_codigo = {}
+        for fila, codigo in enumerate(codigos):
+            if codigo:
+                por_codigo.setdefault(codigo, fila)
+
+        self._indice_nombres = {
+            "codigos": codigos,
+            "nombres": nombres,
+            "departamentos": departamentos,
+            "ids_depto": ids_depto,
+            "oficiales": oficiales,
+            "por_nombre": por_nombre,
+            "por_nombre_depto": por_nombre_depto,
+            "por_codigo": por_codigo,
+            "opciones": opciones,
+        }
+        return self._indice_nombres
+
+    def _puntaje(self, indice, fila, col, original_norm):
+        # Igual que `_candidate_priority`, sobre los valores ya normalizados.
+        oficial = indice["oficiales"][fila]
+        score = 0
+        if col == "nombre_oficial":
+            score += 100
+        if oficial == original_norm:
+            score += 50
+        if " " not in oficial:
+            score += 10
+        score -= len(oficial) / 100.0
+        return score
+
+    def resolver_municipio_departamento(self, nombre_input, departamento_input=None):
+        """
+        Resuelve un municipio por nombre con pista opcional de departamento
+        (`departamento_input` o sufijo "San Pedro, Valle").
+
+        Devuelve `{"estado", "resultado", "candidatos"}` con estado
+        `resuelto`, `ambiguo` (varios municipios empatan en la mejor
+        prioridad; `candidatos` trae la lista ordenada) o `no_encontrado`.
+        """
+        indice = self._indice_nombres or self._construir_indice_nombres()
+        texto = str(nombre_input or "").strip()
+        nombre_norm = self._normalize_name(texto)
+        if not departamento_input and nombre_norm not in indice["por_nombre"] and "," in texto:
+            texto, departamento_input = [p.strip() for p in texto.rsplit(",", 1)]
+            nombre_norm = self._normalize_name(texto)
+
+        id_depto = self.depto_helper.buscar_id(departamento_input) if departamento_input else None
+        if id_depto is not None:
+            entradas = indice["por_nombre_depto"].get((nombre_norm, id_depto), [])
+        else:
+            entradas = indice["por_nombre"].get(nombre_norm, [])
+
+        aproximada = None
+        if not entradas:
+            for col in self.columnas_municipios:
+                cercanos = get_close_matches(nombre_norm, indice["opciones"].get(col, []), n=1, cutoff=0.8)
+                if not cercanos:
+                    continue
+                entradas = [
+                    (fila, c) for fila, c in indice["por_nombre"][cercanos[0]]
+                    if id_depto is None or indice["ids_depto"][fila] == id_depto
+                ]
+                if entradas:
+                    aproximada = cercanos[0]
+                    break
+
+        mejores = {}
+        for fila, col in entradas:
+            puntaje = self._puntaje(indice, fila, col, nombre_norm)
+            codigo = indice["codigos"][fila]
+            if codigo not in mejores or puntaje > mejores[codigo][0]:
+                mejores[codigo] = (puntaje, fila)
+        ranking = sorted(mejores.items(), key=lambda item: item[1][0], reverse=True)
+        candidatos = [
+            {
+                self.codigo_municipio_col: codigo,
+                "nombre_oficial": indice["nombres"][fila],
+                "departamento": indice["departamentos"][fila],
+                "puntaje": round(puntaje, 2),
+            }
+            for codigo, (puntaje, fila) in ranking
+        ]
+        if not candidatos:
+            return {"estado": "no_encontrado", "resultado": None, "candidatos": []}
+
+        # Empate: mismos criterios de prioridad salvo el largo del nombre.
+        empatados = [c for c in candidatos if candidatos[0]["puntaje"] - c["puntaje"] < 1]
+        if len(empatados) > 1:
+            return {"estado": "ambiguo", "resultado": None, "candidatos": candidatos}
+
+        resultado = {k: v for k, v in candidatos[0].items() if k != "puntaje"}
+        if aproximada:
+            resultado["coincidencia_aproximada"] = aproximada
+        if id_depto is not None:
+            resultado["departamento_input"] = str(departamento_input).strip()
+        return {"estado": "resuelto", "resultado": resultado, "candidatos": candidatos}
+
     def buscar_municipio(self, nombre_input):
         resultado = self._buscar_codigo(
             self.df_municipios,
@@ -69,22 +293,25 @@ class SICETACHelper:
             logging.warning("✘ Columna codigo_dane no disponible en municipios")
             return None
 
-        serie_codigos = self.df_municipios[self.codigo_municipio_col].map(self._clean_code)
-        match = self.df_municipios[serie_codigos == codigo]
-        if match.empty:
+        indice = self._indice_nombres or self._construir_indice_nombres()
+        fila = indice["por_codigo"].get(codigo)
+        if fila is None:
             logging.warning(f"✘ Municipio NO encontrado por código: {codigo_input}")
             return None
 
-        row = match.iloc[0]
-        result = {self.codigo_municipio_col: self._clean_code(row[self.codigo_municipio_col])}
-        for c in ['departamento', 'nombre_oficial']:
-            if c in row:
-                result[c] = row[c]
+        result = {self.codigo_municipio_col: codigo}
+        for c, valores in (('departamento', indice["departamentos"]), ('nombre_oficial', indice["nombres"])):
+            if c in self.df_municipios.columns:
+                result[c] = valores[fila]
         result['matched_by_code'] = True
         logging.info(f"✔ Municipio encontrado por código: {result}")
         return result
 
-    def resolver_municipio_input(self, nombre_input=None, codigo_input=None):
+    def resolver_municipio_input(self, nombre_input=None, codigo_input=None, departamento_input=None):
+        """
+        Resuelve por código DANE y, si no, por nombre (+ departamento). Si el
+        nombre es ambiguo devuelve `{"ambiguo": True, "candidatos": [...]}`.
+        """
         if codigo_input is not None and str(codigo_input).strip():
             resultado = self.buscar_municipio_por_codigo(codigo_input)
             if resultado:
@@ -94,14 +321,19 @@ class SICETACHelper:
                 return resultado
 
         if nombre_input is not None and str(nombre_input).strip():
-            resultado = self.buscar_municipio(nombre_input)
+            resolucion = self.resolver_municipio_departamento(nombre_input, departamento_input)
+            if resolucion["estado"] == "ambiguo":
+                logging.warning(f"✘ Municipio ambiguo: {nombre_input} ({len(resolucion['candidatos'])} candidatos)")
+                return {"ambiguo": True, "input_nombre": str(nombre_input).strip(), "candidatos": resolucion["candidatos"]}
+            resultado = resolucion["resultado"]
             if resultado:
-                resultado[self.codigo_municipio_col] = self._clean_code(resultado[self.codigo_municipio_col])
+                logging.info(f"✔ Municipio encontrado: {resultado}")
                 resultado['resolution_mode'] = 'name'
                 resultado['input_nombre'] = str(nombre_input).strip()
                 if codigo_input is not None and str(codigo_input).strip():
                     resultado['input_codigo'] = self._clean_code(codigo_input)
                 return resultado
+            logging.warning(f"✘ Municipio NO encontrado: {nombre_input}")
 
         return None
 
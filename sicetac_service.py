@@ -1,24 +1,57 @@
 from __future__ import annotations
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
+import hashlib
+from itertools import islice, product
+import multiprocessing
 import os
 import re
-from typing import Any
+from typing import Any, Callable, Iterator
 import unicodedata
 
+import numpy as np
 import pandas as pd
 from pydantic import BaseModel
+import threading
 import time
 
 from supabase_data import (
-    get_sicetac_movilizacion_df,
-    get_sicetac_valorhora_df,
+    CambioTabla,
+    MarcaAguaNoDisponible,
+    clear_lookup_cache,
+    clear_table_cache,
+    get_lookup_carril,
+    get_lookup_carriles,
     get_valor_plaza_df,
+    get_cached_watermark,
+    get_valor_plaza_recent_df,
     get_table_df,
+    get_table_generation,
+    refresh_table,
+    table_changed,
 )
 from sicetac_helper import SICETACHelper
+from grafo_rutas import GrafoRutas
+from peajes_matriz import MatrizPeajes
+from valor_plaza_store import ValorPlazaStore
+from vehicle_registry import VehicleRegistry, VehiculoRegistro
 from modelo_sicetac import calcular_modelo_sicetac_extendido
 from modelo_sicetac_vacio import calcular_modelo_sicetac_extendido_vacio
+from modelo_vectorizado import (
+    KM_COLUMNAS,
+    MODOS,
+    TarifaMes,
+    compilar_tarifa_mes,
+    cota_inferior_total,
+    evaluar_modelo,
+    evaluar_totales_carrocerias,
+    km_por_terreno,
+    normalizar_carroceria,
+)
+import resultados_cerrados
+import sicetac_cubo
 
 
 class ConsultaInput(BaseModel):
@@ -26,7 +59,12 @@ class ConsultaInput(BaseModel):
     destino: str | None = None
     codigo_dane_origen: str | None = None
     codigo_dane_destino: str | None = None
+    # Pista de departamento para nombres repetidos (también "San Pedro, Valle")
+    departamento_origen: str | None = None
+    departamento_destino: str | None = None
     vehiculo: str = "C3S3"
+    # Modo flota: vehiculo="*" (todas las configuraciones) o lista explícita.
+    vehiculos: list[str] | None = None
     mes: int | None = None
     carroceria: str = "GENERAL"
     valor_peaje_manual: float = 0.0
@@ -58,11 +96,17 @@ class ConsultaInput(BaseModel):
     # NUEVO: modo manual puro (sin buscar municipios/rutas)
     manual_mode: bool = False
 
+    # Variantes de ruta SICE: TODAS, MAS_BARATA (total H2), MAS_RAPIDA (horas
+    # de recorrido) o MAS_CORTA (km).
+    politica_variantes: str = "TODAS"
+    # Agrega min/max/mediana de los totales sobre todas las variantes.
+    agregar_variantes: bool = False
+
 
 @dataclass
 class SicetacError(Exception):
     status_code: int
-    detail: str
+    detail: str | dict[str, Any]
 
 
 SICE_COLUMN_OPTIONS: list[dict[str, str]] = [
@@ -152,16 +196,6 @@ def get_sice_column_options() -> list[dict[str, str]]:
     ]
 
 
-def _convertir_nativos(d: Any):
-    if isinstance(d, dict):
-        return {k: _convertir_nativos(v) for k, v in d.items()}
-    if isinstance(d, list):
-        return [_convertir_nativos(v) for v in d]
-    if hasattr(d, "item"):
-        return d.item()
-    return d
-
-
 def _clean_id(x) -> str:
     s = str(x or "").strip()
     if not s:
@@ -205,9 +239,23 @@ def _resolved_route_payload(
     }
 
 
+def _resolver_municipio(helper: SICETACHelper, campo: str, nombre: str | None, codigo: str | None, departamento: str | None) -> dict[str, Any] | None:
+    info = helper.resolver_municipio_input(nombre, codigo, departamento)
+    if info and info.get("ambiguo"):
+        raise SicetacError(
+            409,
+            {
+                "mensaje": f"'{info['input_nombre']}' coincide con varios municipios; indica el departamento (p. ej. '{info['input_nombre']}, {info['candidatos'][0]['departamento']}') o el código DANE.",
+                "campo": campo,
+                "candidatos": info["candidatos"],
+            },
+        )
+    return info
+
+
 def _resolve_route_inputs(data: ConsultaInput, helper: SICETACHelper) -> tuple[dict[str, Any], dict[str, Any], dict[str, Any], str, str]:
-    origen_info = helper.resolver_municipio_input(data.origen, data.codigo_dane_origen)
-    destino_info = helper.resolver_municipio_input(data.destino, data.codigo_dane_destino)
+    origen_info = _resolver_municipio(helper, "origen", data.origen, data.codigo_dane_origen, data.departamento_origen)
+    destino_info = _resolver_municipio(helper, "destino", data.destino, data.codigo_dane_destino, data.departamento_destino)
 
     if not origen_info or not destino_info:
         raise SicetacError(404, "Origen o destino no encontrado")
@@ -235,11 +283,18 @@ def _valor_plaza_selector(carroceria: str | None) -> tuple[str, str, str | None]
     return ("valor_en_plaza_carga_normal", "Carga normal", "fuente_carga_normal")
 
 
-def _mes_label(mes_codigo: Any) -> str:
-    digits = re.sub(r"\D", "", str(mes_codigo or ""))
-    if len(digits) >= 6:
-        return f"{digits[:4]}-{digits[4:6]}"
-    return str(mes_codigo or "")
+def _get_valor_plaza_store() -> ValorPlazaStore | None:
+    """
+    Índice en memoria de valor plaza para los últimos SICETAC_VALOR_PLAZA_MESES
+    meses. Se carga en bloque una vez por refresh; si la carga falla se usa
+    la consulta por carril.
+    """
+    global _VALOR_PLAZA_STORE, _VALOR_PLAZA_STORE_CARGADO
+    if not _VALOR_PLAZA_STORE_CARGADO:
+        _VALOR_PLAZA_STORE_CARGADO = True
+        df_plaza = get_valor_plaza_recent_df(_VALOR_PLAZA_MESES)
+        _VALOR_PLAZA_STORE = ValorPlazaStore(df_plaza) if not df_plaza.empty else None
+    return _VALOR_PLAZA_STORE
 
 
 def _build_valor_plaza_summary(
@@ -254,63 +309,55 @@ def _build_valor_plaza_summary(
     if not route_norm or not configuracion_norm:
         return None
 
-    df_plaza = get_valor_plaza_df(route_norm, configuracion_norm)
-    if df_plaza.empty:
-        return None
+    store = _get_valor_plaza_store()
+    if store is None:
+        df_plaza = get_valor_plaza_df(route_norm, configuracion_norm)
+        if df_plaza.empty:
+            return None
+        store = ValorPlazaStore(df_plaza)
 
     preferred_column, label, preferred_source_column = _valor_plaza_selector(carroceria)
-    fallback_column = "valor_en_plaza_carga_normal"
-    fallback_source_column = "fuente_carga_normal"
-
-    meses: list[dict[str, Any]] = []
-    valores: list[float] = []
-    fallback_used = False
-
-    for _, row in df_plaza.iterrows():
-        valor = row.get(preferred_column)
-        fuente = row.get(preferred_source_column)
-        tipo_utilizado = label
+    return store.resumen(
+        route_norm,
+        configuracion_norm,
+        columna=preferred_column,
+        label=label,
+        columna_fuente=preferred_source_column,
+        max_months=max_months,
+    )
 
-        if pd.isna(valor) or valor in (None, ""):
-            if preferred_column != fallback_column:
-                valor = row.get(fallback_column)
-                fuente = row.get(fallback_source_column)
-                tipo_utilizado = "Carga normal"
-                fallback_used = True
 
-        try:
-            valor_float = float(valor)
-        except Exception:
-            continue
-        if pd.isna(valor_float):
+def _build_valor_plaza_lote(
+    consultas: list[tuple[str | None, str | None, str | None]],
+    max_months: int = 3,
+) -> list[dict[str, Any] | None]:
+    """
+    Valor plaza para muchos carriles [(route_code, configuracion_lookup, carroceria)]
+    con una sola búsqueda sobre el índice en memoria.
+    """
+    store = _get_valor_plaza_store()
+    if store is None:
+        return [
+            _build_valor_plaza_summary(
+                route_code=route_code,
+                configuracion_lookup=configuracion,
+                carroceria=carroceria,
+                max_months=max_months,
+            )
+            for route_code, configuracion, carroceria in consultas
+        ]
+    pendientes = []
+    posiciones = []
+    resultados: list[dict[str, Any] | None] = [None] * len(consultas)
+    for i, (route_code, configuracion, carroceria) in enumerate(consultas):
+        if not str(route_code or "").strip() or not str(configuracion or "").strip():
             continue
-
-        meses.append(
-            {
-                "mes_codigo": int(row.get("mes_codigo")) if not pd.isna(row.get("mes_codigo")) else row.get("mes_codigo"),
-                "mes_label": _mes_label(row.get("mes_codigo")),
-                "valor": valor_float,
-                "fuente": str(fuente).strip() or None,
-                "tipo_carga_usado": tipo_utilizado,
-            }
-        )
-        valores.append(valor_float)
-        if len(meses) >= max_months:
-            break
-
-    if not meses:
-        return None
-
-    promedio = sum(valores) / len(valores)
-    return {
-        "route_code": route_norm,
-        "configuracion_analisis": configuracion_norm,
-        "tipo_carga_label": label,
-        "tipo_carga_column": preferred_column,
-        "fallback_to_carga_normal": fallback_used,
-        "meses": meses,
-        "promedio_ultimos_meses": promedio,
-    }
+        preferred_column, label, preferred_source_column = _valor_plaza_selector(carroceria)
+        pendientes.append((route_code, configuracion, preferred_column, label, preferred_source_column))
+        posiciones.append(i)
+    for i, plaza in zip(posiciones, store.resumen_lote(pendientes, max_months=max_months)):
+        resultados[i] = plaza
+    return resultados
 
 
 def _attach_valor_plaza(
@@ -356,12 +403,42 @@ def _get_dataframes():
 
 
 _RUTAS_INDEX: dict[tuple[str, str], list[pd.Series]] | None = None
-_PEAJES_INDEX: dict[tuple[str, str], list[float]] | None = None
+_PEAJES_INDEX: MatrizPeajes | None = None
+_TARIFAS_INDEX: dict[int, TarifaMes] = {}
+_CUBO: sicetac_cubo.CuboOD | None = None
+_CUBO_VALIDADO = False
+# Actualización del cubo tras un refresh: en un hilo aparte, una a la vez.
+_CUBO_ACTUALIZACION_LOCK = threading.Lock()
+_CUBO_ACTUALIZACION: dict[str, Any] = {"en_curso": False, "pendiente": False, "ultimo": None, "error": None}
+_VALOR_PLAZA_STORE: ValorPlazaStore | None = None
+_VALOR_PLAZA_STORE_CARGADO = False
 _LAST_REFRESH_TS: float | None = None
 _CACHE_TTL_SECONDS = int(float(
     (os.getenv("SICETAC_CACHE_TTL_SECONDS") or str(7 * 24 * 3600))
 ))
 _USE_CONSOLIDATED_LOOKUP = (os.getenv("SICETAC_USE_CONSOLIDATED_LOOKUP", "true").strip().lower() != "false")
+_USE_CUBO_OD = (os.getenv("SICETAC_USE_CUBE", "true").strip().lower() != "false")
+_CUBO_AUTO_UPDATE = (os.getenv("SICETAC_CUBE_AUTO_UPDATE", "true").strip().lower() != "false")
+_USE_MESES_CERRADOS = (os.getenv("SICETAC_USE_CERRADOS", "true").strip().lower() != "false")
+_VALOR_PLAZA_MESES = int(os.getenv("SICETAC_VALOR_PLAZA_MESES", "12"))
+_LOTE_MAX = int(os.getenv("SICETAC_LOTE_MAX", "500"))
+_PEAJES_DUPLICADOS = os.getenv("SICETAC_PEAJES_DUPLICADOS", "first").strip().lower()
+_VIAJE_MAX_PARADAS = int(os.getenv("SICETAC_VIAJE_MAX_PARADAS", "25"))
+_GRAFO_HUBS = int(os.getenv("SICETAC_GRAFO_HUBS", "20"))
+_GRAFO_MAX_TRAMOS = int(os.getenv("SICETAC_GRAFO_MAX_TRAMOS", "4"))
+_SNAPSHOT_BLOQUE_RUTAS = int(os.getenv("SICETAC_SNAPSHOT_BLOQUE_RUTAS", "2000"))
+_SNAPSHOT_WORKERS = int(os.getenv("SICETAC_SNAPSHOT_SHARDS", "1"))
+# Mismo método de arranque que el pool de jobs (snapshot_jobs); el contexto
+# viaja como argumento, no heredado de los hilos del servidor.
+_SNAPSHOT_START_METHOD = os.getenv("SICETAC_SNAPSHOT_START_METHOD", "spawn").strip() or "spawn"
+_TABLAS_REFERENCIA = ("municipios", "vehiculos", "parametros", "costos_fijos", "peajes", "rutas")
+_TABLAS_LOOKUP = ("sicetac_movilizacion", "sicetac_valorhora", "valor_plaza")
+# Huella de los datos vigentes para ETags; se recalcula tras cada refresh.
+_GENERACION_DATOS: str | None = None
+# MES disponibles en parametros_vigentes (ordenados); se invalida con la tabla.
+_MESES_DISPONIBLES: list[int] | None = None
+_VEHICLE_REGISTRY: VehicleRegistry | None = None
+_GRAFO_RUTAS: GrafoRutas | None = None
 
 
 def _get_rutas_index(df_rutas: pd.DataFrame) -> dict[tuple[str, str], list[pd.Series]]:
@@ -377,63 +454,474 @@ def _get_rutas_index(df_rutas: pd.DataFrame) -> dict[tuple[str, str], list[pd.Se
         return _RUTAS_INDEX
 
     index: dict[tuple[str, str], list[pd.Series]] = {}
+    _indexar_rutas(df_rutas, index)
+    _RUTAS_INDEX = index
+    return _RUTAS_INDEX
+
+
+def _indexar_rutas(df_rutas: pd.DataFrame, index: dict[tuple[str, str], list[pd.Series]]) -> None:
     for _, row in df_rutas.iterrows():
         key = (_clean_id(row["CODIGO_DANE_ORIGEN"]), _clean_id(row["CODIGO_DANE_DESTINO"]))
         index.setdefault(key, []).append(row)
-    _RUTAS_INDEX = index
-    return _RUTAS_INDEX
 
 
-def _get_peajes_index(df_peajes: pd.DataFrame) -> dict[tuple[str, str], list[float]]:
+def _get_peajes_index(df_peajes: pd.DataFrame) -> MatrizPeajes:
+    """
+    Matriz densa de peajes (ID_SICE × EJES_CONFIGURACION); los duplicados se
+    resuelven con SICETAC_PEAJES_DUPLICADOS (first por defecto).
+    """
     global _PEAJES_INDEX
-    if _PEAJES_INDEX is not None:
-        return _PEAJES_INDEX
-    if df_peajes is None or df_peajes.empty:
-        _PEAJES_INDEX = {}
-        return _PEAJES_INDEX
-
-    if "ID_SICE" not in df_peajes.columns or "EJES_CONFIGURACION" not in df_peajes.columns:
-        _PEAJES_INDEX = {}
-        return _PEAJES_INDEX
-
-    index: dict[tuple[str, str], list[float]] = {}
-    for _, row in df_peajes.iterrows():
-        key = (_clean_id(row["ID_SICE"]), _clean_id(row["EJES_CONFIGURACION"]))
-        try:
-            valor = float(row.get("VALOR_PEAJE", 0))
-        except Exception:
-            valor = 0.0
-        index.setdefault(key, []).append(valor)
-    _PEAJES_INDEX = index
+    if _PEAJES_INDEX is None:
+        _PEAJES_INDEX = MatrizPeajes(df_peajes, politica=_PEAJES_DUPLICADOS)
     return _PEAJES_INDEX
 
 
-def _refresh_cache(force: bool = False) -> None:
-    global _LAST_REFRESH_TS, _RUTAS_INDEX, _PEAJES_INDEX
-    now = time.time()
-    if not force and _LAST_REFRESH_TS is not None:
-        if (now - _LAST_REFRESH_TS) < _CACHE_TTL_SECONDS:
-            return
+def _peaje_indexado(peajes_index: MatrizPeajes, id_sice: Any, ejes_conf: str) -> float | None:
+    return peajes_index.valor(id_sice, ejes_conf)
 
-    # Limpiar cache de tablas Supabase
-    try:
-        get_table_df.cache_clear()
-    except Exception:
-        pass
+
+def _get_tarifa_mes(df_parametros: pd.DataFrame, df_costos_fijos: pd.DataFrame, mes: int, df_vehiculos: pd.DataFrame) -> TarifaMes:
+    tarifa = _TARIFAS_INDEX.get(int(mes))
+    if tarifa is None:
+        vehiculos = df_vehiculos["TIPO_VEHICULO"].astype(str).unique().tolist()
+        tarifa = compilar_tarifa_mes(df_parametros, df_costos_fijos, int(mes), vehiculos=vehiculos)
+        _TARIFAS_INDEX[int(mes)] = tarifa
+    return tarifa
+
+
+def _get_grafo_rutas(df_rutas: pd.DataFrame) -> GrafoRutas:
+    global _GRAFO_RUTAS
+    if _GRAFO_RUTAS is None:
+        _GRAFO_RUTAS = GrafoRutas(df_rutas, hubs=_GRAFO_HUBS)
+    return _GRAFO_RUTAS
+
+
+@dataclass
+class _RutaCompuesta:
+    """
+    Ruta por tramos (camino mínimo en km sobre el grafo de rutas) para un par
+    sin registro directo. No depende del vehículo: el peaje de cada tramo sale
+    de la matriz de peajes para los ejes que se pidan.
+    """
+    tramos: list[tuple[str, str]]
+    ids_sice: list[Any]
+    nombres_sice: list[Any]
+    km: np.ndarray
+
+    def km_terreno(self) -> list[float]:
+        return [float(x) for x in self.km.sum(axis=0)]
+
+    def peajes(self, peajes_index: MatrizPeajes, ejes: list[str]) -> np.ndarray:
+        # (tramos, ejes); un tramo sin peaje para esos ejes suma 0.
+        return peajes_index.matriz(self.ids_sice, ejes, faltante=0.0)
+
+    def detalle(self, peajes: np.ndarray | None = None) -> dict[str, Any]:
+        tramos = []
+        for i, ((desde, hasta), id_sice, nombre) in enumerate(zip(self.tramos, self.ids_sice, self.nombres_sice)):
+            tramo = {
+                "origen": desde,
+                "destino": hasta,
+                "id_sice": id_sice,
+                "nombre_sice": nombre,
+                "km": round(float(self.km[i].sum()), 2),
+            }
+            if peajes is not None:
+                tramo["peaje"] = float(peajes[i])
+            tramos.append(tramo)
+        detalle = {"tramos": tramos, "km_total": round(float(self.km.sum()), 2)}
+        if peajes is not None:
+            detalle["peaje_total"] = float(peajes.sum())
+        return detalle
+
+
+def _componer_ruta(cod_origen: str, cod_destino: str, df_rutas: pd.DataFrame) -> _RutaCompuesta:
+    tramos = _get_grafo_rutas(df_rutas).camino(cod_origen, cod_destino)
+    if not tramos or len(tramos) > _GRAFO_MAX_TRAMOS:
+        raise SicetacError(404, "Ruta no registrada y no se proporcionaron distancias manuales")
+    filas = df_rutas.iloc[[fila for fila, _, _ in tramos]]
+    sin_dato = [None] * len(filas)
+    return _RutaCompuesta(
+        tramos=[(desde, hasta) for _, desde, hasta in tramos],
+        ids_sice=filas["ID_SICE"].tolist() if "ID_SICE" in filas.columns else sin_dato,
+        nombres_sice=filas["NOMBRE_SICE"].tolist() if "NOMBRE_SICE" in filas.columns else sin_dato,
+        km=km_por_terreno(filas),
+    )
+
+
+def _get_vehicle_registry() -> VehicleRegistry:
+    """
+    Registro de vehículos (alias, ejes y configuración de lookup); se
+    reconstruye cuando cambia `configuracion_vehicular`.
+    """
+    global _VEHICLE_REGISTRY
+    if _VEHICLE_REGISTRY is None:
+        _VEHICLE_REGISTRY = VehicleRegistry(get_table_df("vehiculos"))
+    return _VEHICLE_REGISTRY
+
+
+def _resolver_vehiculo(vehiculo: str) -> VehiculoRegistro:
+    registry = _get_vehicle_registry()
+    registro = registry.resolver(vehiculo)
+    if registro is None:
+        raise SicetacError(
+            400,
+            f"Vehículo '{vehiculo}' no encontrado. Opciones válidas: {', '.join(registry.tipos)}"
+        )
+    return registro
+
+
+MODO_IDA_VUELTA = "IDA_VUELTA"
+_TRAMOS_IDA_VUELTA = (("ida", "CARGADO"), ("vuelta", "VACIO"))
+_DISTANCIAS_TERRENO = ("km_plano", "km_ondulado", "km_montanoso", "km_urbano", "km_despavimentado")
+
+
+def _tramos_ida_vuelta(
+    tarifa: TarifaMes,
+    *,
+    vehiculo: str,
+    carroceria: str | None,
+    distancias: dict[str, Any],
+    peaje: float,
+    horas: list[int],
+    totales_cubo: Callable[[str], dict[str, float] | None] | None = None,
+) -> dict[str, Any]:
+    """
+    Ida cargado + vuelta vacío sobre las mismas distancias y peajes, con las
+    mismas horas logísticas en ambos tramos. Evalúa cada tramo con el modelo
+    vectorizado (o el cubo OD si lo tiene) para todas las horas a la vez.
+    """
+    pos = tarifa.posiciones.get(vehiculo)
+    if pos is None:
+        raise SicetacError(400, f"Vehículo '{vehiculo}' sin parámetros para el MES {tarifa.mes}")
+    costo_fijo = tarifa.costo_fijo_para(carroceria)[pos]
+    if np.isnan(costo_fijo):
+        tipo = carroceria.upper().strip() if carroceria else "GENERAL"
+        raise ValueError(f"No se encontró costo fijo para {vehiculo} - {tarifa.mes} - {tipo}")
+
+    km = pd.to_numeric(pd.Series([distancias.get(k, 0) for k in _DISTANCIAS_TERRENO]), errors="coerce").fillna(0).to_numpy(dtype=float)
+    tramos: dict[str, Any] = {}
+    for tramo, modo in _TRAMOS_IDA_VUELTA:
+        totales = totales_cubo(modo) if totales_cubo is not None else None
+        if totales is None:
+            resultado = evaluar_modelo(
+                km=km[None, :],
+                velocidad=tarifa.velocidad[modo][pos][None, :],
+                consumo=tarifa.consumo[modo][pos][None, :],
+                valor_acpm=tarifa.valor_acpm[pos],
+                costos_variables=tarifa.costos_variables[pos],
+                costo_fijo=costo_fijo,
+                peaje=float(peaje or 0),
+                horas_logisticas=np.asarray(horas, dtype=float),
+                modo=modo,
+            )
+            totales = {f"H{h}": float(v) for h, v in zip(horas, resultado["total_viaje"])}
+        tramos[tramo] = {"modo_viaje": modo, "totales": totales}
+
+    return {
+        "totales": {
+            f"H{h}": round(tramos["ida"]["totales"][f"H{h}"] + tramos["vuelta"]["totales"][f"H{h}"], 2)
+            for h in horas
+        },
+        "tramos": tramos,
+    }
+
+
+def _huella_cubo_actual(mes: int) -> str:
+    df_vehiculos = get_table_df("vehiculos")
+    df_parametros = get_table_df("parametros")
+    df_costos_fijos = get_table_df("costos_fijos")
+    df_peajes = get_table_df("peajes")
+    df_rutas = get_table_df("rutas")
+    tarifa = _get_tarifa_mes(df_parametros, df_costos_fijos, mes, df_vehiculos)
+    peajes_index = _get_peajes_index(df_peajes)
+    ejes = _get_vehicle_registry().ejes
+    peajes = sicetac_cubo.matriz_peajes_rutas(df_rutas, [ejes.get(v, "") for v in tarifa.vehiculos], peajes_index)
+    return sicetac_cubo.calcular_huellas(tarifa, km_por_terreno(df_rutas), peajes)["huella"]
+
+
+def _get_cubo() -> sicetac_cubo.CuboOD | None:
+    """
+    Cubo OD del último MES, solo si sus huellas coinciden con los datos
+    actuales. La validación se hace una vez por refresh.
+    """
+    global _CUBO, _CUBO_VALIDADO
+    if not _USE_CUBO_OD:
+        return None
+    if _CUBO_VALIDADO:
+        return _CUBO
+    _CUBO_VALIDADO = True
+    _CUBO = None
+    mes = _latest_mes(get_table_df("parametros"))
+    if mes is None:
+        return None
+    cubo = sicetac_cubo.cargar_cubo(mes)
+    if cubo is None:
+        return None
     try:
-        get_sicetac_movilizacion_df.cache_clear()
+        if cubo.huella != _huella_cubo_actual(mes):
+            return None
     except Exception:
-        pass
+        return None
+    _CUBO = cubo
+    return _CUBO
+
+
+def actualizar_cubo_od(carrocerias: list[str] | None = None, verificar_muestras: int = 25) -> dict[str, Any]:
+    """
+    Construye (o actualiza solo las tajadas que cambiaron) el cubo OD del
+    último MES y lo verifica contra calcular_modelo_sicetac_extendido.
+    """
+    global _CUBO, _CUBO_VALIDADO
+    _refresh_cache()
+    (
+        df_municipios,
+        df_vehiculos,
+        df_parametros,
+        df_costos_fijos,
+        df_peajes,
+        df_rutas,
+        _df_sicetac_movilizacion,
+        _df_sicetac_valorhora,
+    ) = _get_dataframes()
+
+    if df_vehiculos.empty or df_parametros.empty or df_costos_fijos.empty or df_peajes.empty or df_rutas.empty:
+        raise SicetacError(500, "Tablas de Supabase no disponibles o vacías. Verifica conexión y datos.")
+
+    mes_usar = _latest_mes(df_parametros)
+    if mes_usar is None:
+        raise SicetacError(500, "No se pudo determinar el MES más reciente.")
+
+    peajes_index = _get_peajes_index(df_peajes)
+    ejes = _get_vehicle_registry().ejes
+    stats = sicetac_cubo.actualizar_cubo(
+        mes=mes_usar,
+        df_vehiculos=df_vehiculos,
+        df_parametros=df_parametros,
+        df_costos_fijos=df_costos_fijos,
+        df_rutas=df_rutas,
+        peajes_index=peajes_index,
+        ejes_para=lambda v: ejes.get(v, ""),
+        carrocerias=carrocerias,
+    )
+
+    _CUBO = None
+    _CUBO_VALIDADO = False
+    cubo = sicetac_cubo.cargar_cubo(mes_usar)
+    if cubo is not None and verificar_muestras > 0:
+        def _modelo_referencia(pos: int, vehiculo: str, carroceria: str, modo: str, horas: int):
+            ruta_row = df_rutas.iloc[pos]
+            modelo = calcular_modelo_sicetac_extendido_vacio if modo == "VACIO" else calcular_modelo_sicetac_extendido
+            res = modelo(
+                origen="",
+                destino="",
+                configuracion=vehiculo,
+                serie=int(mes_usar),
+                distancias={
+                    "km_plano": ruta_row.get("KM_PLANO", 0),
+                    "km_ondulado": ruta_row.get("KM_ONDULADO", 0),
+                    "km_montanoso": ruta_row.get("KM_MONTAÑOSO", 0),
+                    "km_urbano": ruta_row.get("KM_URBANO", 0),
+                    "km_despavimentado": ruta_row.get("KM_DESPAVIMENTADO", 0),
+                },
+                valor_peaje_manual=0,
+                matriz_parametros=df_parametros,
+                matriz_costos_fijos=df_costos_fijos,
+                matriz_vehicular=df_vehiculos,
+                rutas_df=df_rutas,
+                peajes_df=df_peajes,
+                carroceria_especial=carroceria,
+                ruta_oficial=ruta_row,
+                horas_logisticas=horas,
+                valor_peaje_override=_peaje_indexado(peajes_index, ruta_row.get("ID_SICE"), ejes.get(vehiculo, "")) or 0.0,
+            )
+            return res.get("total_viaje", res.get("total_viaje_vacio"))
+
+        stats["verificacion"] = sicetac_cubo.verificar_cubo(cubo, _modelo_referencia, muestras=verificar_muestras)
+    return stats
+
+
+def _valores_afectados(cambio: CambioTabla, columna: str) -> set:
+    valores = set()
+    for df in (cambio.agregadas, cambio.removidas):
+        if df is not None and not df.empty and columna in df.columns:
+            valores.update(df[columna].tolist())
+    return valores
+
+
+def _meses_afectados(cambio: CambioTabla) -> set[int]:
+    meses = pd.to_numeric(pd.Series(list(_valores_afectados(cambio, "MES")), dtype=object), errors="coerce")
+    return {int(m) for m in meses.dropna()}
+
+
+def _actualizar_peajes_index(cambio: CambioTabla) -> int:
+    """
+    Recalcula en la matriz de peajes solo las filas de los ID_SICE con filas
+    agregadas o removidas y devuelve cuántos ID_SICE se reindexaron.
+    """
+    ids = {_clean_id(x) for x in _valores_afectados(cambio, "ID_SICE")} - {""}
+    if _PEAJES_INDEX is None or not ids:
+        return len(ids)
+    return _PEAJES_INDEX.actualizar_ids(get_table_df("peajes"), ids)
+
+
+def _actualizar_rutas_index(cambio: CambioTabla) -> int:
+    """Reindexa solo los pares (origen, destino) con filas agregadas o removidas."""
+    pares: set[tuple[str, str]] = set()
+    for df in (cambio.agregadas, cambio.removidas):
+        if df is not None and not df.empty and "CODIGO_DANE_ORIGEN" in df.columns and "CODIGO_DANE_DESTINO" in df.columns:
+            pares.update(zip(df["CODIGO_DANE_ORIGEN"].map(_clean_id), df["CODIGO_DANE_DESTINO"].map(_clean_id)))
+    if _RUTAS_INDEX is None or not pares:
+        return len(pares)
+    for par in pares:
+        _RUTAS_INDEX.pop(par, None)
+    df_rutas = get_table_df("rutas")
+    if not df_rutas.empty:
+        claves = list(zip(df_rutas["CODIGO_DANE_ORIGEN"].map(_clean_id), df_rutas["CODIGO_DANE_DESTINO"].map(_clean_id)))
+        mask = [k in pares for k in claves]
+        _indexar_rutas(df_rutas[mask], _RUTAS_INDEX)
+    return len(pares)
+
+
+def _refresh_cache(force: bool = False, completo: bool = False) -> dict[str, Any]:
+    """
+    Refresca las tablas de referencia cuando vence el TTL (o con `force`).
+
+    Por defecto es incremental: cada tabla se compara por marca de agua o
+    hash de filas y solo se invalida el estado derivado afectado (tarifas
+    compiladas por MES, entradas de peajes por ID_SICE, pares de rutas y
+    tajadas del cubo OD). `completo=True` limpia todo como antes, incluido
+    el tier de meses cerrados.
+    """
+    global _LAST_REFRESH_TS, _RUTAS_INDEX, _PEAJES_INDEX, _CUBO, _CUBO_VALIDADO
+    global _VALOR_PLAZA_STORE, _VALOR_PLAZA_STORE_CARGADO, _GENERACION_DATOS, _MESES_DISPONIBLES
+    global _VEHICLE_REGISTRY, _GRAFO_RUTAS
+    now = time.time()
+    if not force and not completo and _LAST_REFRESH_TS is not None:
+        if (now - _LAST_REFRESH_TS) < _CACHE_TTL_SECONDS:
+            return {}
+    _GENERACION_DATOS = None
+
+    if completo or _LAST_REFRESH_TS is None:
+        # Limpiar cache de tablas Supabase
+        clear_table_cache()
+        clear_lookup_cache()
+
+        # Limpiar índices
+        _RUTAS_INDEX = None
+        _PEAJES_INDEX = None
+        _TARIFAS_INDEX.clear()
+        _MESES_DISPONIBLES = None
+        _VEHICLE_REGISTRY = None
+        _GRAFO_RUTAS = None
+        _CUBO = None
+        _CUBO_VALIDADO = False
+        _VALOR_PLAZA_STORE = None
+        _VALOR_PLAZA_STORE_CARGADO = False
+        _LAST_REFRESH_TS = now
+        detalle_completo: dict[str, Any] = {"modo": "completo"}
+        # El tier de meses cerrados sobrevive reinicios; solo un refresh
+        # completo explícito lo descarta, porque no se sabe qué mes cambió.
+        cerrados = resultados_cerrados.get_store() if completo and _USE_MESES_CERRADOS else None
+        if cerrados is not None:
+            detalle_completo["resultados_cerrados_purgados"] = cerrados.purgar_todo()
+        return detalle_completo
+
+    cambios = {key: refresh_table(key) for key in _TABLAS_REFERENCIA}
+    detalle: dict[str, Any] = {key: cambio.resumen() for key, cambio in cambios.items()}
+
+    if cambios["vehiculos"].cambiado:
+        _TARIFAS_INDEX.clear()
+    if cambios["parametros"].cambiado:
+        _MESES_DISPONIBLES = None
+    if cambios["vehiculos"].cambiado:
+        _VEHICLE_REGISTRY = None
+    meses = _meses_afectados(cambios["parametros"]) | _meses_afectados(cambios["costos_fijos"])
+    for mes in meses:
+        _TARIFAS_INDEX.pop(mes, None)
+    if meses:
+        detalle["tarifas_invalidadas"] = sorted(meses)
+        cerrados = resultados_cerrados.get_store() if _USE_MESES_CERRADOS else None
+        if cerrados is not None:
+            detalle["resultados_cerrados_purgados"] = cerrados.purgar_meses(meses)
+
+    if cambios["peajes"].cambiado:
+        detalle["peajes_id_sice_reindexados"] = _actualizar_peajes_index(cambios["peajes"])
+    if cambios["rutas"].cambiado:
+        detalle["rutas_pares_reindexados"] = _actualizar_rutas_index(cambios["rutas"])
+        _GRAFO_RUTAS = None
+
+    derivados = any(cambios[k].cambiado for k in ("vehiculos", "parametros", "costos_fijos", "peajes", "rutas"))
+    if derivados:
+        _CUBO = None
+        _CUBO_VALIDADO = False
+
+    # Lookups puntuales del consolidado: solo se limpian si la tabla cambió
+    # (o si no hay marca de agua para saberlo).
+    for key in ("sicetac_movilizacion", "sicetac_valorhora"):
+        try:
+            cambiada = table_changed(key)
+        except MarcaAguaNoDisponible:
+            detalle[f"{key}_marca_agua"] = "error"
+            continue
+        if cambiada is not False:
+            clear_lookup_cache(key)
+            detalle[f"{key}_cache_limpiado"] = True
     try:
-        get_sicetac_valorhora_df.cache_clear()
-    except Exception:
-        pass
+        plaza_cambiada = table_changed("valor_plaza")
+    except MarcaAguaNoDisponible:
+        detalle["valor_plaza_marca_agua"] = "error"
+        plaza_cambiada = False
+    if plaza_cambiada is not False:
+        clear_lookup_cache("valor_plaza")
+        _VALOR_PLAZA_STORE = None
+        _VALOR_PLAZA_STORE_CARGADO = False
+        detalle["valor_plaza_recargado"] = True
 
-    # Limpiar índices
-    _RUTAS_INDEX = None
-    _PEAJES_INDEX = None
     _LAST_REFRESH_TS = now
 
+    if derivados and _CUBO_AUTO_UPDATE:
+        mes = _latest_mes(get_table_df("parametros"))
+        if mes is not None and sicetac_cubo.cargar_cubo(mes) is not None:
+            detalle["cubo"] = _actualizar_cubo_en_segundo_plano()
+    return detalle
+
+
+def _actualizar_cubo_en_segundo_plano() -> dict[str, Any]:
+    """
+    Actualiza el cubo en un hilo para no bloquear la request que disparó el
+    refresh; mientras tanto las consultas usan el modelo (las huellas del cubo
+    viejo ya no coinciden). Si llega otro cambio durante la actualización, se
+    repite al terminar.
+    """
+    with _CUBO_ACTUALIZACION_LOCK:
+        if _CUBO_ACTUALIZACION["en_curso"]:
+            _CUBO_ACTUALIZACION["pendiente"] = True
+            return {"modo": "en_curso"}
+        _CUBO_ACTUALIZACION["en_curso"] = True
+
+    def _tarea():
+        while True:
+            with _CUBO_ACTUALIZACION_LOCK:
+                _CUBO_ACTUALIZACION["pendiente"] = False
+            try:
+                ultimo, error = actualizar_cubo_od(verificar_muestras=0), None
+            except Exception as e:
+                ultimo, error = None, str(e)
+            with _CUBO_ACTUALIZACION_LOCK:
+                _CUBO_ACTUALIZACION.update(ultimo=ultimo, error=error)
+                if not _CUBO_ACTUALIZACION["pendiente"]:
+                    _CUBO_ACTUALIZACION["en_curso"] = False
+                    return
+
+    threading.Thread(target=_tarea, name="cubo-od", daemon=True).start()
+    return {"modo": "en_segundo_plano"}
+
+
+def cubo_stats() -> dict[str, Any]:
+    """Estado de la última actualización del cubo disparada por un refresh."""
+    with _CUBO_ACTUALIZACION_LOCK:
+        return dict(_CUBO_ACTUALIZACION)
+
 
 def _latest_mes(df_parametros: pd.DataFrame) -> int | None:
     if df_parametros is None or df_parametros.empty or "MES" not in df_parametros.columns:
@@ -444,6 +932,16 @@ def _latest_mes(df_parametros: pd.DataFrame) -> int | None:
         return None
 
 
+def _meses_disponibles(df_parametros: pd.DataFrame) -> list[int]:
+    global _MESES_DISPONIBLES
+    if _MESES_DISPONIBLES is None:
+        if df_parametros is None or df_parametros.empty or "MES" not in df_parametros.columns:
+            return []
+        meses = pd.to_numeric(df_parametros["MES"], errors="coerce").dropna().astype(int).unique()
+        _MESES_DISPONIBLES = sorted(meses.tolist())
+    return _MESES_DISPONIBLES
+
+
 def _manual_km_montanoso(data: ConsultaInput) -> float:
     # Compatibilidad de nombres: km_montañoso (legacy) y km_montanoso (nuevo).
     return float(getattr(data, "km_montanoso", 0) or getattr(data, "km_montañoso", 0) or 0)
@@ -464,17 +962,6 @@ def _has_manual_distances(data: ConsultaInput) -> bool:
     ])
 
 
-def _configuracion_lookup(fila_conf: pd.Series, vehiculo: str) -> str:
-    value = (
-        fila_conf.get("CONFIGURACION_SICETAC_LOOKUP")
-        or fila_conf.get("configuracion_sicetac_lookup")
-        or fila_conf.get("CONFIGURACION_ANALISIS")
-        or fila_conf.get("EJES_CONFIGURACION")
-        or vehiculo
-    )
-    return str(value).strip().upper()
-
-
 def _carroceria_option(carroceria: str) -> dict[str, str] | None:
     return _SICE_COLUMN_MAP.get(_normalize_lookup_text(carroceria))
 
@@ -485,7 +972,13 @@ def _lookup_sicetac_totales(
     cod_destino_str: str,
     configuracion_lookup: str,
     carroceria: str,
+    route_code: str | None = None,
 ) -> list[dict[str, Any]]:
+    """
+    Totales del consolidado para el carril. Con `route_code` la misma llamada
+    combinada trae también el valor plaza, que queda en cache para
+    `_attach_valor_plaza`.
+    """
     if not _USE_CONSOLIDATED_LOOKUP:
         return []
 
@@ -494,10 +987,9 @@ def _lookup_sicetac_totales(
         return []
     lookup_col = carroceria_option["column"]
 
-    df_rows = get_sicetac_movilizacion_df(cod_origen_str, cod_destino_str, configuracion_lookup)
-    if df_rows.empty:
-        df_rows = get_sicetac_movilizacion_df(cod_destino_str, cod_origen_str, configuracion_lookup)
-    df_valorhora = get_sicetac_valorhora_df(configuracion_lookup)
+    lookup = get_lookup_carril(cod_origen_str, cod_destino_str, configuracion_lookup, route_code)
+    df_rows = lookup["movilizacion"]
+    df_valorhora = lookup["valorhora"]
 
     if df_rows.empty or df_valorhora.empty:
         return []
@@ -552,31 +1044,151 @@ def _route_metadata_map(ruta: pd.DataFrame) -> dict[str, dict[str, Any]]:
     return metadata
 
 
-def calcular_sicetac(data: ConsultaInput) -> dict:
-    _refresh_cache()
-    (
-        df_municipios,
-        df_vehiculos,
-        df_parametros,
-        df_costos_fijos,
-        df_peajes,
-        df_rutas,
-        df_sicetac_movilizacion,
-        df_sicetac_valorhora,
-    ) = _get_dataframes()
+POLITICAS_VARIANTES = ("TODAS", "MAS_BARATA", "MAS_RAPIDA", "MAS_CORTA")
 
-    if df_municipios.empty or df_vehiculos.empty or df_parametros.empty or df_costos_fijos.empty or df_peajes.empty or df_rutas.empty:
-        raise SicetacError(500, "Tablas de Supabase no disponibles o vacías. Verifica conexión y datos.")
 
-    helper = SICETACHelper(df_municipios)
+def _politica_variantes(data: ConsultaInput | ViajeInput) -> str:
+    politica = str(data.politica_variantes or "TODAS").strip().upper()
+    if politica not in POLITICAS_VARIANTES:
+        raise SicetacError(400, f"politica_variantes '{data.politica_variantes}' no soportada. Usa: {', '.join(POLITICAS_VARIANTES)}")
+    return politica
 
-    mes_usar = data.mes
-    if mes_usar is None:
-        mes_usar = _latest_mes(df_parametros)
-    if mes_usar is None:
-        raise SicetacError(500, "No se pudo determinar el MES más reciente.")
 
-    manual_mode = bool(getattr(data, "manual_mode", False))
+def _posicion_tarifa(tarifa: TarifaMes, vehiculo: str) -> int:
+    pos = tarifa.posiciones.get(vehiculo)
+    if pos is None:
+        raise SicetacError(400, f"Vehículo '{vehiculo}' sin parámetros para el MES {tarifa.mes}")
+    return pos
+
+
+def _modos_tramos(modo: str) -> list[str]:
+    return [m for _, m in _TRAMOS_IDA_VUELTA] if modo == MODO_IDA_VUELTA else [modo]
+
+
+def _clave_variantes(politica: str, km: np.ndarray, tarifa: TarifaMes, vehiculo: str, modo: str) -> np.ndarray:
+    """km (R, 5) -> km totales (MAS_CORTA) u horas de recorrido (MAS_RAPIDA) por variante."""
+    if politica == "MAS_CORTA":
+        return km.sum(axis=-1)
+    pos = _posicion_tarifa(tarifa, vehiculo)
+    horas = np.zeros(len(km))
+    for m in _modos_tramos(modo):
+        velocidad = tarifa.velocidad[m][pos]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            horas = horas + np.where(velocidad != 0, km / velocidad, 0.0).sum(axis=-1)
+    return horas
+
+
+def _cota_variantes(km: np.ndarray, peajes: list[float], tarifa: TarifaMes, vehiculo: str, modo: str) -> np.ndarray:
+    pos = _posicion_tarifa(tarifa, vehiculo)
+    return sum(
+        cota_inferior_total(
+            km=km,
+            consumo=tarifa.consumo[m][pos],
+            valor_acpm=tarifa.valor_acpm[pos],
+            costos_variables=tarifa.costos_variables[pos],
+            peaje=np.asarray(peajes, dtype=float),
+            modo=m,
+        )
+        for m in _modos_tramos(modo)
+    )
+
+
+def _seleccionar_variantes(
+    n: int,
+    *,
+    politica: str,
+    agregar: bool,
+    evaluar: Callable[[int], dict[str, Any]],
+    clave: Callable[[], np.ndarray] | None = None,
+    cota: Callable[[], np.ndarray] | None = None,
+    hora: str | None = "H2",
+) -> tuple[list[dict[str, Any]], dict[str, Any] | None]:
+    """
+    Variantes de ruta según la política. TODAS (o `agregar`, que necesita
+    todos los totales) evalúa todas; MAS_CORTA y MAS_RAPIDA eligen por
+    `clave` sin evaluar el modelo y evalúan solo la elegida; MAS_BARATA
+    recorre las variantes por `cota` inferior ascendente y se detiene cuando
+    la siguiente cota ya no puede mejorar el mejor total `hora` (con
+    `hora=None`, el `total` único de las variantes de un tramo de viaje).
+    Devuelve las variantes evaluadas y la selección (None con TODAS).
+    """
+    def _total(variante: dict[str, Any]) -> float:
+        valor = variante.get("total") if hora is None else (variante.get("totales") or {}).get(hora)
+        return np.inf if valor is None else float(valor)
+
+    if politica == "TODAS" or agregar:
+        variantes = [evaluar(i) for i in range(n)]
+        if politica == "TODAS":
+            return variantes, None
+        if politica == "MAS_BARATA":
+            elegida = int(np.argmin([_total(v) for v in variantes]))
+        else:
+            elegida = int(np.argmin(clave()))
+        return variantes, {"variante": variantes[elegida], "evaluadas": n}
+    if politica != "MAS_BARATA":
+        elegida = evaluar(int(np.argmin(clave())))
+        return [elegida], {"variante": elegida, "evaluadas": 1}
+
+    cotas = cota() if cota is not None else np.zeros(n)
+    mejor, mejor_total, evaluadas = None, np.inf, []
+    for i in np.argsort(cotas, kind="stable"):
+        if mejor is not None and cotas[i] >= mejor_total:
+            break
+        variante = evaluar(int(i))
+        evaluadas.append(variante)
+        if mejor is None or _total(variante) < mejor_total:
+            mejor, mejor_total = variante, _total(variante)
+    return evaluadas, {"variante": mejor, "evaluadas": len(evaluadas)}
+
+
+def _agregado_variantes(variantes: list[dict[str, Any]]) -> dict[str, Any]:
+    horas = list(dict.fromkeys(k for v in variantes for k in (v.get("totales") or {})))
+    valores = np.array(
+        [[np.nan if (v.get("totales") or {}).get(k) is None else float(v["totales"][k]) for k in horas] for v in variantes],
+        dtype=float,
+    ).reshape(len(variantes), len(horas))
+    validos = ~np.isnan(valores)
+
+    def _por_hora(funcion) -> dict[str, float | None]:
+        return {
+            k: round(float(funcion(valores[validos[:, j], j])), 2) if validos[:, j].any() else None
+            for j, k in enumerate(horas)
+        }
+
+    return {"variantes": len(variantes), "min": _por_hora(np.min), "max": _por_hora(np.max), "mediana": _por_hora(np.median)}
+
+
+def _adjuntar_variantes(
+    respuesta: dict[str, Any],
+    variantes: list[dict[str, Any]],
+    seleccion: dict[str, Any] | None,
+    *,
+    politica: str,
+    agregar: bool,
+    candidatas: int,
+) -> dict[str, Any]:
+    """`variantes` completas con TODAS; con otra política, solo la elegida al nivel raíz."""
+    if seleccion is None:
+        respuesta["variantes"] = variantes
+    else:
+        elegida = seleccion["variante"]
+        for campo in ("totales", "tramos", "detalle_lookup"):
+            if campo in elegida:
+                respuesta[campo] = elegida[campo]
+        respuesta["seleccion_variante"] = {
+            "politica": politica,
+            "NOMBRE_SICE": elegida.get("NOMBRE_SICE"),
+            "ID_SICE": elegida.get("ID_SICE"),
+            "candidatas": candidatas,
+            "evaluadas": seleccion["evaluadas"],
+        }
+    if agregar:
+        respuesta["agregado_variantes"] = _agregado_variantes(variantes)
+    return respuesta
+
+
+def _entradas_manuales(data: ConsultaInput) -> tuple[dict[str, float], float]:
+    """Distancias por terreno y peaje manuales de la consulta, validados."""
     manual_distancias = {
         "km_plano": float(getattr(data, "km_plano", 0) or 0),
         "km_ondulado": float(getattr(data, "km_ondulado", 0) or 0),
@@ -592,34 +1204,48 @@ def calcular_sicetac(data: ConsultaInput) -> dict:
     manual_peaje = _manual_valor_peaje(data)
     if manual_peaje < 0:
         raise SicetacError(400, "valor_peaje_manual/valor_peajes_manual no puede ser negativo")
+    return manual_distancias, manual_peaje
 
-    if manual_mode:
-        ruta = pd.DataFrame()
-        fila_ruta = None
-        resolved_route = None
-        origen_display = _display_name(data.origen, None)
-        destino_display = _display_name(data.destino, None)
-    else:
-        origen_info, destino_info, resolved_route, origen_display, destino_display = _resolve_route_inputs(data, helper)
-        cod_origen_str = _clean_id(origen_info["codigo_dane"])
-        cod_destino_str = _clean_id(destino_info["codigo_dane"])
-
-        rutas_index = _get_rutas_index(df_rutas)
-        ruta_rows = rutas_index.get((cod_origen_str, cod_destino_str), [])
-        if not ruta_rows:
-            ruta_rows = rutas_index.get((cod_destino_str, cod_origen_str), [])
-        ruta = pd.DataFrame(ruta_rows) if ruta_rows else pd.DataFrame()
-
-        if ruta.empty:
-            if not _has_manual_distances(data):
-                raise SicetacError(404, "Ruta no registrada y no se proporcionaron distancias manuales")
-            fila_ruta = None
-        else:
-            fila_ruta = ruta.iloc[0]
 
-    def _distancias_from_ruta(row):
+@dataclass
+class _CotizacionCarril:
+    """
+    Evaluación por fila de ruta compartida por `calcular_sicetac` y
+    `calcular_sicetac_resumen`: distancias y peaje de cada fila (o los
+    manuales / de la ruta compuesta si la fila es None) y totales H2/H4/H8
+    con el modelo.
+    """
+    data: ConsultaInput
+    mes: int
+    origen: str
+    destino: str
+    manual_distancias: dict[str, float]
+    manual_peaje: float
+    peajes_index: MatrizPeajes
+    ejes: str
+    df_parametros: pd.DataFrame
+    df_costos_fijos: pd.DataFrame
+    df_vehiculos: pd.DataFrame
+    df_rutas: pd.DataFrame
+    df_peajes: pd.DataFrame
+    horas: tuple[int, ...] = (2, 4, 8)
+    ruta_compuesta: dict[str, Any] | None = None
+
+    def componer(self, compuesta: _RutaCompuesta | None) -> None:
+        # Sin ruta directa: km y peaje de la ruta compuesta por tramos.
+        if compuesta is None:
+            return
+        peajes = compuesta.peajes(self.peajes_index, [self.ejes])[:, 0]
+        self.manual_distancias = dict(zip(_DISTANCIAS_TERRENO, compuesta.km_terreno()))
+        self.manual_peaje = float(peajes.sum())
+        self.ruta_compuesta = compuesta.detalle(peajes)
+
+    def tarifa(self) -> TarifaMes:
+        return _get_tarifa_mes(self.df_parametros, self.df_costos_fijos, self.mes, self.df_vehiculos)
+
+    def distancias(self, row: pd.Series | None) -> dict[str, Any]:
         if row is None:
-            return manual_distancias
+            return self.manual_distancias
         return {
             "km_plano": row.get("KM_PLANO", 0),
             "km_ondulado": row.get("KM_ONDULADO", 0),
@@ -628,177 +1254,139 @@ def calcular_sicetac(data: ConsultaInput) -> dict:
             "km_despavimentado": row.get("KM_DESPAVIMENTADO", 0),
         }
 
-    vehiculo_upper = data.vehiculo.strip().upper().replace("C", "")
-    vehiculos_validos = df_vehiculos["TIPO_VEHICULO"].astype(str).str.upper().str.replace("C", "").unique()
-    if vehiculo_upper not in vehiculos_validos:
-        raise SicetacError(
-            400,
-            f"Vehículo '{data.vehiculo}' no encontrado. Opciones válidas: {', '.join(vehiculos_validos)}"
+    def peaje(self, row: pd.Series | None) -> float:
+        if row is None:
+            return float(self.manual_peaje or 0)
+        valor = self.peajes_index.valor(row.get("ID_SICE"), self.ejes)
+        if valor is None:
+            return float(self.manual_peaje or 0)
+        return valor
+
+    def ejecutar_modelo(self, horas_logisticas: float | None, row: pd.Series | None = None) -> dict | None:
+        modelo = (
+            calcular_modelo_sicetac_extendido_vacio
+            if self.data.modo_viaje.upper() == "VACIO"
+            else calcular_modelo_sicetac_extendido
         )
-
-    fila_conf = df_vehiculos[df_vehiculos["TIPO_VEHICULO"] == data.vehiculo].iloc[0]
-    ejes_conf = _clean_id(fila_conf.get("EJES_CONFIGURACION"))
-
-    peajes_index = _get_peajes_index(df_peajes)
-
-    meses_validos = df_parametros["MES"].unique().tolist()
-    if int(mes_usar) not in meses_validos:
-        raise SicetacError(400, f"Mes '{mes_usar}' no válido. Debe ser uno de: {meses_validos}")
-
-    def _peaje_for_ruta(ruta_row) -> float:
-        if ruta_row is None:
-            return float(manual_peaje or 0)
-        id_sice = _clean_id(ruta_row.get("ID_SICE"))
-        valores = peajes_index.get((id_sice, ejes_conf), [])
-        if not valores:
-            return float(manual_peaje or 0)
-        # Si hay múltiples, tomamos el primero (si quieres, puedo cambiar a suma)
-        return float(valores[0])
-
-    def _ejecutar_modelo(horas_logisticas_modelo: float | None, ruta_row=None):
-        distancias = _distancias_from_ruta(ruta_row)
-        valor_peaje_override = _peaje_for_ruta(ruta_row)
-        if data.modo_viaje.upper() == "VACIO":
-            return calcular_modelo_sicetac_extendido_vacio(
-                origen=origen_display,
-                destino=destino_display,
-                configuracion=data.vehiculo,
-                serie=int(mes_usar),
-                distancias=distancias,
-                valor_peaje_manual=data.valor_peaje_manual,
-                matriz_parametros=df_parametros,
-                matriz_costos_fijos=df_costos_fijos,
-                matriz_vehicular=df_vehiculos,
-                rutas_df=df_rutas,
-                peajes_df=df_peajes,
-                carroceria_especial=data.carroceria,
-                ruta_oficial=ruta_row,
-                horas_logisticas=horas_logisticas_modelo,
-                valor_peaje_override=valor_peaje_override,
-            )
-        return calcular_modelo_sicetac_extendido(
-            origen=origen_display,
-            destino=destino_display,
-            configuracion=data.vehiculo,
-            serie=int(mes_usar),
-            distancias=distancias,
-            valor_peaje_manual=data.valor_peaje_manual,
-            matriz_parametros=df_parametros,
-            matriz_costos_fijos=df_costos_fijos,
-            matriz_vehicular=df_vehiculos,
-            rutas_df=df_rutas,
-            peajes_df=df_peajes,
-            carroceria_especial=data.carroceria,
-            ruta_oficial=ruta_row,
-            horas_logisticas=horas_logisticas_modelo,
-            valor_peaje_override=valor_peaje_override,
+        res = modelo(
+            origen=self.origen,
+            destino=self.destino,
+            configuracion=self.data.vehiculo,
+            serie=self.mes,
+            distancias=self.distancias(row),
+            valor_peaje_manual=self.data.valor_peaje_manual,
+            matriz_parametros=self.df_parametros,
+            matriz_costos_fijos=self.df_costos_fijos,
+            matriz_vehicular=self.df_vehiculos,
+            rutas_df=self.df_rutas,
+            peajes_df=self.df_peajes,
+            carroceria_especial=self.data.carroceria,
+            ruta_oficial=row,
+            horas_logisticas=horas_logisticas,
+            valor_peaje_override=self.peaje(row),
         )
-
-    def _normalizar_total(res: dict | None):
-        if res is None:
-            return None
-        if "total_viaje" not in res and "total_viaje_vacio" in res:
+        if res is not None and "total_viaje" not in res and "total_viaje_vacio" in res:
             res["total_viaje"] = res["total_viaje_vacio"]
         return res
 
-    horas_objetivo = [2, 4, 8]
-
-    def _totales_para_ruta(ruta_row):
+    def totales(self, row: pd.Series | None) -> dict[str, float | None]:
         tot = {}
-        for h in horas_objetivo:
-            res = _normalizar_total(_ejecutar_modelo(h, ruta_row=ruta_row))
+        for h in self.horas:
+            res = self.ejecutar_modelo(h, row)
             tot[f"H{h}"] = float(res.get("total_viaje", 0)) if res else None
         return tot
 
-    if ruta.empty:
-        totales = _totales_para_ruta(None)
-        respuesta = {
-            "origen": origen_display,
-            "destino": destino_display,
-            "configuracion": data.vehiculo,
-            "mes": int(mes_usar),
-            "carroceria": data.carroceria,
-            "modo_viaje": data.modo_viaje.upper(),
-            "totales": totales,
-        }
-        if manual_mode:
-            respuesta["manual_mode_applied"] = True
-            respuesta["manual_input"] = {
-                "total_km": round(sum(manual_distancias.values()), 2),
-                "km_plano": manual_distancias["km_plano"],
-                "km_ondulado": manual_distancias["km_ondulado"],
-                "km_montanoso": manual_distancias["km_montanoso"],
-                "km_urbano": manual_distancias["km_urbano"],
-                "km_despavimentado": manual_distancias["km_despavimentado"],
-                "valor_peajes_manual": float(manual_peaje),
-            }
-        if resolved_route:
-            _attach_resolved_route(respuesta, resolved_route)
-        return respuesta
-
-    if len(ruta) == 1:
-        totales = _totales_para_ruta(fila_ruta)
-        respuesta = {
-            "origen": origen_display,
-            "destino": destino_display,
-            "configuracion": data.vehiculo,
-            "mes": int(mes_usar),
-            "carroceria": data.carroceria,
-            "modo_viaje": data.modo_viaje.upper(),
-            "totales": totales,
-        }
-        if manual_mode:
-            respuesta["manual_mode_applied"] = True
-            respuesta["manual_input"] = {
-                "total_km": round(sum(manual_distancias.values()), 2),
-                "km_plano": manual_distancias["km_plano"],
-                "km_ondulado": manual_distancias["km_ondulado"],
-                "km_montanoso": manual_distancias["km_montanoso"],
-                "km_urbano": manual_distancias["km_urbano"],
-                "km_despavimentado": manual_distancias["km_despavimentado"],
-                "valor_peajes_manual": float(manual_peaje),
-            }
-        if resolved_route:
-            _attach_resolved_route(respuesta, resolved_route)
-        return respuesta
-
-    variantes = []
-    for _, r in ruta.iterrows():
-        variantes.append({
-            "NOMBRE_SICE": r.get("NOMBRE_SICE"),
-            "ID_SICE": r.get("ID_SICE"),
-            "totales": _totales_para_ruta(r),
-        })
+    def resultado(
+        self,
+        row: pd.Series | None,
+        totales_cubo: Callable[[str], dict[str, float] | None] | None = None,
+    ) -> dict[str, Any]:
+        if self.data.modo_viaje.upper() != MODO_IDA_VUELTA:
+            return {"totales": self.totales(row)}
+        return _tramos_ida_vuelta(
+            self.tarifa(),
+            vehiculo=self.data.vehiculo,
+            carroceria=self.data.carroceria,
+            distancias=self.distancias(row),
+            peaje=self.peaje(row),
+            horas=list(self.horas),
+            totales_cubo=totales_cubo,
+        )
 
+
+def _responder_carril(
+    cotizacion: _CotizacionCarril,
+    ruta: pd.DataFrame,
+    *,
+    resultado_para_ruta: Callable[[pd.Series | None], dict[str, Any]],
+    politica: str,
+    manual_mode: bool,
+    resolved_route: dict[str, Any] | None,
+) -> dict[str, Any]:
+    """
+    Respuesta evaluada por filas de ruta: sin ruta (manual o compuesta) o con
+    una sola, el resultado va al nivel raíz; con varias, las variantes según
+    `politica_variantes`.
+    """
+    data = cotizacion.data
     respuesta = {
-        "origen": origen_display,
-        "destino": destino_display,
+        "origen": cotizacion.origen,
+        "destino": cotizacion.destino,
         "configuracion": data.vehiculo,
-        "mes": int(mes_usar),
+        "mes": cotizacion.mes,
         "carroceria": data.carroceria,
         "modo_viaje": data.modo_viaje.upper(),
-        "variantes": variantes,
     }
+    if len(ruta) <= 1:
+        respuesta.update(resultado_para_ruta(None if ruta.empty else ruta.iloc[0]))
+    else:
+        filas = [r for _, r in ruta.iterrows()]
+        km_filas = np.array([_km_fila_ruta(r) for r in filas], dtype=float)
+        variantes, seleccion = _seleccionar_variantes(
+            len(filas),
+            politica=politica,
+            agregar=data.agregar_variantes,
+            evaluar=lambda i: {
+                "NOMBRE_SICE": filas[i].get("NOMBRE_SICE"),
+                "ID_SICE": filas[i].get("ID_SICE"),
+                **resultado_para_ruta(filas[i]),
+            },
+            clave=lambda: _clave_variantes(politica, km_filas, cotizacion.tarifa(), data.vehiculo, data.modo_viaje.upper()),
+            cota=lambda: _cota_variantes(
+                km_filas,
+                [cotizacion.peaje(r) for r in filas],
+                cotizacion.tarifa(),
+                data.vehiculo,
+                data.modo_viaje.upper(),
+            ),
+            hora=f"H{cotizacion.horas[0]}",
+        )
+        _adjuntar_variantes(
+            respuesta,
+            variantes,
+            seleccion,
+            politica=politica,
+            agregar=data.agregar_variantes,
+            candidatas=len(filas),
+        )
     if manual_mode:
         respuesta["manual_mode_applied"] = True
         respuesta["manual_input"] = {
-            "total_km": round(sum(manual_distancias.values()), 2),
-            "km_plano": manual_distancias["km_plano"],
-            "km_ondulado": manual_distancias["km_ondulado"],
-            "km_montanoso": manual_distancias["km_montanoso"],
-            "km_urbano": manual_distancias["km_urbano"],
-            "km_despavimentado": manual_distancias["km_despavimentado"],
-            "valor_peajes_manual": float(manual_peaje),
+            "total_km": round(sum(cotizacion.manual_distancias.values()), 2),
+            **cotizacion.manual_distancias,
+            "valor_peajes_manual": float(cotizacion.manual_peaje),
         }
+    if cotizacion.ruta_compuesta:
+        respuesta["ruta_compuesta"] = cotizacion.ruta_compuesta
     if resolved_route:
         _attach_resolved_route(respuesta, resolved_route)
     return respuesta
 
 
-def calcular_sicetac_resumen(data: ConsultaInput) -> dict:
-    """
-    Calcula totales para 2, 4 y 8 horas logísticas con respuesta mínima.
-    """
+def calcular_sicetac(data: ConsultaInput) -> dict:
+    if _es_consulta_flota(data):
+        return calcular_flota(data)
+    politica = _politica_variantes(data)
     _refresh_cache()
     (
         df_municipios,
@@ -814,7 +1402,7 @@ def calcular_sicetac_resumen(data: ConsultaInput) -> dict:
     if df_municipios.empty or df_vehiculos.empty or df_parametros.empty or df_costos_fijos.empty or df_peajes.empty or df_rutas.empty:
         raise SicetacError(500, "Tablas de Supabase no disponibles o vacías. Verifica conexión y datos.")
 
-    helper = SICETACHelper(df_municipios)
+    helper = _helper_municipios(df_municipios)
 
     mes_usar = data.mes
     if mes_usar is None:
@@ -823,73 +1411,105 @@ def calcular_sicetac_resumen(data: ConsultaInput) -> dict:
         raise SicetacError(500, "No se pudo determinar el MES más reciente.")
 
     manual_mode = bool(getattr(data, "manual_mode", False))
-    manual_distancias = {
-        "km_plano": float(getattr(data, "km_plano", 0) or 0),
-        "km_ondulado": float(getattr(data, "km_ondulado", 0) or 0),
-        "km_montanoso": float(_manual_km_montanoso(data) or 0),
-        "km_urbano": float(getattr(data, "km_urbano", 0) or 0),
-        "km_despavimentado": float(getattr(data, "km_despavimentado", 0) or 0),
-    }
+    manual_distancias, manual_peaje = _entradas_manuales(data)
 
-    for _k, _v in manual_distancias.items():
-        if _v < 0:
-            raise SicetacError(400, f"Distancia manual inválida en {_k}: no puede ser negativa")
+    rutas = _rutas_consulta(data, helper, df_rutas)
+    ruta = pd.DataFrame([fila for fila in rutas.filas if fila is not None])
 
-    manual_peaje = _manual_valor_peaje(data)
-    if manual_peaje < 0:
-        raise SicetacError(400, "valor_peaje_manual/valor_peajes_manual no puede ser negativo")
+    registro = _resolver_vehiculo(data.vehiculo)
+    data = data.model_copy(update={"vehiculo": registro.tipo})
 
-    if manual_mode:
-        ruta = pd.DataFrame()
-        fila_ruta = None
-        resolved_route = None
-        origen_display = _display_name(data.origen, None)
-        destino_display = _display_name(data.destino, None)
-    else:
-        origen_info, destino_info, resolved_route, origen_display, destino_display = _resolve_route_inputs(data, helper)
-        cod_origen_str = _clean_id(origen_info["codigo_dane"])
-        cod_destino_str = _clean_id(destino_info["codigo_dane"])
-
-        rutas_index = _get_rutas_index(df_rutas)
-        ruta_rows = rutas_index.get((cod_origen_str, cod_destino_str), [])
-        if not ruta_rows:
-            ruta_rows = rutas_index.get((cod_destino_str, cod_origen_str), [])
-        ruta = pd.DataFrame(ruta_rows) if ruta_rows else pd.DataFrame()
-
-        if ruta.empty:
-            if not _has_manual_distances(data):
-                raise SicetacError(404, "Ruta no registrada y no se proporcionaron distancias manuales")
-            fila_ruta = None
-        else:
-            fila_ruta = ruta.iloc[0]
+    meses_validos = _meses_disponibles(df_parametros)
+    if int(mes_usar) not in meses_validos:
+        raise SicetacError(400, f"Mes '{mes_usar}' no válido. Debe ser uno de: {meses_validos}")
 
-    def _distancias_from_ruta(row):
-        if row is None:
-            return manual_distancias
-        return {
-            "km_plano": row.get("KM_PLANO", 0),
-            "km_ondulado": row.get("KM_ONDULADO", 0),
-            "km_montanoso": row.get("KM_MONTAÑOSO", 0),
-            "km_urbano": row.get("KM_URBANO", 0),
-            "km_despavimentado": row.get("KM_DESPAVIMENTADO", 0),
-        }
+    cotizacion = _CotizacionCarril(
+        data=data,
+        mes=int(mes_usar),
+        origen=rutas.origen,
+        destino=rutas.destino,
+        manual_distancias=manual_distancias,
+        manual_peaje=manual_peaje,
+        peajes_index=_get_peajes_index(df_peajes),
+        ejes=registro.ejes,
+        df_parametros=df_parametros,
+        df_costos_fijos=df_costos_fijos,
+        df_vehiculos=df_vehiculos,
+        df_rutas=df_rutas,
+        df_peajes=df_peajes,
+    )
+    cotizacion.componer(rutas.compuesta)
+    return _responder_carril(
+        cotizacion,
+        ruta,
+        resultado_para_ruta=cotizacion.resultado,
+        politica=politica,
+        manual_mode=manual_mode,
+        resolved_route=rutas.resolved_route,
+    )
 
-    vehiculo_upper = data.vehiculo.strip().upper().replace("C", "")
-    vehiculos_validos = df_vehiculos["TIPO_VEHICULO"].astype(str).str.upper().str.replace("C", "").unique()
-    if vehiculo_upper not in vehiculos_validos:
-        raise SicetacError(
-            400,
-            f"Vehículo '{data.vehiculo}' no encontrado. Opciones válidas: {', '.join(vehiculos_validos)}"
-        )
 
-    meses_validos = df_parametros["MES"].unique().tolist()
+def calcular_sicetac_resumen(data: ConsultaInput, adjuntar_valor_plaza: bool = True) -> dict:
+    """
+    Calcula totales para 2, 4 y 8 horas logísticas con respuesta mínima.
+    """
+    if _es_consulta_flota(data):
+        return calcular_flota(data, adjuntar_valor_plaza=adjuntar_valor_plaza)
+    politica = _politica_variantes(data)
+    _refresh_cache()
+    (
+        df_municipios,
+        df_vehiculos,
+        df_parametros,
+        df_costos_fijos,
+        df_peajes,
+        df_rutas,
+        df_sicetac_movilizacion,
+        df_sicetac_valorhora,
+    ) = _get_dataframes()
+
+    if df_municipios.empty or df_vehiculos.empty or df_parametros.empty or df_costos_fijos.empty or df_peajes.empty or df_rutas.empty:
+        raise SicetacError(500, "Tablas de Supabase no disponibles o vacías. Verifica conexión y datos.")
+
+    helper = _helper_municipios(df_municipios)
+
+    mes_usar = data.mes
+    if mes_usar is None:
+        mes_usar = _latest_mes(df_parametros)
+    if mes_usar is None:
+        raise SicetacError(500, "No se pudo determinar el MES más reciente.")
+
+    manual_mode = bool(getattr(data, "manual_mode", False))
+    manual_distancias, manual_peaje = _entradas_manuales(data)
+
+    rutas = _rutas_consulta(data, helper, df_rutas)
+    resolved_route, origen_display, destino_display = rutas.resolved_route, rutas.origen, rutas.destino
+    ruta = pd.DataFrame([fila for fila in rutas.filas if fila is not None])
+
+    registro = _resolver_vehiculo(data.vehiculo)
+    data = data.model_copy(update={"vehiculo": registro.tipo})
+
+    meses_validos = _meses_disponibles(df_parametros)
     if int(mes_usar) not in meses_validos:
         raise SicetacError(400, f"Mes '{mes_usar}' no válido. Debe ser uno de: {meses_validos}")
 
-    fila_conf = df_vehiculos[df_vehiculos["TIPO_VEHICULO"] == data.vehiculo].iloc[0]
-    ejes_conf = _clean_id(fila_conf.get("EJES_CONFIGURACION"))
-    configuracion_lookup = _configuracion_lookup(fila_conf, data.vehiculo)
-    peajes_index = _get_peajes_index(df_peajes)
+    configuracion_lookup = registro.configuracion_lookup
+    cotizacion = _CotizacionCarril(
+        data=data,
+        mes=int(mes_usar),
+        origen=origen_display,
+        destino=destino_display,
+        manual_distancias=manual_distancias,
+        manual_peaje=manual_peaje,
+        peajes_index=_get_peajes_index(df_peajes),
+        ejes=registro.ejes,
+        df_parametros=df_parametros,
+        df_costos_fijos=df_costos_fijos,
+        df_vehiculos=df_vehiculos,
+        df_rutas=df_rutas,
+        df_peajes=df_peajes,
+    )
+    cotizacion.componer(rutas.compuesta)
 
     if (
         not manual_mode
@@ -898,11 +1518,16 @@ def calcular_sicetac_resumen(data: ConsultaInput) -> dict:
         and not ruta.empty
     ):
         route_metadata = _route_metadata_map(ruta)
+        # Sin índice de valor plaza en memoria, el valor plaza viaja en la misma llamada del lookup.
+        route_code_plaza = None
+        if adjuntar_valor_plaza and resolved_route and _get_valor_plaza_store() is None:
+            route_code_plaza = resolved_route.get("route_code")
         lookup_rows = _lookup_sicetac_totales(
-            cod_origen_str=cod_origen_str,
-            cod_destino_str=cod_destino_str,
+            cod_origen_str=rutas.cod_origen,
+            cod_destino_str=rutas.cod_destino,
             configuracion_lookup=configuracion_lookup,
             carroceria=data.carroceria,
+            route_code=route_code_plaza,
         )
         if lookup_rows:
             if len(lookup_rows) == 1:
@@ -928,12 +1553,13 @@ def calcular_sicetac_resumen(data: ConsultaInput) -> dict:
                 }
                 if resolved_route:
                     _attach_resolved_route(respuesta, resolved_route)
-                _attach_valor_plaza(
-                    respuesta,
-                    resolved_route=resolved_route,
-                    configuracion_lookup=configuracion_lookup,
-                    carroceria=data.carroceria,
-                )
+                if adjuntar_valor_plaza:
+                    _attach_valor_plaza(
+                        respuesta,
+                        resolved_route=resolved_route,
+                        configuracion_lookup=configuracion_lookup,
+                        carroceria=data.carroceria,
+                    )
                 return respuesta
 
             variantes = []
@@ -953,6 +1579,23 @@ def calcular_sicetac_resumen(data: ConsultaInput) -> dict:
                     },
                 })
 
+            # Los totales del lookup ya están calculados; km por ID_SICE para MAS_CORTA/MAS_RAPIDA.
+            km_por_id = {_clean_id(r.get("ID_SICE")): _km_fila_ruta(r) for _, r in ruta.iterrows()}
+            km_lookup = np.array([km_por_id.get(_clean_id(v["ID_SICE"]), [np.inf] * len(KM_COLUMNAS)) for v in variantes], dtype=float)
+            candidatas = variantes
+            variantes, seleccion = _seleccionar_variantes(
+                len(candidatas),
+                politica=politica,
+                agregar=data.agregar_variantes,
+                evaluar=lambda i: candidatas[i],
+                clave=lambda: _clave_variantes(
+                    politica,
+                    km_lookup,
+                    _get_tarifa_mes(df_parametros, df_costos_fijos, int(mes_usar), df_vehiculos),
+                    data.vehiculo,
+                    data.modo_viaje.upper(),
+                ),
+            )
             respuesta = {
                 "origen": origen_display,
                 "destino": destino_display,
@@ -962,193 +1605,1086 @@ def calcular_sicetac_resumen(data: ConsultaInput) -> dict:
                 "carroceria": data.carroceria,
                 "modo_viaje": data.modo_viaje.upper(),
                 "metodo": "lookup_consolidado",
-                "variantes": variantes,
             }
+            _adjuntar_variantes(
+                respuesta,
+                variantes,
+                seleccion,
+                politica=politica,
+                agregar=data.agregar_variantes,
+                candidatas=len(candidatas),
+            )
             if resolved_route:
                 _attach_resolved_route(respuesta, resolved_route)
-            _attach_valor_plaza(
-                respuesta,
-                resolved_route=resolved_route,
-                configuracion_lookup=configuracion_lookup,
-                carroceria=data.carroceria,
-            )
+            if adjuntar_valor_plaza:
+                _attach_valor_plaza(
+                    respuesta,
+                    resolved_route=resolved_route,
+                    configuracion_lookup=configuracion_lookup,
+                    carroceria=data.carroceria,
+                )
             return respuesta
 
-    def _peaje_for_ruta(ruta_row) -> float:
-        if ruta_row is None:
-            return float(manual_peaje or 0)
-        id_sice = _clean_id(ruta_row.get("ID_SICE"))
-        valores = peajes_index.get((id_sice, ejes_conf), [])
-        if not valores:
-            return float(manual_peaje or 0)
-        return float(valores[0])
-
-    def _ejecutar_modelo(horas_logisticas_modelo: float | None, ruta_row=None):
-        distancias = _distancias_from_ruta(ruta_row)
-        valor_peaje_override = _peaje_for_ruta(ruta_row)
-        if data.modo_viaje.upper() == "VACIO":
-            return calcular_modelo_sicetac_extendido_vacio(
-                origen=origen_display,
-                destino=destino_display,
-                configuracion=data.vehiculo,
-                serie=int(mes_usar),
-                distancias=distancias,
-                valor_peaje_manual=data.valor_peaje_manual,
-                matriz_parametros=df_parametros,
-                matriz_costos_fijos=df_costos_fijos,
-                matriz_vehicular=df_vehiculos,
-                rutas_df=df_rutas,
-                peajes_df=df_peajes,
-                carroceria_especial=data.carroceria,
-                ruta_oficial=ruta_row,
-                horas_logisticas=horas_logisticas_modelo,
-                valor_peaje_override=valor_peaje_override,
-            )
-        return calcular_modelo_sicetac_extendido(
-            origen=origen_display,
-            destino=destino_display,
-            configuracion=data.vehiculo,
-            serie=int(mes_usar),
-            distancias=distancias,
-            valor_peaje_manual=data.valor_peaje_manual,
-            matriz_parametros=df_parametros,
-            matriz_costos_fijos=df_costos_fijos,
-            matriz_vehicular=df_vehiculos,
-            rutas_df=df_rutas,
-            peajes_df=df_peajes,
-            carroceria_especial=data.carroceria,
-            ruta_oficial=ruta_row,
-            horas_logisticas=horas_logisticas_modelo,
-            valor_peaje_override=valor_peaje_override,
-        )
+    horas_objetivo = list(cotizacion.horas)
+    cubo = _get_cubo() if not manual_mode and not cotizacion.manual_peaje else None
+    # Meses cerrados: resultados persistidos fuera del ciclo de refresh.
+    cerrados = None
+    if _USE_MESES_CERRADOS and not manual_mode and int(mes_usar) < meses_validos[-1]:
+        cerrados = resultados_cerrados.get_store()
 
-    def _normalizar_total(res: dict | None):
-        if res is None:
+    def _clave_cerrado(ruta_row, modo: str) -> dict[str, Any] | None:
+        if cerrados is None or ruta_row is None:
             return None
-        if "total_viaje" not in res and "total_viaje_vacio" in res:
-            res["total_viaje"] = res["total_viaje_vacio"]
-        return res
-
-    horas_objetivo = [2, 4, 8]
+        return {
+            "mes": int(mes_usar),
+            "carril": "|".join(_clean_id(ruta_row.get(c)) for c in ("CODIGO_DANE_ORIGEN", "CODIGO_DANE_DESTINO", "ID_SICE")),
+            "vehiculo": data.vehiculo,
+            "carroceria": normalizar_carroceria(data.carroceria),
+            "modo": modo,
+            "huella": resultados_cerrados.huella_entradas(cotizacion.distancias(ruta_row), cotizacion.peaje(ruta_row)),
+        }
 
     def _totales_para_ruta(ruta_row):
-        tot = {}
-        for h in horas_objetivo:
-            res = _normalizar_total(_ejecutar_modelo(h, ruta_row=ruta_row))
-            tot[f"H{h}"] = float(res.get("total_viaje", 0)) if res else None
+        if cubo is not None and ruta_row is not None and cubo.mes == int(mes_usar):
+            tot = cubo.totales_para(
+                cod_origen=ruta_row.get("CODIGO_DANE_ORIGEN"),
+                cod_destino=ruta_row.get("CODIGO_DANE_DESTINO"),
+                id_sice=ruta_row.get("ID_SICE"),
+                vehiculo=data.vehiculo,
+                carroceria=data.carroceria,
+                modo=data.modo_viaje,
+                horas=horas_objetivo,
+            )
+            if tot is not None:
+                return tot
+        clave = _clave_cerrado(ruta_row, data.modo_viaje.upper())
+        if clave is not None:
+            tot = cerrados.obtener(**clave, horas=horas_objetivo)
+            if tot is not None:
+                return tot
+        tot = cotizacion.totales(ruta_row)
+        if clave is not None:
+            cerrados.guardar(**clave, totales={h: tot[f"H{h}"] for h in horas_objetivo})
         return tot
 
-    if ruta.empty:
-        totales = _totales_para_ruta(None)
-        respuesta = {
-            "origen": origen_display,
-            "destino": destino_display,
-            "configuracion": data.vehiculo,
-            "mes": int(mes_usar),
-            "carroceria": data.carroceria,
-            "modo_viaje": data.modo_viaje.upper(),
-            "totales": totales,
-        }
-        if manual_mode:
-            respuesta["manual_mode_applied"] = True
-            respuesta["manual_input"] = {
-                "total_km": round(sum(manual_distancias.values()), 2),
-                "km_plano": manual_distancias["km_plano"],
-                "km_ondulado": manual_distancias["km_ondulado"],
-                "km_montanoso": manual_distancias["km_montanoso"],
-                "km_urbano": manual_distancias["km_urbano"],
-                "km_despavimentado": manual_distancias["km_despavimentado"],
-                "valor_peajes_manual": float(manual_peaje),
+    def _resultado_para_ruta(ruta_row) -> dict[str, Any]:
+        if data.modo_viaje.upper() != MODO_IDA_VUELTA:
+            return {"totales": _totales_para_ruta(ruta_row)}
+        modos_cerrados: set[str] = set()
+        totales_cubo = None
+        if cubo is not None and ruta_row is not None and cubo.mes == int(mes_usar):
+            def totales_cubo(modo: str):
+                return cubo.totales_para(
+                    cod_origen=ruta_row.get("CODIGO_DANE_ORIGEN"),
+                    cod_destino=ruta_row.get("CODIGO_DANE_DESTINO"),
+                    id_sice=ruta_row.get("ID_SICE"),
+                    vehiculo=data.vehiculo,
+                    carroceria=data.carroceria,
+                    modo=modo,
+                    horas=horas_objetivo,
+                )
+        elif _clave_cerrado(ruta_row, MODO_IDA_VUELTA) is not None:
+            def totales_cubo(modo: str):
+                tot = cerrados.obtener(**_clave_cerrado(ruta_row, modo), horas=horas_objetivo)
+                if tot is not None:
+                    modos_cerrados.add(modo)
+                return tot
+        resultado = cotizacion.resultado(ruta_row, totales_cubo=totales_cubo)
+        for tramo in resultado["tramos"].values():
+            clave = _clave_cerrado(ruta_row, tramo["modo_viaje"])
+            if clave is not None and tramo["modo_viaje"] not in modos_cerrados:
+                cerrados.guardar(**clave, totales={h: tramo["totales"][f"H{h}"] for h in horas_objetivo})
+        return resultado
+
+    respuesta = _responder_carril(
+        cotizacion,
+        ruta,
+        resultado_para_ruta=_resultado_para_ruta,
+        politica=politica,
+        manual_mode=manual_mode,
+        resolved_route=resolved_route,
+    )
+    if adjuntar_valor_plaza:
+        _attach_valor_plaza(
+            respuesta,
+            resolved_route=resolved_route,
+            configuracion_lookup=configuracion_lookup,
+            carroceria=data.carroceria,
+        )
+    return respuesta
+
+
+def _es_consulta_flota(data: ConsultaInput) -> bool:
+    return bool(data.vehiculos) or str(data.vehiculo or "").strip() == "*"
+
+
+def calcular_flota(data: ConsultaInput, adjuntar_valor_plaza: bool = True) -> dict:
+    """
+    Totales H2/H4/H8 de un carril para todas las configuraciones vehiculares
+    (`vehiculo="*"`) o las de `vehiculos`. La ruta se resuelve una vez, el
+    peaje de cada configuración sale del índice por EJES_CONFIGURACION y
+    rutas × vehículos × horas se evalúan en una pasada. Cada variante de ruta
+    lista los vehículos ordenados por total H2.
+    """
+    _refresh_cache()
+    (
+        df_municipios,
+        df_vehiculos,
+        df_parametros,
+        df_costos_fijos,
+        df_peajes,
+        df_rutas,
+        _,
+        _,
+    ) = _get_dataframes()
+    if df_municipios.empty or df_vehiculos.empty or df_parametros.empty or df_costos_fijos.empty or df_peajes.empty or df_rutas.empty:
+        raise SicetacError(500, "Tablas de Supabase no disponibles o vacías. Verifica conexión y datos.")
+
+    mes = data.mes if data.mes is not None else _latest_mes(df_parametros)
+    if mes is None:
+        raise SicetacError(500, "No se pudo determinar el MES más reciente.")
+    meses_validos = _meses_disponibles(df_parametros)
+    if int(mes) not in meses_validos:
+        raise SicetacError(400, f"Mes '{mes}' no válido. Debe ser uno de: {meses_validos}")
+    modo = data.modo_viaje.upper()
+    if modo not in (*MODOS, MODO_IDA_VUELTA):
+        raise SicetacError(400, f"modo_viaje '{data.modo_viaje}' no soportado")
+
+    tarifa = _get_tarifa_mes(df_parametros, df_costos_fijos, int(mes), df_vehiculos)
+    costo_fijo_tarifa = tarifa.costo_fijo_para(data.carroceria)
+    if data.vehiculos:
+        registry = _get_vehicle_registry()
+        pedidos = [(v, registry.resolver(v)) for v in data.vehiculos]
+        desconocidos = [v for v, r in pedidos if r is None or r.tipo not in tarifa.posiciones]
+        if desconocidos:
+            raise SicetacError(
+                400,
+                f"Vehículos sin parámetros para el MES {mes}: {', '.join(desconocidos)}. Opciones válidas: {', '.join(tarifa.vehiculos)}",
+            )
+        vehiculos = list(dict.fromkeys(r.tipo for _, r in pedidos))
+    else:
+        vehiculos = list(tarifa.vehiculos)
+    # Sin costo fijo para la carrocería (o sin parámetros) no hay tarifa.
+    sin_tarifa = [
+        v for v in vehiculos
+        if np.isnan(costo_fijo_tarifa[tarifa.posiciones[v]]) or np.isnan(tarifa.valor_acpm[tarifa.posiciones[v]])
+    ]
+    vehiculos = [v for v in vehiculos if v not in sin_tarifa]
+    if not vehiculos:
+        raise SicetacError(400, f"No se encontró costo fijo para ningún vehículo - {mes} - {normalizar_carroceria(data.carroceria)}")
+    idx = np.array([tarifa.posiciones[v] for v in vehiculos], dtype=int)
+
+    helper = _helper_municipios(df_municipios)
+    rutas = _rutas_consulta(data, helper, df_rutas)
+    ruta_rows, resolved_route = rutas.filas, rutas.resolved_route
+    peajes_index = _get_peajes_index(df_peajes)
+    ejes_vehiculo = _get_vehicle_registry().ejes
+    ejes_flota = [ejes_vehiculo.get(v, "") for v in vehiculos]
+
+    if rutas.compuesta is not None:
+        # Sin ruta directa: una sola "variante" con la ruta compuesta por tramos.
+        km = np.array([rutas.compuesta.km_terreno()], dtype=float)
+        peajes = rutas.compuesta.peajes(peajes_index, ejes_flota).sum(axis=0, keepdims=True)
+    else:
+        km = np.array([_km_manual(data) if row is None else _km_fila_ruta(row) for row in ruta_rows], dtype=float)
+        peajes = peajes_index.matriz(
+            [None if row is None else row.get("ID_SICE") for row in ruta_rows],
+            ejes_flota,
+            faltante=_manual_valor_peaje(data),
+        )
+
+    horas = [2, 4, 8]
+    modos = [m for _, m in _TRAMOS_IDA_VUELTA] if modo == MODO_IDA_VUELTA else [modo]
+    totales = sum(
+        evaluar_totales_carrocerias(
+            tarifa,
+            km=km,
+            peajes=peajes,
+            horas=horas,
+            costo_fijo=costo_fijo_tarifa[idx][None, :],
+            modo=m,
+            idx_vehiculos=idx,
+        )[0]
+        for m in modos
+    )
+    totales = np.round(totales, 2)
+
+    plaza_por_vehiculo: dict[str, dict[str, Any] | None] = {}
+    route_code = (resolved_route or {}).get("route_code")
+    if adjuntar_valor_plaza and route_code:
+        configuraciones = [_configuracion_lookup_vehiculo(v) for v in vehiculos]
+        plazas = _build_valor_plaza_lote([(route_code, c, data.carroceria) for c in configuraciones])
+        plaza_por_vehiculo = dict(zip(vehiculos, plazas))
+
+    def _flota(r: int) -> list[dict[str, Any]]:
+        orden = np.argsort(totales[r, :, 0], kind="stable")
+        flota = []
+        for v in orden:
+            vehiculo = vehiculos[v]
+            item = {
+                "vehiculo": vehiculo,
+                "ejes_configuracion": ejes_vehiculo.get(vehiculo) or None,
+                "totales": {f"H{h}": float(totales[r, v, i]) for i, h in enumerate(horas)},
             }
-        if resolved_route:
-            _attach_resolved_route(respuesta, resolved_route)
-        _attach_valor_plaza(
-            respuesta,
-            resolved_route=resolved_route,
-            configuracion_lookup=configuracion_lookup,
-            carroceria=data.carroceria,
-        )
-        return respuesta
-
-    if len(ruta) == 1:
-        totales = _totales_para_ruta(fila_ruta)
-        respuesta = {
-            "origen": origen_display,
-            "destino": destino_display,
-            "configuracion": data.vehiculo,
-            "mes": int(mes_usar),
-            "carroceria": data.carroceria,
-            "modo_viaje": data.modo_viaje.upper(),
-            "totales": totales,
+            if plaza_por_vehiculo.get(vehiculo):
+                item["valor_plaza"] = plaza_por_vehiculo[vehiculo]
+            flota.append(item)
+        return flota
+
+    respuesta: dict[str, Any] = {
+        "origen": rutas.origen,
+        "destino": rutas.destino,
+        "mes": int(mes),
+        "carroceria": data.carroceria,
+        "modo_viaje": modo,
+    }
+    if rutas.compuesta is not None:
+        respuesta["ruta_compuesta"] = rutas.compuesta.detalle()
+    if len(ruta_rows) == 1:
+        respuesta["flota"] = _flota(0)
+    else:
+        respuesta["variantes"] = [
+            {"NOMBRE_SICE": row.get("NOMBRE_SICE"), "ID_SICE": row.get("ID_SICE"), "flota": _flota(r)}
+            for r, row in enumerate(ruta_rows)
+        ]
+    if sin_tarifa:
+        respuesta["sin_tarifa"] = sin_tarifa
+    if data.manual_mode:
+        respuesta["manual_mode_applied"] = True
+    if resolved_route:
+        _attach_resolved_route(respuesta, resolved_route)
+    return respuesta
+
+
+class ConsultaLoteInput(BaseModel):
+    consultas: list[ConsultaInput]
+
+
+class EscenarioInput(BaseModel):
+    nombre: str | None = None
+    # Precio absoluto del galón ACPM o variación % sobre el del MES.
+    valor_acpm: float | None = None
+    acpm_pct: float | None = None
+    # Costo variable por km absoluto o variación %.
+    costos_variables: float | None = None
+    costos_variables_pct: float | None = None
+    factor_peajes: float | None = None
+    # None = default del modelo (4/8 h cargado, 0 h vacío).
+    horas_logisticas: float | None = None
+
+
+class SensibilidadInput(BaseModel):
+    consultas: list[ConsultaInput]
+    escenarios: list[EscenarioInput] = []
+    # Producto cartesiano de valores por campo de EscenarioInput,
+    # p. ej. {"acpm_pct": [5, 10, 15], "factor_peajes": [1, 1.1]}.
+    grilla: dict[str, list[float]] = {}
+    incluir_base: bool = True
+
+
+class HistorialInput(BaseModel):
+    consultas: list[ConsultaInput]
+    # Últimos N meses disponibles (None = todos), acotados por desde/hasta (YYYYMM).
+    meses: int | None = None
+    desde: int | None = None
+    hasta: int | None = None
+    horas: list[int] = [2, 4, 8]
+    incluir_valor_plaza: bool = True
+
+
+class ParadaInput(BaseModel):
+    municipio: str | None = None
+    codigo_dane: str | None = None
+    departamento: str | None = None
+    # Cargue/descargue en la parada; None = default del modelo.
+    horas_logisticas: float | None = None
+
+
+class ViajeInput(BaseModel):
+    paradas: list[ParadaInput]
+    vehiculo: str = "C3S3"
+    carroceria: str = "GENERAL"
+    mes: int | None = None
+    modo_viaje: str = "CARGADO"
+    # Variante de ruta que fija el total de cada tramo (ver ConsultaInput).
+    politica_variantes: str = "TODAS"
+
+
+def _configuracion_lookup_vehiculo(vehiculo: str) -> str | None:
+    registro = _get_vehicle_registry().resolver(vehiculo)
+    return registro.configuracion_lookup if registro is not None else None
+
+
+def _precargar_lookups(consultas: list[ConsultaInput]) -> None:
+    """
+    Trae en una sola llamada combinada los lookups del consolidado de los
+    carriles del lote que irán por esa vía; cada consulta los lee del cache.
+    """
+    if not _USE_CONSOLIDATED_LOOKUP:
+        return
+    df_municipios, _, _, _, _, df_rutas, _, _ = _get_dataframes()
+    if df_municipios.empty or df_rutas.empty:
+        return
+    helper = _helper_municipios(df_municipios)
+    rutas_index = _get_rutas_index(df_rutas)
+    carriles = []
+    for data in consultas:
+        if data.manual_mode or _es_consulta_flota(data) or data.modo_viaje.upper() != "CARGADO":
+            continue
+        if not _carroceria_option(data.carroceria):
+            continue
+        try:
+            origen_info, destino_info, _, _, _ = _resolve_route_inputs(data, helper)
+        except SicetacError:
+            continue
+        cod_origen = _clean_id(origen_info["codigo_dane"])
+        cod_destino = _clean_id(destino_info["codigo_dane"])
+        if not (rutas_index.get((cod_origen, cod_destino)) or rutas_index.get((cod_destino, cod_origen))):
+            continue
+        configuracion = _configuracion_lookup_vehiculo(data.vehiculo)
+        if configuracion:
+            carriles.append((cod_origen, cod_destino, configuracion, None))
+    if carriles:
+        get_lookup_carriles(carriles)
+
+
+def calcular_sicetac_lote(consultas: list[ConsultaInput]) -> dict:
+    """
+    Resumen para varias consultas. El valor plaza de todos los carriles se
+    adjunta al final con una sola búsqueda sobre el índice en memoria; en las
+    consultas de flota va en cada ítem de `flota`, uno por vehículo.
+    """
+    if len(consultas) > _LOTE_MAX:
+        raise SicetacError(400, f"Máximo {_LOTE_MAX} consultas por lote")
+    _refresh_cache()
+    _precargar_lookups(consultas)
+
+    resultados: list[dict[str, Any]] = []
+    plaza_consultas: list[tuple[str | None, str | None, str | None]] = []
+    plaza_destinos: list[list[dict[str, Any]]] = []
+    for data in consultas:
+        try:
+            respuesta = calcular_sicetac_resumen(data, adjuntar_valor_plaza=False)
+        except SicetacError as ex:
+            resultados.append({"error": ex.detail, "status_code": ex.status_code})
+            continue
+        except Exception as e:
+            # Un error del modelo en un carril (p. ej. sin costo fijo) no tumba el lote.
+            resultados.append({"error": str(e), "status_code": 500})
+            continue
+        resultados.append(respuesta)
+        route_code = (respuesta.get("resolved_route") or {}).get("route_code")
+        if not route_code:
+            continue
+        if _es_consulta_flota(data):
+            items_por_vehiculo: dict[str, list[dict[str, Any]]] = {}
+            for variante in respuesta.get("variantes") or [respuesta]:
+                for item in variante.get("flota", []):
+                    items_por_vehiculo.setdefault(item["vehiculo"], []).append(item)
+            for vehiculo, items in items_por_vehiculo.items():
+                plaza_consultas.append((route_code, _configuracion_lookup_vehiculo(vehiculo), data.carroceria))
+                plaza_destinos.append(items)
+        else:
+            plaza_consultas.append((route_code, _configuracion_lookup_vehiculo(data.vehiculo), data.carroceria))
+            plaza_destinos.append([respuesta])
+
+    for destinos, plaza in zip(plaza_destinos, _build_valor_plaza_lote(plaza_consultas)):
+        if plaza:
+            for destino in destinos:
+                destino["valor_plaza"] = plaza
+
+    return {
+        "total": len(resultados),
+        "ok": sum(1 for r in resultados if "error" not in r),
+        "resultados": resultados,
+    }
+
+
+_SENSIBILIDAD_MAX_ESCENARIOS = int(os.getenv("SICETAC_SENSIBILIDAD_MAX_ESCENARIOS", "500"))
+_CAMPOS_ESCENARIO = ("valor_acpm", "acpm_pct", "costos_variables", "costos_variables_pct", "factor_peajes", "horas_logisticas")
+
+
+def _expandir_escenarios(data: SensibilidadInput) -> list[EscenarioInput]:
+    escenarios = [EscenarioInput(nombre="base")] if data.incluir_base else []
+    escenarios.extend(data.escenarios)
+    if data.grilla:
+        desconocidos = sorted(set(data.grilla) - set(_CAMPOS_ESCENARIO))
+        if desconocidos:
+            raise SicetacError(400, f"Campos de grilla no soportados: {', '.join(desconocidos)}. Usa: {', '.join(_CAMPOS_ESCENARIO)}")
+        campos = [c for c in _CAMPOS_ESCENARIO if data.grilla.get(c)]
+        total = int(np.prod([len(data.grilla[c]) for c in campos])) if campos else 0
+        if len(escenarios) + total > _SENSIBILIDAD_MAX_ESCENARIOS:
+            raise SicetacError(400, f"Máximo {_SENSIBILIDAD_MAX_ESCENARIOS} escenarios por barrido")
+        if campos:
+            for valores in product(*(data.grilla[c] for c in campos)):
+                escenarios.append(EscenarioInput(**dict(zip(campos, valores))))
+    if not escenarios:
+        raise SicetacError(400, "Indica al menos un escenario o una grilla")
+    if len(escenarios) > _SENSIBILIDAD_MAX_ESCENARIOS:
+        raise SicetacError(400, f"Máximo {_SENSIBILIDAD_MAX_ESCENARIOS} escenarios por barrido")
+    for escenario in escenarios:
+        if escenario.nombre is None:
+            escenario.nombre = ",".join(
+                f"{c}={getattr(escenario, c):g}" for c in _CAMPOS_ESCENARIO if getattr(escenario, c) is not None
+            ) or "base"
+    return escenarios
+
+
+def _km_fila_ruta(row: pd.Series) -> list[float]:
+    # Igual que `km_por_terreno` (no numérico o vacío -> 0) para una sola fila.
+    km = []
+    for columna in KM_COLUMNAS:
+        try:
+            valor = float(row.get(columna, 0))
+        except (TypeError, ValueError):
+            valor = 0.0
+        km.append(0.0 if np.isnan(valor) else valor)
+    return km
+
+
+def _km_manual(data: ConsultaInput) -> list[float]:
+    return [
+        float(data.km_plano or 0),
+        float(data.km_ondulado or 0),
+        _manual_km_montanoso(data),
+        float(data.km_urbano or 0),
+        float(data.km_despavimentado or 0),
+    ]
+
+
+@dataclass
+class _RutasConsulta:
+    filas: list[pd.Series | None]
+    resolved_route: dict[str, Any] | None
+    origen: str
+    destino: str
+    cod_origen: str = ""
+    cod_destino: str = ""
+    compuesta: _RutaCompuesta | None = None
+
+
+def _rutas_consulta(data: ConsultaInput, helper: SICETACHelper, df_rutas: pd.DataFrame) -> _RutasConsulta:
+    """
+    Filas de ruta SICE del carril (en cualquier sentido), la ruta resuelta y
+    los nombres a mostrar; `[None]` si se calcula con distancias manuales o,
+    sin ruta directa ni distancias manuales, con la ruta compuesta por tramos.
+    """
+    if data.manual_mode:
+        return _RutasConsulta([None], None, _display_name(data.origen, None), _display_name(data.destino, None))
+    origen_info, destino_info, resolved_route, origen, destino = _resolve_route_inputs(data, helper)
+    cod_origen = _clean_id(origen_info["codigo_dane"])
+    cod_destino = _clean_id(destino_info["codigo_dane"])
+    rutas_index = _get_rutas_index(df_rutas)
+    ruta_rows = rutas_index.get((cod_origen, cod_destino), []) or rutas_index.get((cod_destino, cod_origen), [])
+    rutas = _RutasConsulta(list(ruta_rows) or [None], resolved_route, origen, destino, cod_origen, cod_destino)
+    if not ruta_rows and not _has_manual_distances(data):
+        rutas.compuesta = _componer_ruta(cod_origen, cod_destino, df_rutas)
+    return rutas
+
+
+def _carriles_consulta(
+    data: ConsultaInput,
+    *,
+    helper: SICETACHelper,
+    df_vehiculos: pd.DataFrame,
+    df_parametros: pd.DataFrame,
+    df_costos_fijos: pd.DataFrame,
+    df_rutas: pd.DataFrame,
+    peajes_index: MatrizPeajes,
+    ejes_vehiculo: dict[str, str],
+) -> list[dict[str, Any]]:
+    """
+    Carriles (una por variante de ruta SICE) de una consulta, con distancias,
+    peaje y posición del vehículo en la tarifa del MES; sin evaluar el modelo.
+    """
+    registro = _get_vehicle_registry().resolver(data.vehiculo)
+    if registro is not None:
+        data = data.model_copy(update={"vehiculo": registro.tipo})
+    mes = data.mes if data.mes is not None else _latest_mes(df_parametros)
+    if mes is None:
+        raise SicetacError(500, "No se pudo determinar el MES más reciente.")
+    tarifa = _get_tarifa_mes(df_parametros, df_costos_fijos, int(mes), df_vehiculos)
+    pos = tarifa.posiciones.get(data.vehiculo)
+    if pos is None:
+        raise SicetacError(400, f"Vehículo '{data.vehiculo}' sin parámetros para el MES {mes}")
+    costo_fijo = tarifa.costo_fijo_para(data.carroceria)[pos]
+    if np.isnan(costo_fijo):
+        raise SicetacError(400, f"No se encontró costo fijo para {data.vehiculo} - {mes} - {normalizar_carroceria(data.carroceria)}")
+    modo = data.modo_viaje.upper()
+    if modo not in (*MODOS, MODO_IDA_VUELTA):
+        raise SicetacError(400, f"modo_viaje '{data.modo_viaje}' no soportado")
+
+    carriles = _carriles_rutas(
+        data, modo=modo, helper=helper, df_rutas=df_rutas, peajes_index=peajes_index, ejes_vehiculo=ejes_vehiculo
+    )
+    for carril in carriles:
+        carril.update({"mes": int(mes), "pos": pos, "costo_fijo": float(costo_fijo)})
+        carril["descripcion"]["mes"] = int(mes)
+    return carriles
+
+
+def _carriles_rutas(
+    data: ConsultaInput,
+    *,
+    modo: str,
+    helper: SICETACHelper,
+    df_rutas: pd.DataFrame,
+    peajes_index: MatrizPeajes,
+    ejes_vehiculo: dict[str, str],
+) -> list[dict[str, Any]]:
+    """
+    Distancias, peaje y descripción de cada variante de ruta SICE de la
+    consulta, sin tocar la tarifa de ningún MES.
+    """
+    manual_peaje = _manual_valor_peaje(data)
+    rutas = _rutas_consulta(data, helper, df_rutas)
+
+    ejes = ejes_vehiculo.get(data.vehiculo, "")
+    carriles = []
+    for row in rutas.filas:
+        if row is None and rutas.compuesta is not None:
+            km = rutas.compuesta.km_terreno()
+            peajes_tramos = rutas.compuesta.peajes(peajes_index, [ejes])[:, 0]
+            peaje = float(peajes_tramos.sum())
+        elif row is None:
+            km = _km_manual(data)
+            peaje = manual_peaje
+        else:
+            km = _km_fila_ruta(row)
+            peaje = _peaje_indexado(peajes_index, row.get("ID_SICE"), ejes)
+            peaje = manual_peaje if peaje is None else peaje
+        descripcion = {
+            "origen": rutas.origen,
+            "destino": rutas.destino,
+            "route_code": (rutas.resolved_route or {}).get("route_code"),
+            "id_sice": None if row is None else row.get("ID_SICE"),
+            "nombre_sice": None if row is None else row.get("NOMBRE_SICE"),
+            "vehiculo": data.vehiculo,
+            "carroceria": normalizar_carroceria(data.carroceria),
+            "modo_viaje": modo,
         }
-        if manual_mode:
-            respuesta["manual_mode_applied"] = True
-            respuesta["manual_input"] = {
-                "total_km": round(sum(manual_distancias.values()), 2),
-                "km_plano": manual_distancias["km_plano"],
-                "km_ondulado": manual_distancias["km_ondulado"],
-                "km_montanoso": manual_distancias["km_montanoso"],
-                "km_urbano": manual_distancias["km_urbano"],
-                "km_despavimentado": manual_distancias["km_despavimentado"],
-                "valor_peajes_manual": float(manual_peaje),
-        }
-        if resolved_route:
-            _attach_resolved_route(respuesta, resolved_route)
-        _attach_valor_plaza(
-            respuesta,
-            resolved_route=resolved_route,
-            configuracion_lookup=configuracion_lookup,
-            carroceria=data.carroceria,
-        )
-        return respuesta
-
-    variantes = []
-    for _, r in ruta.iterrows():
-        variantes.append({
-            "NOMBRE_SICE": r.get("NOMBRE_SICE"),
-            "ID_SICE": r.get("ID_SICE"),
-            "totales": _totales_para_ruta(r),
+        if row is None and rutas.compuesta is not None:
+            descripcion["ruta_compuesta"] = rutas.compuesta.detalle(peajes_tramos)
+        carriles.append({
+            "modo": modo,
+            "km": km,
+            "peaje": float(peaje or 0),
+            "descripcion": descripcion,
         })
+    return carriles
 
-    respuesta = {
-        "origen": origen_display,
-        "destino": destino_display,
-        "configuracion": data.vehiculo,
-        "mes": int(mes_usar),
-        "carroceria": data.carroceria,
-        "modo_viaje": data.modo_viaje.upper(),
-        "variantes": variantes,
-    }
-    if manual_mode:
-        respuesta["manual_mode_applied"] = True
-        respuesta["manual_input"] = {
-            "total_km": round(sum(manual_distancias.values()), 2),
-            "km_plano": manual_distancias["km_plano"],
-            "km_ondulado": manual_distancias["km_ondulado"],
-            "km_montanoso": manual_distancias["km_montanoso"],
-            "km_urbano": manual_distancias["km_urbano"],
-            "km_despavimentado": manual_distancias["km_despavimentado"],
-            "valor_peajes_manual": float(manual_peaje),
+
+def _override(base: np.ndarray, absolutos: np.ndarray, pct: np.ndarray) -> np.ndarray:
+    # (L,) x (S,) -> (L, S): valor absoluto si viene, si no base * (1 + pct/100).
+    ajustado = base[:, None] * (1 + np.nan_to_num(pct, nan=0.0)[None, :] / 100.0)
+    return np.where(np.isnan(absolutos)[None, :], ajustado, absolutos[None, :])
+
+
+def calcular_sensibilidad(data: SensibilidadInput) -> dict[str, Any]:
+    """
+    Barrido de escenarios (ACPM, costos variables, factor de peajes, horas
+    logísticas) sobre un conjunto de carriles: matriz carriles × escenarios
+    evaluada con el modelo vectorizado en una pasada por (MES, modo), sobre
+    copias de los parámetros compilados, sin tocar las tablas.
+    """
+    if len(data.consultas) > _LOTE_MAX:
+        raise SicetacError(400, f"Máximo {_LOTE_MAX} consultas por barrido")
+    escenarios = _expandir_escenarios(data)
+    _refresh_cache()
+    (
+        df_municipios,
+        df_vehiculos,
+        df_parametros,
+        df_costos_fijos,
+        df_peajes,
+        df_rutas,
+        _,
+        _,
+    ) = _get_dataframes()
+    if df_municipios.empty or df_vehiculos.empty or df_parametros.empty or df_costos_fijos.empty or df_peajes.empty or df_rutas.empty:
+        raise SicetacError(500, "Tablas de Supabase no disponibles o vacías. Verifica conexión y datos.")
+
+    contexto = {
+        "helper": _helper_municipios(df_municipios),
+        "df_vehiculos": df_vehiculos,
+        "df_parametros": df_parametros,
+        "df_costos_fijos": df_costos_fijos,
+        "df_rutas": df_rutas,
+        "peajes_index": _get_peajes_index(df_peajes),
+        "ejes_vehiculo": _get_vehicle_registry().ejes,
+    }
+    carriles: list[dict[str, Any]] = []
+    errores: list[dict[str, Any]] = []
+    for i, consulta in enumerate(data.consultas):
+        try:
+            for carril in _carriles_consulta(consulta, **contexto):
+                carril["descripcion"] = {"indice": i, **carril["descripcion"]}
+                carriles.append(carril)
+        except SicetacError as ex:
+            errores.append({"indice": i, "error": ex.detail, "status_code": ex.status_code})
+
+    def _columna(campo: str) -> np.ndarray:
+        return np.array([np.nan if getattr(e, campo) is None else getattr(e, campo) for e in escenarios], dtype=float)
+
+    valor_acpm, acpm_pct = _columna("valor_acpm"), _columna("acpm_pct")
+    costos_var, costos_var_pct = _columna("costos_variables"), _columna("costos_variables_pct")
+    factor_peajes = np.nan_to_num(_columna("factor_peajes"), nan=1.0)
+    horas = _columna("horas_logisticas")
+
+    totales = np.zeros((len(carriles), len(escenarios)))
+    grupos: dict[tuple[int, str], list[int]] = {}
+    for j, carril in enumerate(carriles):
+        modos = [m for _, m in _TRAMOS_IDA_VUELTA] if carril["modo"] == MODO_IDA_VUELTA else [carril["modo"]]
+        for modo in modos:
+            grupos.setdefault((carril["mes"], modo), []).append(j)
+
+    for (mes, modo), filas in grupos.items():
+        tarifa = _get_tarifa_mes(df_parametros, df_costos_fijos, mes, df_vehiculos)
+        pos = np.array([carriles[j]["pos"] for j in filas])
+        resultado = evaluar_modelo(
+            km=np.array([carriles[j]["km"] for j in filas], dtype=float)[:, None, :],
+            velocidad=tarifa.velocidad[modo][pos][:, None, :],
+            consumo=tarifa.consumo[modo][pos][:, None, :],
+            valor_acpm=_override(tarifa.valor_acpm[pos], valor_acpm, acpm_pct),
+            costos_variables=_override(tarifa.costos_variables[pos], costos_var, costos_var_pct),
+            costo_fijo=np.array([carriles[j]["costo_fijo"] for j in filas])[:, None],
+            peaje=np.array([carriles[j]["peaje"] for j in filas])[:, None] * factor_peajes[None, :],
+            horas_logisticas=horas[None, :],
+            modo=modo,
+        )
+        # Ida y vuelta: se suman los dos tramos del mismo carril.
+        np.add.at(totales, np.array(filas), resultado["total_viaje"])
+
+    totales = np.round(totales, 2)
+    respuesta: dict[str, Any] = {
+        "escenarios": [e.model_dump(exclude_none=True) for e in escenarios],
+        "carriles": [c["descripcion"] for c in carriles],
+        "totales": totales.tolist(),
+        "errores": errores,
+    }
+    if data.incluir_base and len(carriles):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            variacion = np.round((totales / totales[:, :1] - 1) * 100, 3)
+        respuesta["variacion_pct"] = variacion.tolist()
+    return respuesta
+
+
+_COMPONENTES_HISTORIAL = ("costo_fijo", "combustible", "peajes", "mantenimiento", "imprevistos", "otros_costos", "total_viaje")
+
+
+def _meses_historial(df_parametros: pd.DataFrame, data: HistorialInput) -> list[int]:
+    meses = [
+        mes for mes in _meses_disponibles(df_parametros)
+        if (data.desde is None or mes >= data.desde) and (data.hasta is None or mes <= data.hasta)
+    ]
+    if data.meses is not None:
+        meses = meses[-data.meses:] if data.meses > 0 else []
+    if not meses:
+        raise SicetacError(400, "No hay meses disponibles en el rango solicitado")
+    return meses
+
+
+def calcular_historial(data: HistorialInput) -> dict[str, Any]:
+    """
+    Serie mensual de costos para un conjunto de carriles sobre los MES
+    disponibles (o el rango pedido). Las tarifas compiladas de cada MES se
+    apilan en un eje y el modelo vectorizado evalúa carriles × meses × horas
+    en una pasada por modo; distancias y peajes son los vigentes. Cada punto
+    se cruza con el valor plaza del mismo mes. Los meses en que el vehículo
+    no tiene parámetros o costo fijo para la carrocería quedan en null con
+    su error, sin tumbar el carril.
+    """
+    if len(data.consultas) > _LOTE_MAX:
+        raise SicetacError(400, f"Máximo {_LOTE_MAX} consultas por historial")
+    _refresh_cache()
+    (
+        df_municipios,
+        df_vehiculos,
+        df_parametros,
+        df_costos_fijos,
+        df_peajes,
+        df_rutas,
+        _,
+        _,
+    ) = _get_dataframes()
+    if df_municipios.empty or df_vehiculos.empty or df_parametros.empty or df_costos_fijos.empty or df_peajes.empty or df_rutas.empty:
+        raise SicetacError(500, "Tablas de Supabase no disponibles o vacías. Verifica conexión y datos.")
+
+    meses = _meses_historial(df_parametros, data)
+    tarifas = [_get_tarifa_mes(df_parametros, df_costos_fijos, mes, df_vehiculos) for mes in meses]
+    registry = _get_vehicle_registry()
+
+    def _posicion(tarifa: TarifaMes, vehiculo: str) -> int | None:
+        # La tarifa trae fila para todo vehículo registrado; sin parámetros del MES queda en NaN.
+        pos = tarifa.posiciones.get(vehiculo)
+        return None if pos is None or np.isnan(tarifa.costos_variables[pos]) else pos
+
+    contexto = {
+        "helper": _helper_municipios(df_municipios),
+        "df_rutas": df_rutas,
+        "peajes_index": _get_peajes_index(df_peajes),
+        "ejes_vehiculo": registry.ejes,
+    }
+    carriles: list[dict[str, Any]] = []
+    consultas_carril: list[ConsultaInput] = []
+    errores: list[dict[str, Any]] = []
+    for i, consulta in enumerate(data.consultas):
+        try:
+            registro = registry.resolver(consulta.vehiculo)
+            if registro is not None:
+                consulta = consulta.model_copy(update={"vehiculo": registro.tipo})
+            if all(_posicion(tarifa, consulta.vehiculo) is None for tarifa in tarifas):
+                raise SicetacError(400, f"Vehículo '{consulta.vehiculo}' sin parámetros en ningún MES de {meses[0]} a {meses[-1]}")
+            modo = consulta.modo_viaje.upper()
+            if modo not in (*MODOS, MODO_IDA_VUELTA):
+                raise SicetacError(400, f"modo_viaje '{consulta.modo_viaje}' no soportado")
+            # Rutas y peajes se resuelven una vez; la tarifa se valida mes a mes.
+            for carril in _carriles_rutas(consulta, modo=modo, **contexto):
+                carril["descripcion"] = {"indice": i, **carril["descripcion"]}
+                carriles.append(carril)
+                consultas_carril.append(consulta)
+        except SicetacError as ex:
+            errores.append({"indice": i, "error": ex.detail, "status_code": ex.status_code})
+
+    n_carriles, n_meses = len(carriles), len(meses)
+    # Última columna de horas = default del modelo, usada para los componentes.
+    horas = np.array([*data.horas, np.nan], dtype=float)
+    posiciones = np.full((n_carriles, n_meses), -1, dtype=int)
+    costo_fijo = np.full((n_carriles, n_meses), np.nan)
+    for j, (carril, consulta) in enumerate(zip(carriles, consultas_carril)):
+        for k, tarifa in enumerate(tarifas):
+            pos = _posicion(tarifa, carril["descripcion"]["vehiculo"])
+            if pos is not None:
+                posiciones[j, k] = pos
+                costo_fijo[j, k] = tarifa.costo_fijo_para(consulta.carroceria)[pos]
+    validos = (posiciones >= 0) & ~np.isnan(costo_fijo)
+
+    def _por_mes(extraer: Callable[[TarifaMes], np.ndarray]) -> np.ndarray:
+        # (carriles, meses, ...): fila del vehículo de cada carril en la tarifa
+        # de cada MES; posición -1 cae en la fila NaN de relleno.
+        columnas = []
+        for k, tarifa in enumerate(tarifas):
+            valores = extraer(tarifa)
+            relleno = np.full((1, *valores.shape[1:]), np.nan)
+            columnas.append(np.concatenate([valores, relleno])[posiciones[:, k]])
+        return np.stack(columnas, axis=1)
+
+    componentes = {c: np.zeros((n_carriles, n_meses, len(horas))) for c in _COMPONENTES_HISTORIAL}
+    if n_carriles:
+        km = np.array([c["km"] for c in carriles], dtype=float)
+        peaje = np.array([c["peaje"] for c in carriles], dtype=float)
+        valor_acpm = _por_mes(lambda t: t.valor_acpm)
+        costos_variables = _por_mes(lambda t: t.costos_variables)
+        for modo in MODOS:
+            # Ida y vuelta: el carril entra en ambos modos y se suman los tramos.
+            filas = np.array([j for j, c in enumerate(carriles) if c["modo"] in (modo, MODO_IDA_VUELTA)], dtype=int)
+            if not len(filas):
+                continue
+            resultado = evaluar_modelo(
+                km=km[filas][:, None, None, :],
+                velocidad=_por_mes(lambda t: t.velocidad[modo])[filas][:, :, None, :],
+                consumo=_por_mes(lambda t: t.consumo[modo])[filas][:, :, None, :],
+                valor_acpm=valor_acpm[filas][:, :, None],
+                costos_variables=costos_variables[filas][:, :, None],
+                costo_fijo=costo_fijo[filas][:, :, None],
+                peaje=peaje[filas][:, None, None],
+                horas_logisticas=horas[None, None, :],
+                modo=modo,
+            )
+            for nombre, acumulado in componentes.items():
+                acumulado[filas] += np.broadcast_to(resultado[nombre], (len(filas), n_meses, len(horas)))
+
+    plaza_por_carril: list[dict[int, float]] = [{} for _ in carriles]
+    if data.incluir_valor_plaza and carriles:
+        plaza_consultas = [
+            (c["descripcion"]["route_code"], _configuracion_lookup_vehiculo(c["descripcion"]["vehiculo"]), consulta.carroceria)
+            for c, consulta in zip(carriles, consultas_carril)
+        ]
+        for j, plaza in enumerate(_build_valor_plaza_lote(plaza_consultas, max_months=max(n_meses, _VALOR_PLAZA_MESES))):
+            if plaza:
+                plaza_por_carril[j] = {p["mes_codigo"]: p["valor"] for p in plaza["meses"] if p["mes_codigo"] is not None}
+
+    resultados = []
+    for j, carril in enumerate(carriles):
+        vehiculo = carril["descripcion"]["vehiculo"]
+        serie = []
+        for k, mes in enumerate(meses):
+            punto: dict[str, Any] = {"mes": mes}
+            if validos[j, k]:
+                punto["totales"] = {f"H{h}": round(float(componentes["total_viaje"][j, k, i]), 2) for i, h in enumerate(data.horas)}
+                punto["componentes"] = {c: round(float(componentes[c][j, k, -1]), 2) for c in _COMPONENTES_HISTORIAL}
+            else:
+                punto["totales"] = None
+                if posiciones[j, k] < 0:
+                    punto["error"] = f"Vehículo '{vehiculo}' sin parámetros para el MES {mes}"
+                else:
+                    punto["error"] = f"No se encontró costo fijo para {vehiculo} - {mes} - {carril['descripcion']['carroceria']}"
+            if data.incluir_valor_plaza:
+                punto["valor_plaza"] = plaza_por_carril[j].get(mes)
+            serie.append(punto)
+        resultados.append({**carril["descripcion"], "serie": serie})
+
+    return {"meses": meses, "carriles": resultados, "errores": errores}
+
+
+def calcular_viaje(data: ViajeInput) -> dict[str, Any]:
+    """
+    Viaje con varias paradas (A→B→C…). Las paradas se resuelven una vez,
+    cada tramo toma sus rutas de `_rutas_consulta` (ruta compuesta si no hay
+    registro directo) y todos los tramos y variantes se evalúan juntos con el
+    modelo vectorizado. En CARGADO los lookups del consolidado de todos los
+    tramos se traen en una sola llamada combinada y, como en
+    `/consulta_resumen`, la variante con fila en el consolidado cuesta
+    movilización + horas × valor hora. Las horas logísticas de una parada se
+    cargan al tramo que llega a ella (las de la primera, al primer tramo). El
+    total de cada tramo es el de la variante que elige `politica_variantes`
+    (la primera con TODAS).
+    """
+    if len(data.paradas) < 2:
+        raise SicetacError(400, "Indica al menos dos paradas")
+    if len(data.paradas) > _VIAJE_MAX_PARADAS:
+        raise SicetacError(400, f"Máximo {_VIAJE_MAX_PARADAS} paradas por viaje")
+    modo = data.modo_viaje.upper()
+    if modo not in MODOS:
+        raise SicetacError(400, f"modo_viaje '{data.modo_viaje}' no soportado en viajes con paradas (usa {' o '.join(MODOS)})")
+    if any(p.horas_logisticas is not None and p.horas_logisticas < 0 for p in data.paradas):
+        raise SicetacError(400, "horas_logisticas de una parada no puede ser negativo")
+    politica = _politica_variantes(data)
+    _refresh_cache()
+    (
+        df_municipios,
+        df_vehiculos,
+        df_parametros,
+        df_costos_fijos,
+        df_peajes,
+        df_rutas,
+        _,
+        _,
+    ) = _get_dataframes()
+    if df_municipios.empty or df_vehiculos.empty or df_parametros.empty or df_costos_fijos.empty or df_peajes.empty or df_rutas.empty:
+        raise SicetacError(500, "Tablas de Supabase no disponibles o vacías. Verifica conexión y datos.")
+
+    helper = _helper_municipios(df_municipios)
+    paradas = []
+    for i, parada in enumerate(data.paradas):
+        info = _resolver_municipio(helper, f"paradas[{i}]", parada.municipio, parada.codigo_dane, parada.departamento)
+        if not info:
+            raise SicetacError(404, f"Parada {i} no encontrada: {parada.municipio or parada.codigo_dane}")
+        paradas.append({
+            "municipio": _display_name(parada.municipio, info.get("nombre_oficial")),
+            "codigo_dane": _clean_id(info["codigo_dane"]),
+            "horas_logisticas": parada.horas_logisticas,
+        })
+
+    contexto = {
+        "helper": helper,
+        "df_vehiculos": df_vehiculos,
+        "df_parametros": df_parametros,
+        "df_costos_fijos": df_costos_fijos,
+        "df_rutas": df_rutas,
+        "peajes_index": _get_peajes_index(df_peajes),
+        "ejes_vehiculo": _get_vehicle_registry().ejes,
+    }
+    carriles: list[dict[str, Any]] = []
+    horas: list[float] = []
+    for i, (desde, hasta) in enumerate(zip(paradas, paradas[1:])):
+        h = hasta["horas_logisticas"]
+        if i == 0 and desde["horas_logisticas"] is not None:
+            h = (h or 0) + desde["horas_logisticas"]
+        tramo = ConsultaInput(
+            origen=desde["municipio"],
+            destino=hasta["municipio"],
+            codigo_dane_origen=desde["codigo_dane"],
+            codigo_dane_destino=hasta["codigo_dane"],
+            vehiculo=data.vehiculo,
+            carroceria=data.carroceria,
+            mes=data.mes,
+            modo_viaje=modo,
+        )
+        try:
+            variantes = _carriles_consulta(tramo, **contexto)
+        except SicetacError as ex:
+            detalle = ex.detail if isinstance(ex.detail, dict) else f"Tramo {i} ({desde['municipio']} → {hasta['municipio']}): {ex.detail}"
+            raise SicetacError(ex.status_code, detalle)
+        for carril in variantes:
+            carril["tramo"] = i
+            carriles.append(carril)
+            horas.append(np.nan if h is None else float(h))
+
+    vehiculo = carriles[0]["descripcion"]["vehiculo"]
+    # Consolidado de los tramos con ruta SICE directa: una sola llamada combinada.
+    lookups: dict[int, dict[str, dict[str, Any]]] = {}
+    configuracion_lookup = _configuracion_lookup_vehiculo(vehiculo)
+    if modo == "CARGADO" and configuracion_lookup and _USE_CONSOLIDATED_LOOKUP and _carroceria_option(data.carroceria):
+        directos = sorted({c["tramo"] for c in carriles if c["descripcion"]["id_sice"] is not None})
+        pares = {i: (paradas[i]["codigo_dane"], paradas[i + 1]["codigo_dane"]) for i in directos}
+        if pares:
+            get_lookup_carriles([(origen, destino, configuracion_lookup, None) for origen, destino in pares.values()])
+        for i, (origen, destino) in pares.items():
+            lookups[i] = {
+                item["rutasid"]: item
+                for item in _lookup_sicetac_totales(
+                    cod_origen_str=origen,
+                    cod_destino_str=destino,
+                    configuracion_lookup=configuracion_lookup,
+                    carroceria=data.carroceria,
+                )
+            }
+
+    mes = carriles[0]["mes"]
+    tarifa = _get_tarifa_mes(df_parametros, df_costos_fijos, mes, df_vehiculos)
+    pos = np.array([c["pos"] for c in carriles], dtype=int)
+    resultado = evaluar_modelo(
+        km=np.array([c["km"] for c in carriles], dtype=float),
+        velocidad=tarifa.velocidad[modo][pos],
+        consumo=tarifa.consumo[modo][pos],
+        valor_acpm=tarifa.valor_acpm[pos],
+        costos_variables=tarifa.costos_variables[pos],
+        costo_fijo=np.array([c["costo_fijo"] for c in carriles]),
+        peaje=np.array([c["peaje"] for c in carriles]),
+        horas_logisticas=np.array(horas),
+        modo=modo,
+    )
+
+    por_tramo: dict[int, dict[str, Any]] = {}
+    for j, carril in enumerate(carriles):
+        horas_tramo = float(resultado["horas_logisticas"][j])
+        variante = {
+            "id_sice": carril["descripcion"]["id_sice"],
+            "nombre_sice": carril["descripcion"]["nombre_sice"],
+            "km": round(float(sum(carril["km"])), 2),
+            "peaje": carril["peaje"],
+            "horas_logisticas": horas_tramo,
+            "total": round(float(resultado["total_viaje"][j]), 2),
+            "metodo": "modelo",
         }
-    if resolved_route:
-        _attach_resolved_route(respuesta, resolved_route)
-    _attach_valor_plaza(
-        respuesta,
-        resolved_route=resolved_route,
-        configuracion_lookup=configuracion_lookup,
-        carroceria=data.carroceria,
-    )
-    return respuesta
+        item = lookups.get(carril["tramo"], {}).get(_clean_id(carril["descripcion"]["id_sice"]))
+        if item:
+            variante["total"] = round(item["movilizacion"] + horas_tramo * item["valor_hora"], 2)
+            variante["metodo"] = "lookup_consolidado"
+            variante["detalle_lookup"] = {
+                "movilizacion": item["movilizacion"],
+                "valor_hora": item["valor_hora"],
+                "columna_usada": item["lookup_column"],
+                "opcion_servicio": item["lookup_label"],
+            }
+        if "ruta_compuesta" in carril["descripcion"]:
+            variante["ruta_compuesta"] = carril["descripcion"]["ruta_compuesta"]
+        grupo = por_tramo.setdefault(carril["tramo"], {"route_code": carril["descripcion"]["route_code"], "variantes": [], "km": []})
+        grupo["variantes"].append(variante)
+        grupo["km"].append(carril["km"])
+
+    tramos: list[dict[str, Any]] = []
+    elegidas: list[dict[str, Any]] = []
+    for i, grupo in por_tramo.items():
+        variantes = grupo["variantes"]
+        km_variantes = np.array(grupo["km"], dtype=float)
+        evaluadas, seleccion = _seleccionar_variantes(
+            len(variantes),
+            politica=politica,
+            agregar=False,
+            evaluar=lambda k: variantes[k],
+            clave=lambda: _clave_variantes(politica, km_variantes, tarifa, vehiculo, modo),
+            hora=None,
+        )
+        tramo = {
+            "indice": i,
+            "origen": paradas[i]["municipio"],
+            "destino": paradas[i + 1]["municipio"],
+            "route_code": grupo["route_code"],
+        }
+        if seleccion is None:
+            elegida = evaluadas[0]
+            tramo["variantes"] = evaluadas
+        else:
+            elegida = seleccion["variante"]
+            tramo["variante"] = elegida
+            tramo["seleccion_variante"] = {
+                "politica": politica,
+                "id_sice": elegida["id_sice"],
+                "nombre_sice": elegida["nombre_sice"],
+                "candidatas": len(variantes),
+                "evaluadas": seleccion["evaluadas"],
+            }
+        tramo["total"] = elegida["total"]
+        tramos.append(tramo)
+        elegidas.append(elegida)
+
+    return {
+        "vehiculo": vehiculo,
+        "carroceria": normalizar_carroceria(data.carroceria),
+        "mes": mes,
+        "modo_viaje": modo,
+        "politica_variantes": politica,
+        "paradas": paradas,
+        "tramos": tramos,
+        "km_total": round(sum(v["km"] for v in elegidas), 2),
+        "total": round(sum(v["total"] for v in elegidas), 2),
+    }
 
 
 def generar_snapshot(
     horas: list[int] | None = None,
     carroceria: str = "GENERAL",
     modo_viaje: str = "CARGADO",
+    workers: int | None = None,
 ) -> pd.DataFrame:
     """
     Genera snapshot para todas las rutas y vehículos.
     """
+    bloques = list(iterar_snapshot(horas=horas, carroceria=carroceria, modo_viaje=modo_viaje, workers=workers))
+    return pd.concat(bloques, ignore_index=True) if len(bloques) > 1 else bloques[0]
+
+
+@dataclass
+class _ContextoSnapshot:
+    mes: int
+    horas: list[int]
+    carrocerias: list[str]
+    modos: list[str]
+    largo: bool
+    costo_fijo: np.ndarray
+    df_rutas: pd.DataFrame
+    tarifa: TarifaMes
+    vehiculos: list[str]
+    idx_vehiculos: np.ndarray
+    ejes_vehiculos: list[str]
+    peajes_index: MatrizPeajes
+    nombre_mpio: dict[str, str]
+
+
+# Contexto del snapshot en cada proceso shard; lo fija el initializer del
+# pool una vez por proceso en vez de serializarlo en cada tarea.
+_SNAPSHOT_CONTEXTO: _ContextoSnapshot | None = None
+
+
+_MODOS_SNAPSHOT = ("CARGADO", "VACIO")
+
+
+def variantes_snapshot(carroceria: str | None, modo_viaje: str | None) -> tuple[list[str] | None, list[str], bool]:
+    """
+    Interpreta `carroceria`/`modo_viaje` del snapshot.
+
+    Acepta un valor, una lista separada por comas o `*` (todas las
+    carrocerías con costo fijo en el MES / `AMBOS` modos). Devuelve
+    (carrocerias o None para todas, modos, formato_largo).
+    """
+    texto_carroceria = str(carroceria or "GENERAL").strip().upper()
+    texto_modo = str(modo_viaje or "CARGADO").strip().upper()
+    carrocerias = None if texto_carroceria in ("*", "TODAS") else [c.strip() for c in texto_carroceria.split(",") if c.strip()]
+    if texto_modo in ("*", "AMBOS", "TODOS"):
+        modos = list(_MODOS_SNAPSHOT)
+    else:
+        modos = [m.strip() for m in texto_modo.split(",") if m.strip()]
+    for modo in modos:
+        if modo not in _MODOS_SNAPSHOT:
+            raise SicetacError(400, f"modo_viaje no soportado: {modo}. Usa CARGADO, VACIO o AMBOS.")
+    largo = carrocerias is None or len(carrocerias) != 1 or len(modos) != 1
+    return carrocerias, modos, largo
+
+
+def _contexto_snapshot(horas: list[int] | None, carroceria: str, modo_viaje: str) -> _ContextoSnapshot:
+    carrocerias, modos, largo = variantes_snapshot(carroceria, modo_viaje)
     _refresh_cache()
     (
         df_municipios,
@@ -1175,87 +2711,239 @@ def generar_snapshot(
 
     nombre_mpio = {}
     if "CODIGO_DANE" in df_municipios.columns and "NOMBRE_OFICIAL" in df_municipios.columns:
-        for _, row in df_municipios.iterrows():
-            nombre_mpio[_clean_id(row["CODIGO_DANE"])] = str(row["NOMBRE_OFICIAL"]).strip()
+        for codigo, nombre in zip(df_municipios["CODIGO_DANE"], df_municipios["NOMBRE_OFICIAL"]):
+            nombre_mpio[_clean_id(codigo)] = str(nombre).strip()
 
     vehiculos = df_vehiculos["TIPO_VEHICULO"].astype(str).unique().tolist()
     vehiculos = [v for v in vehiculos if str(v).strip().upper() != "V3"]
 
-    def _peaje_for(ruta_row, ejes_conf: str) -> float:
-        id_sice = _clean_id(ruta_row.get("ID_SICE"))
-        valores = peajes_index.get((id_sice, ejes_conf), [])
-        return float(valores[0]) if valores else 0.0
-
-    rows = []
-    for _, ruta_row in df_rutas.iterrows():
-        cod_origen = _clean_id(ruta_row.get("CODIGO_DANE_ORIGEN"))
-        cod_destino = _clean_id(ruta_row.get("CODIGO_DANE_DESTINO"))
-
-        distancias = {
-            "km_plano": ruta_row.get("KM_PLANO", 0),
-            "km_ondulado": ruta_row.get("KM_ONDULADO", 0),
-            "km_montanoso": ruta_row.get("KM_MONTAÑOSO", 0),
-            "km_urbano": ruta_row.get("KM_URBANO", 0),
-            "km_despavimentado": ruta_row.get("KM_DESPAVIMENTADO", 0),
-        }
+    tarifa = _get_tarifa_mes(df_parametros, df_costos_fijos, mes_usar, df_vehiculos)
+    idx_vehiculos = np.array([tarifa.posiciones[v] for v in vehiculos], dtype=int)
+    # Con todas las carrocerías se omiten las combinaciones sin costo fijo;
+    # las pedidas explícitamente deben tenerlo para todos los vehículos.
+    todas = carrocerias is None
+    if todas:
+        carrocerias = list(tarifa.carrocerias)
+        if not carrocerias:
+            raise SicetacError(500, f"No hay costos fijos para el MES {int(mes_usar)}.")
+    costo_fijo = np.stack([tarifa.costo_fijo_para(c)[idx_vehiculos] for c in carrocerias])
+    if not todas:
+        for ci, tipo in enumerate(carrocerias):
+            for vehiculo, valor in zip(vehiculos, costo_fijo[ci]):
+                if np.isnan(valor):
+                    raise ValueError(f"No se encontró costo fijo para {vehiculo} - {int(mes_usar)} - {tipo}")
+
+    ejes = _get_vehicle_registry().ejes
+    return _ContextoSnapshot(
+        mes=int(mes_usar),
+        horas=list(horas),
+        carrocerias=carrocerias,
+        modos=modos,
+        largo=largo,
+        costo_fijo=costo_fijo,
+        df_rutas=df_rutas,
+        tarifa=tarifa,
+        vehiculos=vehiculos,
+        idx_vehiculos=idx_vehiculos,
+        ejes_vehiculos=[ejes.get(v, "") for v in vehiculos],
+        peajes_index=peajes_index,
+        nombre_mpio=nombre_mpio,
+    )
 
-        for vehiculo in vehiculos:
-            fila_conf = df_vehiculos[df_vehiculos["TIPO_VEHICULO"] == vehiculo].iloc[0]
-            ejes_conf = _clean_id(fila_conf.get("EJES_CONFIGURACION"))
-            valor_peaje = _peaje_for(ruta_row, ejes_conf)
-
-            totales = {}
-            for h in horas:
-                if modo_viaje.upper() == "VACIO":
-                    res = calcular_modelo_sicetac_extendido_vacio(
-                        origen=nombre_mpio.get(cod_origen, cod_origen),
-                        destino=nombre_mpio.get(cod_destino, cod_destino),
-                        configuracion=vehiculo,
-                        serie=int(mes_usar),
-                        distancias=distancias,
-                        valor_peaje_manual=0,
-                        matriz_parametros=df_parametros,
-                        matriz_costos_fijos=df_costos_fijos,
-                        matriz_vehicular=df_vehiculos,
-                        rutas_df=df_rutas,
-                        peajes_df=df_peajes,
-                        carroceria_especial=carroceria,
-                        ruta_oficial=ruta_row,
-                        horas_logisticas=h,
-                        valor_peaje_override=valor_peaje,
-                    )
-                else:
-                    res = calcular_modelo_sicetac_extendido(
-                        origen=nombre_mpio.get(cod_origen, cod_origen),
-                        destino=nombre_mpio.get(cod_destino, cod_destino),
-                        configuracion=vehiculo,
-                        serie=int(mes_usar),
-                        distancias=distancias,
-                        valor_peaje_manual=0,
-                        matriz_parametros=df_parametros,
-                        matriz_costos_fijos=df_costos_fijos,
-                        matriz_vehicular=df_vehiculos,
-                        rutas_df=df_rutas,
-                        peajes_df=df_peajes,
-                        carroceria_especial=carroceria,
-                        ruta_oficial=ruta_row,
-                        horas_logisticas=h,
-                        valor_peaje_override=valor_peaje,
-                    )
-                total = res.get("total_viaje") or res.get("total_viaje_vacio")
-                totales[f"H{h}"] = float(total) if total is not None else None
 
-            rows.append({
-                "mes": int(mes_usar),
-                "codigo_origen": cod_origen,
-                "codigo_destino": cod_destino,
-                "origen_nombre": nombre_mpio.get(cod_origen),
-                "destino_nombre": nombre_mpio.get(cod_destino),
-                "vehiculo": vehiculo,
-                "id_sice": ruta_row.get("ID_SICE"),
-                "nombre_sice": ruta_row.get("NOMBRE_SICE"),
-                "valor_peaje": valor_peaje,
-                **totales,
-            })
+def _bloque_snapshot(ctx: _ContextoSnapshot, inicio: int, fin: int) -> pd.DataFrame:
+    rutas = ctx.df_rutas.iloc[inicio:fin]
+    peajes_index = ctx.peajes_index
+    peajes = sicetac_cubo.matriz_peajes_rutas(rutas, ctx.ejes_vehiculos, peajes_index)
+    km = km_por_terreno(rutas)
+    # (modos, carrocerías, rutas, vehículos, horas): km, peajes y horas se
+    # comparten; por modo cambian velocidad/consumo y por carrocería el costo fijo.
+    totales = np.stack([
+        evaluar_totales_carrocerias(
+            ctx.tarifa,
+            km=km,
+            peajes=peajes,
+            horas=ctx.horas,
+            costo_fijo=ctx.costo_fijo,
+            modo=modo,
+            idx_vehiculos=ctx.idx_vehiculos,
+        )
+        for modo in ctx.modos
+    ])
+
+    n_vehiculos = len(ctx.vehiculos)
+    # Filas por ruta: vehículo × modo × carrocería (solo vehículo en formato ancho).
+    n_variantes = len(ctx.modos) * len(ctx.carrocerias) if ctx.largo else 1
+    filas_ruta = n_vehiculos * n_variantes
+
+    def _por_ruta(columna: str, transform=None) -> np.ndarray:
+        if columna not in rutas.columns:
+            valores = np.full(len(rutas), None, dtype=object)
+        else:
+            serie = rutas[columna]
+            valores = (serie.map(transform) if transform else serie).to_numpy(dtype=object)
+        return np.repeat(valores, filas_ruta)
+
+    codigo_origen = _por_ruta("CODIGO_DANE_ORIGEN", _clean_id)
+    codigo_destino = _por_ruta("CODIGO_DANE_DESTINO", _clean_id)
+    columnas: dict[str, Any] = {
+        "mes": ctx.mes,
+        "codigo_origen": codigo_origen,
+        "codigo_destino": codigo_destino,
+        "origen_nombre": [ctx.nombre_mpio.get(c) for c in codigo_origen],
+        "destino_nombre": [ctx.nombre_mpio.get(c) for c in codigo_destino],
+        "vehiculo": np.tile(np.repeat(np.array(ctx.vehiculos, dtype=object), n_variantes), len(rutas)),
+    }
+    if ctx.largo:
+        variantes = np.array([(m, c) for m in ctx.modos for c in ctx.carrocerias], dtype=object)
+        columnas["carroceria"] = np.tile(variantes[:, 1], len(rutas) * n_vehiculos)
+        columnas["modo_viaje"] = np.tile(variantes[:, 0], len(rutas) * n_vehiculos)
+    columnas["id_sice"] = _por_ruta("ID_SICE")
+    columnas["nombre_sice"] = _por_ruta("NOMBRE_SICE")
+    columnas["valor_peaje"] = np.repeat(peajes.reshape(-1), n_variantes)
+    # (rutas, vehículos, modos, carrocerías, horas) -> filas × horas
+    por_fila = totales.transpose(2, 3, 0, 1, 4).reshape(-1, len(ctx.horas))
+    for j, h in enumerate(ctx.horas):
+        columnas[f"H{h}"] = por_fila[:, j]
+
+    df = pd.DataFrame(columnas)
+    if ctx.largo:
+        # Combinaciones vehículo/carrocería sin costo fijo en el MES.
+        sin_costo = np.isnan(ctx.costo_fijo).T
+        if sin_costo.any():
+            mascara = np.broadcast_to(sin_costo[None, :, None, :], (len(rutas), n_vehiculos, len(ctx.modos), len(ctx.carrocerias)))
+            df = df[~mascara.reshape(-1)].reset_index(drop=True)
+    return df
+
+
+def _iniciar_shard(ctx: _ContextoSnapshot) -> None:
+    global _SNAPSHOT_CONTEXTO
+    _SNAPSHOT_CONTEXTO = ctx
+
+
+def _bloque_snapshot_shard(inicio: int, fin: int) -> pd.DataFrame:
+    # Corre en el proceso hijo con el contexto recibido en `_iniciar_shard`.
+    return _bloque_snapshot(_SNAPSHOT_CONTEXTO, inicio, fin)
+
+
+def _pool_shards(workers: int, ctx: _ContextoSnapshot) -> ProcessPoolExecutor | None:
+    if workers <= 1:
+        return None
+    metodo = _SNAPSHOT_START_METHOD if _SNAPSHOT_START_METHOD in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context(metodo),
+        initializer=_iniciar_shard,
+        initargs=(ctx,),
+    )
+
+
+def iterar_snapshot(
+    horas: list[int] | None = None,
+    carroceria: str = "GENERAL",
+    modo_viaje: str = "CARGADO",
+    filas_por_bloque: int = _SNAPSHOT_BLOQUE_RUTAS,
+    progreso: Callable[[int, int], None] | None = None,
+    workers: int | None = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Igual que `generar_snapshot` pero entrega el resultado por bloques de
+    `filas_por_bloque` rutas, para exportar sin materializar todo el snapshot.
+    `progreso(rutas_hechas, rutas_total)` se llama después de cada bloque.
+
+    Con `workers > 1` los bloques se reparten entre procesos hijos
+    (`SICETAC_SNAPSHOT_START_METHOD`, spawn por defecto) que reciben tarifa e
+    índice de peajes una vez al arrancar, y se entregan en el mismo orden que
+    en modo secuencial.
+    """
+    ctx = _contexto_snapshot(horas, carroceria, modo_viaje)
+    total = len(ctx.df_rutas)
+    filas_por_bloque = max(1, int(filas_por_bloque))
+    rangos = [(inicio, min(inicio + filas_por_bloque, total)) for inicio in range(0, total, filas_por_bloque)]
+    workers = min(_SNAPSHOT_WORKERS if workers is None else int(workers), len(rangos))
+
+    pool = _pool_shards(workers, ctx)
+    if pool is None:
+        for inicio, fin in rangos:
+            yield _bloque_snapshot(ctx, inicio, fin)
+            if progreso is not None:
+                progreso(fin, total)
+        return
+
+    # Ventana acotada de bloques en vuelo para no acumular resultados en memoria.
+    pendientes: deque = deque()
+    siguientes = iter(rangos)
+    try:
+        for inicio, fin in islice(siguientes, 2 * workers):
+            pendientes.append((fin, pool.submit(_bloque_snapshot_shard, inicio, fin)))
+        while pendientes:
+            fin, futuro = pendientes.popleft()
+            bloque = futuro.result()
+            rango = next(siguientes, None)
+            if rango is not None:
+                pendientes.append((rango[1], pool.submit(_bloque_snapshot_shard, *rango)))
+            yield bloque
+            if progreso is not None:
+                progreso(fin, total)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+# Helper de municipios (con su índice de prefijos) por DataFrame cacheado;
+# se reconstruye cuando el refresh reemplaza la tabla.
+_HELPER_MUNICIPIOS: tuple[pd.DataFrame, SICETACHelper] | None = None
+_SUGERENCIAS_MAX = int(os.getenv("SICETAC_SUGERENCIAS_MAX", "50"))
+
+
+def _helper_municipios(df_municipios: pd.DataFrame | None = None) -> SICETACHelper:
+    global _HELPER_MUNICIPIOS
+    if df_municipios is None:
+        df_municipios = get_table_df("municipios")
+    cache = _HELPER_MUNICIPIOS
+    if cache is not None and cache[0] is df_municipios:
+        return cache[1]
+    helper = SICETACHelper(df_municipios)
+    _HELPER_MUNICIPIOS = (df_municipios, helper)
+    return helper
+
+
+def sugerir_municipios(texto: str, limite: int = 10) -> list[dict[str, Any]]:
+    """Autocompletado de municipios por prefijo (ver `SICETACHelper.sugerir_municipios`)."""
+    _refresh_cache()
+    df_municipios = get_table_df("municipios")
+    if df_municipios.empty:
+        raise SicetacError(500, "Tabla de municipios no disponible o vacía.")
+    limite = max(1, min(int(limite), _SUGERENCIAS_MAX))
+    return _helper_municipios(df_municipios).sugerir_municipios(texto, limite)
+
 
-    return pd.DataFrame(rows)
+def generacion_datos() -> str:
+    """
+    Huella de los datos con que se cotiza: contenido de las tablas de
+    referencia y marca de agua de las tablas de lookup (o el momento del
+    último refresh si no tienen). Se usa para los ETag de las consultas.
+    """
+    global _GENERACION_DATOS
+    _refresh_cache()
+    if _GENERACION_DATOS is None:
+        partes = [f"{key}={get_table_generation(key)}" for key in _TABLAS_REFERENCIA]
+        for key in _TABLAS_LOOKUP:
+            marca = get_cached_watermark(key)
+            partes.append(f"{key}={marca if marca is not None else _LAST_REFRESH_TS}")
+        _GENERACION_DATOS = hashlib.sha1("|".join(partes).encode("utf-8")).hexdigest()[:16]
+    return _GENERACION_DATOS
+
+
+def mes_vigente() -> int:
+    """MES más reciente de `parametros_vigentes` (el que usa el snapshot)."""
+    _refresh_cache()
+    mes = _latest_mes(get_table_df("parametros"))
+    if mes is None:
+        raise SicetacError(500, "No se pudo determinar el MES más reciente.")
+    return mes
+
+
+def peajes_stats() -> dict[str, Any]:
+    """Claves y duplicados de la matriz de peajes vigente."""
+    _refresh_cache()
+    return _get_peajes_index(get_table_df("peajes")).duplicados()
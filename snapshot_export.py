@@ -0,0 +1,208 @@
+"""
+Exportación en streaming del snapshot SICETAC.
+
+El snapshot se escribe bloque a bloque (ver `iterar_snapshot`) a un archivo
+temporal en disco —xlsx en modo `constant_memory`, CSV o Parquet— y se sube
+al bucket leyendo desde el archivo, sin armar el libro completo ni copias en
+bytes en memoria. Cada exportación reporta tiempo y RSS pico del proceso.
+"""
+from __future__ import annotations
+
+import math
+import os
+import resource
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Any, Iterable
+
+import pandas as pd
+
+FORMATOS: dict[str, dict[str, str]] = {
+    "xlsx": {
+        "extension": "xlsx",
+        "content_type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    },
+    "csv": {"extension": "csv", "content_type": "text/csv"},
+    "parquet": {"extension": "parquet", "content_type": "application/vnd.apache.parquet"},
+}
+
+_HOJA_XLSX = "Sheet1"
+
+
+@dataclass
+class ResultadoExport:
+    ruta: str
+    formato: str
+    filas: int = 0
+    columnas: list[str] = field(default_factory=list)
+    mes: int | None = None
+    bytes: int = 0
+    segundos: float = 0.0
+    rss_pico_mb: float = 0.0
+    rss_pico_inicial_mb: float = 0.0
+
+    def resumen(self) -> dict[str, Any]:
+        return {
+            "formato": self.formato,
+            "filas": self.filas,
+            "bytes": self.bytes,
+            "segundos": round(self.segundos, 3),
+            "rss_pico_mb": round(self.rss_pico_mb, 1),
+            "rss_pico_incremento_mb": round(max(0.0, self.rss_pico_mb - self.rss_pico_inicial_mb), 1),
+        }
+
+
+def rss_pico_mb() -> float:
+    """RSS máximo del proceso (ru_maxrss viene en KB en Linux y en bytes en macOS)."""
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+
+
+def normalizar_formato(formato: str | None) -> str:
+    formato_norm = str(formato or "xlsx").strip().lower()
+    if formato_norm not in FORMATOS:
+        raise ValueError(f"Formato no soportado: {formato}. Usa uno de: {', '.join(FORMATOS)}")
+    return formato_norm
+
+
+def _valor_celda(valor: Any) -> Any:
+    if isinstance(valor, float) and math.isnan(valor):
+        return None
+    return valor
+
+
+class _EscritorXlsx:
+    def __init__(self, ruta: str, separar_por: list[str] | None = None):
+        try:
+            import xlsxwriter
+        except ImportError as e:
+            raise RuntimeError("Exportar a xlsx requiere el paquete 'xlsxwriter'.") from e
+        self._libro = xlsxwriter.Workbook(ruta, {"constant_memory": True})
+        self._separar_por = list(separar_por or [])
+        # constant_memory es por hoja: se puede alternar entre hojas siempre
+        # que cada una reciba sus filas en orden.
+        self._hojas: dict[tuple, list] = {}
+
+    def _hoja(self, clave: tuple, columnas: list[str]) -> list:
+        hoja = self._hojas.get(clave)
+        if hoja is None:
+            nombre = " ".join(str(v) for v in clave)[:31] if clave else _HOJA_XLSX
+            worksheet = self._libro.add_worksheet(nombre)
+            worksheet.write_row(0, 0, columnas)
+            hoja = self._hojas[clave] = [worksheet, 1]
+        return hoja
+
+    def escribir(self, df: pd.DataFrame) -> None:
+        if self._separar_por:
+            grupos = df.groupby(self._separar_por, sort=False)
+            partes = [((k,) if not isinstance(k, tuple) else k, g.drop(columns=self._separar_por)) for k, g in grupos]
+        else:
+            partes = [((), df)]
+        for clave, parte in partes:
+            hoja = self._hoja(clave, list(parte.columns))
+            worksheet, fila_actual = hoja
+            # `tolist()` por columna entrega tipos nativos de Python.
+            for fila in zip(*(parte[c].tolist() for c in parte.columns)):
+                worksheet.write_row(fila_actual, 0, [_valor_celda(v) for v in fila])
+                fila_actual += 1
+            hoja[1] = fila_actual
+
+    def cerrar(self) -> None:
+        self._libro.close()
+
+
+class _EscritorCsv:
+    def __init__(self, ruta: str):
+        self._fh = open(ruta, "w", encoding="utf-8", newline="")
+        self._encabezado = True
+
+    def escribir(self, df: pd.DataFrame) -> None:
+        df.to_csv(self._fh, index=False, header=self._encabezado)
+        self._encabezado = False
+
+    def cerrar(self) -> None:
+        self._fh.close()
+
+
+class _EscritorParquet:
+    def __init__(self, ruta: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Exportar a parquet requiere el paquete 'pyarrow'.") from e
+        self._pa = pa
+        self._pq = pq
+        self._ruta = ruta
+        self._writer = None
+
+    def escribir(self, df: pd.DataFrame) -> None:
+        tabla = self._pa.Table.from_pandas(df, preserve_index=False)
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self._ruta, tabla.schema)
+        else:
+            tabla = tabla.cast(self._writer.schema)
+        self._writer.write_table(tabla)
+
+    def cerrar(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+
+_ESCRITORES = {"xlsx": _EscritorXlsx, "csv": _EscritorCsv, "parquet": _EscritorParquet}
+
+
+def exportar_bloques(
+    bloques: Iterable[pd.DataFrame],
+    formato: str = "xlsx",
+    directorio: str | None = None,
+    separar_por: list[str] | None = None,
+) -> ResultadoExport:
+    """
+    Escribe los bloques en un archivo temporal y devuelve su ruta y métricas.
+    El llamador es responsable de borrar el archivo (`os.remove(resultado.ruta)`).
+
+    `separar_por` (solo xlsx) escribe una hoja por combinación de esas
+    columnas, p. ej. `["carroceria", "modo_viaje"]` en el snapshot largo.
+    """
+    formato = normalizar_formato(formato)
+    fd, ruta = tempfile.mkstemp(prefix="sicetac_snapshot_", suffix=f".{FORMATOS[formato]['extension']}", dir=directorio)
+    os.close(fd)
+    resultado = ResultadoExport(ruta=ruta, formato=formato, rss_pico_inicial_mb=rss_pico_mb())
+    inicio = time.perf_counter()
+    escritor = None
+    try:
+        escritor = _EscritorXlsx(ruta, separar_por) if formato == "xlsx" else _ESCRITORES[formato](ruta)
+        for df in bloques:
+            if df.empty:
+                continue
+            if not resultado.columnas:
+                resultado.columnas = list(df.columns)
+                if "mes" in df.columns:
+                    resultado.mes = int(df["mes"].iloc[0])
+            escritor.escribir(df)
+            resultado.filas += len(df)
+        escritor.cerrar()
+    except BaseException:
+        try:
+            if escritor is not None:
+                escritor.cerrar()
+        finally:
+            os.remove(ruta)
+        raise
+    resultado.bytes = os.path.getsize(ruta)
+    resultado.segundos = time.perf_counter() - inicio
+    resultado.rss_pico_mb = rss_pico_mb()
+    return resultado
+
+
+def subir_archivo(bucket: Any, nombre: str, ruta: str, formato: str) -> None:
+    """Sube el archivo desde disco; el cliente de storage lo envía leyendo por chunks."""
+    with open(ruta, "rb") as fh:
+        bucket.upload(
+            nombre,
+            fh,
+            {"content-type": FORMATOS[formato]["content_type"], "upsert": True},
+        )
@@ -0,0 +1,282 @@
+"""
+Cola local de jobs de snapshot.
+
+`POST /snapshot/generate` encola un job y responde de inmediato con su id; el
+cálculo, la exportación y la subida al bucket corren en un pool de procesos
+para no competir por el GIL con las cotizaciones. El progreso (rutas
+hechas/total) se comparte con el proceso de la API mediante un
+`multiprocessing.Manager`. Los jobs activos se deduplican por
+(mes, carroceria, modo_viaje) y se pueden cancelar.
+"""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Any
+
+logger = logging.getLogger("snapshot_jobs")
+
+_WORKERS = int(os.getenv("SICETAC_SNAPSHOT_WORKERS", "1"))
+_START_METHOD = os.getenv("SICETAC_SNAPSHOT_START_METHOD", "spawn").strip() or "spawn"
+_JOBS_TTL_SECONDS = int(os.getenv("SICETAC_SNAPSHOT_JOBS_TTL_SECONDS", str(24 * 3600)))
+
+EN_COLA = "en_cola"
+EJECUTANDO = "ejecutando"
+COMPLETADO = "completado"
+ERROR = "error"
+CANCELADO = "cancelado"
+_ACTIVOS = (EN_COLA, EJECUTANDO)
+
+
+class SnapshotCancelado(Exception):
+    pass
+
+
+@dataclass
+class SnapshotJob:
+    id: str
+    mes: int
+    carroceria: str
+    modo_viaje: str
+    formato: str
+    hojas: bool = False
+    estado: str = EN_COLA
+    creado: float = field(default_factory=time.time)
+    terminado: float | None = None
+    resultado: dict[str, Any] | None = None
+    error: str | None = None
+    future: Future | None = field(default=None, repr=False)
+
+    @property
+    def clave(self) -> tuple[int, str, str]:
+        return (self.mes, self.carroceria, self.modo_viaje)
+
+
+# ---------------------------
+# Trabajo en el proceso hijo
+# ---------------------------
+def _sufijo_archivo(carroceria: str, modo_viaje: str) -> str:
+    partes = []
+    for valor in (carroceria, modo_viaje):
+        valor = valor.replace("*", "todas").replace(",", "-")
+        partes.append(re.sub(r"[^A-Za-z0-9_-]+", "_", valor).strip("_"))
+    return "_".join(partes).lower()
+
+
+def _ejecutar_snapshot(
+    job_id: str,
+    carroceria: str,
+    modo_viaje: str,
+    formato: str,
+    hojas: bool,
+    progreso_compartido: Any,
+    cancelados: Any,
+) -> dict[str, Any]:
+    # Imports dentro del worker: el proceso hijo carga su propio estado.
+    from sicetac_service import iterar_snapshot, variantes_snapshot
+    from snapshot_export import FORMATOS, exportar_bloques, subir_archivo
+    from supabase_data import get_client
+
+    inicio = time.time()
+
+    def _progreso(hechas: int, total: int) -> None:
+        progreso_compartido[job_id] = {
+            "fase": "calculando",
+            "rutas_hechas": hechas,
+            "rutas_total": total,
+            "iniciado": inicio,
+        }
+        if cancelados.get(job_id):
+            raise SnapshotCancelado(job_id)
+
+    progreso_compartido[job_id] = {"fase": "cargando", "rutas_hechas": 0, "rutas_total": None, "iniciado": inicio}
+    _carrocerias, _modos, largo = variantes_snapshot(carroceria, modo_viaje)
+    export = exportar_bloques(
+        iterar_snapshot(horas=[0, 2, 4, 8], carroceria=carroceria, modo_viaje=modo_viaje, progreso=_progreso),
+        formato=formato,
+        separar_por=["carroceria", "modo_viaje"] if largo and hojas else None,
+    )
+    try:
+        if export.filas == 0:
+            raise RuntimeError("Snapshot vacío")
+        if cancelados.get(job_id):
+            raise SnapshotCancelado(job_id)
+        mes = export.mes if export.mes is not None else "latest"
+        sufijo = "all" if (carroceria, modo_viaje) == ("GENERAL", "CARGADO") else _sufijo_archivo(carroceria, modo_viaje)
+        filename = f"sicetac_snapshot_{mes}_{sufijo}.{FORMATOS[export.formato]['extension']}"
+
+        progreso_compartido[job_id] = {**progreso_compartido[job_id], "fase": "subiendo"}
+        bucket = get_client().storage.from_("snapshots")
+        subir_archivo(bucket, filename, export.ruta, export.formato)
+    finally:
+        os.remove(export.ruta)
+
+    return {"ok": True, "file": filename, "url": bucket.get_public_url(filename), "export": export.resumen()}
+
+
+# ---------------------------
+# Registro en el proceso de la API
+# ---------------------------
+class SnapshotJobs:
+    def __init__(self, workers: int = _WORKERS, start_method: str = _START_METHOD):
+        self._workers = max(1, workers)
+        self._start_method = start_method
+        self._lock = threading.Lock()
+        self._jobs: dict[str, SnapshotJob] = {}
+        self._executor: ProcessPoolExecutor | None = None
+        self._manager = None
+        self._progreso = None
+        self._cancelados = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            contexto = multiprocessing.get_context(self._start_method)
+            self._manager = contexto.Manager()
+            self._progreso = self._manager.dict()
+            self._cancelados = self._manager.dict()
+            self._executor = ProcessPoolExecutor(max_workers=self._workers, mp_context=contexto)
+        return self._executor
+
+    def _purgar(self) -> None:
+        limite = time.time() - _JOBS_TTL_SECONDS
+        for job_id in [j.id for j in self._jobs.values() if j.terminado is not None and j.terminado < limite]:
+            self._jobs.pop(job_id, None)
+            if self._progreso is not None:
+                self._progreso.pop(job_id, None)
+                self._cancelados.pop(job_id, None)
+
+    def enviar(
+        self,
+        *,
+        mes: int,
+        carroceria: str,
+        modo_viaje: str,
+        formato: str,
+        hojas: bool = False,
+    ) -> tuple[SnapshotJob, bool]:
+        """Encola un job; si ya hay uno activo para la misma clave lo devuelve (creado=False)."""
+        carroceria = ",".join(c.strip() for c in (carroceria or "GENERAL").upper().split(",") if c.strip())
+        modo_viaje = ",".join(m.strip() for m in (modo_viaje or "CARGADO").upper().split(",") if m.strip())
+        with self._lock:
+            self._purgar()
+            for job in self._jobs.values():
+                if job.estado in _ACTIVOS and job.clave == (mes, carroceria, modo_viaje):
+                    return job, False
+
+            job = SnapshotJob(
+                id=uuid.uuid4().hex,
+                mes=mes,
+                carroceria=carroceria,
+                modo_viaje=modo_viaje,
+                formato=formato,
+                hojas=hojas,
+            )
+            argumentos = (job.id, carroceria, modo_viaje, formato, hojas)
+            try:
+                future = self._pool().submit(_ejecutar_snapshot, *argumentos, self._progreso, self._cancelados)
+            except BrokenProcessPool:
+                self._executor = None
+                future = self._pool().submit(_ejecutar_snapshot, *argumentos, self._progreso, self._cancelados)
+            job.future = future
+            self._jobs[job.id] = job
+        future.add_done_callback(lambda f, job=job: self._terminar(job, f))
+        return job, True
+
+    def _terminar(self, job: SnapshotJob, future: Future) -> None:
+        with self._lock:
+            job.terminado = time.time()
+            if future.cancelled():
+                job.estado = CANCELADO
+                return
+            error = future.exception()
+            if error is None:
+                job.estado = COMPLETADO
+                job.resultado = future.result()
+            elif isinstance(error, SnapshotCancelado):
+                job.estado = CANCELADO
+            else:
+                job.estado = ERROR
+                job.error = str(error)
+                logger.warning(f"⚠️ Snapshot {job.id} falló: {error}")
+                if isinstance(error, BrokenProcessPool):
+                    self._executor = None
+
+    def obtener(self, job_id: str) -> SnapshotJob | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancelar(self, job_id: str) -> SnapshotJob | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.estado not in _ACTIVOS:
+                return job
+            self._cancelados[job_id] = True
+        # Si aún está en cola se cancela sin ejecutarse; si corre, el worker
+        # lo detiene al terminar el bloque de rutas en curso.
+        if job.future is not None:
+            job.future.cancel()
+        return job
+
+    def esperar(self, job_id: str, timeout: float | None = None) -> SnapshotJob | None:
+        job = self.obtener(job_id)
+        if job is not None and job.future is not None:
+            try:
+                job.future.result(timeout=timeout)
+            except Exception:
+                pass
+            # El callback de terminación puede correr un instante después.
+            while job.future.done() and job.terminado is None:
+                time.sleep(0.01)
+        return job
+
+    def estado(self, job: SnapshotJob) -> dict[str, Any]:
+        with self._lock:
+            progreso = dict(self._progreso.get(job.id) or {}) if self._progreso is not None else {}
+            if job.estado == EN_COLA and progreso:
+                job.estado = EJECUTANDO
+            cancelando = job.estado in _ACTIVOS and self._cancelados is not None and bool(self._cancelados.get(job.id))
+            datos: dict[str, Any] = {
+                "job_id": job.id,
+                "estado": job.estado,
+                "mes": job.mes,
+                "carroceria": job.carroceria,
+                "modo_viaje": job.modo_viaje,
+                "formato": job.formato,
+                "creado": job.creado,
+                "terminado": job.terminado,
+                "cancelacion_solicitada": cancelando,
+            }
+        hechas = progreso.get("rutas_hechas") or 0
+        total = progreso.get("rutas_total")
+        iniciado = progreso.get("iniciado")
+        eta = None
+        if job.estado == EJECUTANDO and total and hechas and iniciado:
+            eta = round((time.time() - iniciado) / hechas * (total - hechas), 1)
+        datos["progreso"] = {
+            "fase": progreso.get("fase") if job.estado == EJECUTANDO else job.estado,
+            "rutas_hechas": hechas,
+            "rutas_total": total,
+            "porcentaje": round(100.0 * hechas / total, 1) if total else None,
+            "eta_segundos": eta,
+        }
+        if job.resultado is not None:
+            datos["resultado"] = job.resultado
+        if job.error is not None:
+            datos["error"] = job.error
+        return datos
+
+    def listar(self) -> list[dict[str, Any]]:
+        with self._lock:
+            jobs = sorted(self._jobs.values(), key=lambda j: j.creado, reverse=True)
+        return [self.estado(j) for j in jobs]
+
+
+SNAPSHOT_JOBS = SnapshotJobs()
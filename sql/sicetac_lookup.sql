@@ -0,0 +1,89 @@
+-- Lookup combinado del consolidado SICETAC en un solo round trip.
+--
+-- `sicetac_lookup_carril` devuelve para un carril la movilización (primero
+-- origen→destino y, si no hay filas, destino→origen), el valor hora de la
+-- configuración y, si se pasa `p_ruta`, el valor plaza de la ruta. Los filtros
+-- son los mismos de las consultas por tabla de `supabase_data.py`.
+-- `sicetac_lookup_carriles` hace lo mismo para un arreglo JSON de carriles
+-- [{"origen", "destino", "configuracion", "ruta"}] y responde en el mismo orden.
+--
+-- Usa los nombres de tabla por defecto; si se cambian con SICETAC_TABLE_*
+-- hay que ajustarlos aquí. Se instala con `psql -f sql/sicetac_lookup.sql`
+-- (o en el editor SQL de Supabase).
+
+create or replace function public.sicetac_lookup_carril(
+    p_origen text,
+    p_destino text,
+    p_configuracion text,
+    p_ruta text default null
+) returns jsonb
+language plpgsql
+stable
+as $$
+declare
+    v_movilizacion jsonb;
+    v_sentido text := 'directo';
+begin
+    select coalesce(jsonb_agg(to_jsonb(m)), '[]'::jsonb)
+      into v_movilizacion
+      from public.sicetac_movilizacion_vigentes m
+     where m.origen::text = p_origen
+       and m.destino::text = p_destino
+       and m.configuracion ilike p_configuracion;
+
+    if jsonb_array_length(v_movilizacion) = 0 then
+        v_sentido := 'inverso';
+        select coalesce(jsonb_agg(to_jsonb(m)), '[]'::jsonb)
+          into v_movilizacion
+          from public.sicetac_movilizacion_vigentes m
+         where m.origen::text = p_destino
+           and m.destino::text = p_origen
+           and m.configuracion ilike p_configuracion;
+    end if;
+
+    return jsonb_build_object(
+        'origen', p_origen,
+        'destino', p_destino,
+        'configuracion', p_configuracion,
+        'ruta', p_ruta,
+        'sentido', v_sentido,
+        'movilizacion', v_movilizacion,
+        'valorhora', (
+            select coalesce(jsonb_agg(to_jsonb(v)), '[]'::jsonb)
+              from (
+                  select *
+                    from public.sicetac_valorhora_vigentes
+                   where configuracion ilike p_configuracion
+                   limit 1
+              ) v
+        ),
+        'valor_plaza', case
+            when p_ruta is null then null
+            else (
+                select coalesce(jsonb_agg(to_jsonb(p) order by p.mes_codigo desc nulls last), '[]'::jsonb)
+                  from public.valor_en_plaza_mensual_descriptiva p
+                 where p.ruta::text = p_ruta
+                   and p.configuracion ilike p_configuracion
+            )
+        end
+    );
+end;
+$$;
+
+create or replace function public.sicetac_lookup_carriles(p_carriles jsonb)
+returns jsonb
+language sql
+stable
+as $$
+    select coalesce(
+        jsonb_agg(
+            public.sicetac_lookup_carril(c->>'origen', c->>'destino', c->>'configuracion', c->>'ruta')
+            order by n
+        ),
+        '[]'::jsonb
+    )
+      from jsonb_array_elements(p_carriles) with ordinality as e(c, n);
+$$;
+
+-- PostgREST recarga el esquema para exponer las funciones como /rpc.
+notify pgrst, 'reload schema';
@@ -1,9 +1,14 @@
 from __future__ import annotations
 
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
 import os
 import logging
+import threading
+import time
 from functools import lru_cache
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, Hashable, Iterator, List
 
 import pandas as pd
 from supabase import create_client
@@ -37,6 +42,210 @@ TABLES: Dict[str, str] = {
 }
 
 
+# Columna usada como marca de agua para detectar cambios sin descargar la tabla.
+WATERMARK_COLUMN = os.getenv("SICETAC_WATERMARK_COLUMN", "updated_at").strip()
+
+# TTL (segundos) del cache de lookups puntuales según el resultado.
+LOOKUP_TTL_HIT = float(os.getenv("SICETAC_LOOKUP_TTL_HIT", str(24 * 3600)))
+LOOKUP_TTL_MISS = float(os.getenv("SICETAC_LOOKUP_TTL_MISS", "900"))
+LOOKUP_TTL_ERROR = float(os.getenv("SICETAC_LOOKUP_TTL_ERROR", "15"))
+
+# Lookup combinado del consolidado (movilización en ambos sentidos, valor hora
+# y valor plaza) en una sola llamada a una función SQL (sql/sicetac_lookup.sql).
+# Si la función falla o no existe, se vuelve a las consultas por tabla y no se
+# reintenta durante SICETAC_LOOKUP_RPC_BACKOFF segundos.
+USE_LOOKUP_RPC = os.getenv("SICETAC_USE_LOOKUP_RPC", "true").strip().lower() != "false"
+LOOKUP_RPC = os.getenv("SICETAC_LOOKUP_RPC", "sicetac_lookup_carril").strip()
+LOOKUP_RPC_LOTE = os.getenv("SICETAC_LOOKUP_RPC_LOTE", "sicetac_lookup_carriles").strip()
+LOOKUP_RPC_BACKOFF = float(os.getenv("SICETAC_LOOKUP_RPC_BACKOFF", "300"))
+
+
+class _Llamada:
+    __slots__ = ("evento", "resultado", "error")
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Coalesce llamadas concurrentes idénticas: mientras una consulta está en
+    vuelo, las demás con la misma clave esperan y reciben su mismo resultado
+    (o su misma excepción). No cachea nada al terminar.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._en_vuelo: Dict[Hashable, _Llamada] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _contar(self, tipo: str, campo: str) -> None:
+        por_tipo = self._stats.setdefault(tipo, {"llamadas": 0, "ejecutadas": 0, "compartidas": 0})
+        por_tipo[campo] += 1
+
+    def do(self, key: tuple, fn: Callable[[], Any]) -> Any:
+        tipo = str(key[0])
+        with self._lock:
+            self._contar(tipo, "llamadas")
+            llamada = self._en_vuelo.get(key)
+            lider = llamada is None
+            if lider:
+                llamada = _Llamada()
+                self._en_vuelo[key] = llamada
+                self._contar(tipo, "ejecutadas")
+            else:
+                self._contar(tipo, "compartidas")
+
+        if not lider:
+            llamada.evento.wait()
+            if llamada.error is not None:
+                raise llamada.error
+            return llamada.resultado
+
+        try:
+            llamada.resultado = fn()
+            return llamada.resultado
+        except BaseException as e:
+            llamada.error = e
+            raise
+        finally:
+            with self._lock:
+                self._en_vuelo.pop(key, None)
+            llamada.evento.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            por_tipo = {tipo: dict(valores) for tipo, valores in self._stats.items()}
+            en_vuelo = len(self._en_vuelo)
+        total = {"llamadas": 0, "ejecutadas": 0, "compartidas": 0}
+        for valores in por_tipo.values():
+            for campo in total:
+                total[campo] += valores[campo]
+        return {"total": total, "por_tipo": por_tipo, "en_vuelo": en_vuelo}
+
+
+_SINGLE_FLIGHT = SingleFlight()
+
+
+@dataclass
+class _EntradaLookup:
+    estado: str
+    valor: Any
+    expira: float
+
+
+class LookupCache:
+    """
+    Cache con TTL distinto por resultado: `hit`, `miss` (sin filas) y
+    `error` (fallo transitorio; solo un backoff corto para no martillar
+    Supabase, nunca hasta el próximo refresh).
+    """
+
+    ESTADOS = ("hit", "miss", "error")
+
+    def __init__(self, *, ttl_hit: float, ttl_miss: float, ttl_error: float, maxsize: int = 4096):
+        self._ttl = {"hit": ttl_hit, "miss": ttl_miss, "error": ttl_error}
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entradas: Dict[Hashable, _EntradaLookup] = {}
+        self._stats = {"consultas": 0, "expiradas": 0, **{e: 0 for e in self.ESTADOS}}
+
+    def get(self, key: Hashable) -> _EntradaLookup | None:
+        with self._lock:
+            self._stats["consultas"] += 1
+            entrada = self._entradas.get(key)
+            if entrada is None:
+                return None
+            if entrada.expira <= time.monotonic():
+                del self._entradas[key]
+                self._stats["expiradas"] += 1
+                return None
+            self._stats[entrada.estado] += 1
+            return entrada
+
+    def put(self, key: Hashable, estado: str, valor: Any) -> None:
+        with self._lock:
+            if key not in self._entradas and len(self._entradas) >= self._maxsize:
+                # Descarta la entrada más antigua (orden de inserción).
+                self._entradas.pop(next(iter(self._entradas)))
+            self._entradas[key] = _EntradaLookup(estado, valor, time.monotonic() + self._ttl[estado])
+
+    def contiene(self, key: Hashable) -> bool:
+        """Si hay entrada vigente, sin contar la consulta en las estadísticas."""
+        with self._lock:
+            entrada = self._entradas.get(key)
+            return entrada is not None and entrada.expira > time.monotonic()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entradas.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            por_estado = {e: 0 for e in self.ESTADOS}
+            for entrada in self._entradas.values():
+                por_estado[entrada.estado] += 1
+            return {"entradas": len(self._entradas), "por_estado": por_estado, "aciertos": dict(self._stats)}
+
+
+_LOOKUP_CACHES: Dict[str, LookupCache] = {
+    key: LookupCache(ttl_hit=LOOKUP_TTL_HIT, ttl_miss=LOOKUP_TTL_MISS, ttl_error=LOOKUP_TTL_ERROR)
+    for key in ("sicetac_movilizacion", "sicetac_valorhora", "valor_plaza")
+}
+
+_LOOKUP_RPC_FN: Callable[[str, Dict[str, Any]], Any] | None = None
+_LOOKUP_RPC_LOCK = threading.Lock()
+_LOOKUP_RPC_PAUSA_HASTA = 0.0
+_LOOKUP_RPC_STATS = {"llamadas": 0, "carriles": 0, "fallos": 0}
+
+
+# Lookups respondidos con error (recién fallados o desde el cache de errores)
+# dentro del contexto abierto con `seguimiento_lookups`.
+_LOOKUP_ERRORES: ContextVar[List[str] | None] = ContextVar("lookup_errores", default=None)
+
+
+@contextmanager
+def seguimiento_lookups() -> Iterator[List[str]]:
+    """
+    Registra en la lista entregada los lookups que, dentro del bloque, no
+    pudieron consultarse (la cotización cayó al modelo por un fallo y no por
+    falta de datos).
+    """
+    errores: List[str] = []
+    token = _LOOKUP_ERRORES.set(errores)
+    try:
+        yield errores
+    finally:
+        _LOOKUP_ERRORES.reset(token)
+
+
+def _registrar_error_lookup(nombre: str) -> None:
+    errores = _LOOKUP_ERRORES.get()
+    if errores is not None:
+        errores.append(nombre)
+
+
+def clear_lookup_cache(key: str | None = None) -> None:
+    for nombre, cache in _LOOKUP_CACHES.items():
+        if key is None or key == nombre:
+            cache.clear()
+
+
+def get_lookup_cache_stats() -> Dict[str, Any]:
+    return {
+        "ttl": {"hit": LOOKUP_TTL_HIT, "miss": LOOKUP_TTL_MISS, "error": LOOKUP_TTL_ERROR},
+        **{nombre: cache.stats() for nombre, cache in _LOOKUP_CACHES.items()},
+        "rpc": get_lookup_rpc_stats(),
+    }
+
+
+def get_singleflight_stats() -> Dict[str, Any]:
+    """Contadores del single-flight; `compartidas` = round trips ahorrados."""
+    return _SINGLE_FLIGHT.stats()
+
+
 def _require_supabase() -> None:
     if not SUPABASE_URL or not SUPABASE_KEY:
         raise RuntimeError("Faltan SUPABASE_URL o SUPABASE_SERVICE_ROLE_KEY/SUPABASE_KEY en el entorno.")
@@ -62,28 +271,59 @@ def _fetch_table_all(table: str, page_size: int = 1000) -> List[Dict[str, Any]]:
     return rows
 
 
+def _apply_filters(query, filters: list[tuple[str, str, Any]] | None):
+    for column, op, value in (filters or []):
+        if op == "eq":
+            query = query.eq(column, value)
+        elif op == "ilike":
+            query = query.ilike(column, value)
+        elif op == "gte":
+            query = query.gte(column, value)
+        elif op == "in":
+            query = query.in_(column, list(value))
+        else:
+            raise ValueError(f"Operador no soportado: {op}")
+    return query
+
+
 def _fetch_table_filtered(
     table: str,
     *,
     select: str = "*",
     filters: list[tuple[str, str, Any]] | None = None,
     limit: int | None = None,
+    order: tuple[str, bool] | None = None,
 ) -> List[Dict[str, Any]]:
     client = get_client()
-    query = client.table(table).select(select)
-    for column, op, value in (filters or []):
-        if op == "eq":
-            query = query.eq(column, value)
-        elif op == "ilike":
-            query = query.ilike(column, value)
-        else:
-            raise ValueError(f"Operador no soportado: {op}")
+    query = _apply_filters(client.table(table).select(select), filters)
+    if order is not None:
+        query = query.order(order[0], desc=order[1])
     if limit is not None:
         query = query.limit(limit)
     resp = query.execute()
     return resp.data or []
 
 
+def _fetch_table_filtered_all(
+    table: str,
+    *,
+    filters: list[tuple[str, str, Any]] | None = None,
+    page_size: int = 1000,
+) -> List[Dict[str, Any]]:
+    client = get_client()
+    start = 0
+    rows: List[Dict[str, Any]] = []
+    while True:
+        query = _apply_filters(client.table(table).select("*"), filters)
+        resp = query.range(start, start + page_size - 1).execute()
+        data = resp.data or []
+        rows.extend(data)
+        if len(data) < page_size:
+            break
+        start += page_size
+    return rows
+
+
 def _alias_columns(df: pd.DataFrame) -> pd.DataFrame:
     """
     Crea alias de columnas en MAYÚSCULA y minúscula para tolerar cambios de casing.
@@ -152,90 +392,501 @@ def _alias_columns(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-@lru_cache(maxsize=None)
-def get_table_df(key: str) -> pd.DataFrame:
+@dataclass
+class CambioTabla:
+    key: str
+    cambiado: bool
+    metodo: str
+    agregadas: pd.DataFrame = field(default_factory=pd.DataFrame)
+    removidas: pd.DataFrame = field(default_factory=pd.DataFrame)
+
+    def resumen(self) -> Dict[str, Any]:
+        return {
+            "cambiado": self.cambiado,
+            "metodo": self.metodo,
+            "filas_agregadas": int(len(self.agregadas)),
+            "filas_removidas": int(len(self.removidas)),
+        }
+
+
+_TABLE_CACHE: Dict[str, pd.DataFrame] = {}
+_TABLE_ROW_HASHES: Dict[str, pd.Series] = {}
+_TABLE_WATERMARKS: Dict[str, tuple[Any, Any]] = {}
+_TABLES_WITHOUT_WATERMARK: set[str] = set()
+
+
+def _fetch_table_watermark(table: str, column: str) -> tuple[Any, Any]:
+    client = get_client()
+    resp = (
+        client.table(table)
+        .select(column, count="exact")
+        .order(column, desc=True)
+        .limit(1)
+        .execute()
+    )
+    data = resp.data or []
+    return (resp.count, data[0].get(column) if data else None)
+
+
+class MarcaAguaNoDisponible(RuntimeError):
+    """Falla transitoria al leer la marca de agua; se reintenta en el próximo refresh."""
+
+
+def _es_columna_faltante(error: Exception) -> bool:
+    # PostgREST responde el código de Postgres 42703 (undefined_column).
+    codigo = getattr(error, "code", None)
+    if codigo is None and error.args and isinstance(error.args[0], dict):
+        codigo = error.args[0].get("code")
+    return str(codigo) == "42703" or "does not exist" in str(error)
+
+
+def get_table_watermark(key: str) -> tuple[Any, Any] | None:
+    """
+    (conteo, max(updated_at)) de la tabla, o None si no tiene la columna de
+    marca de agua. Solo las tablas sin la columna se recuerdan para no
+    reintentar; otros errores (red, timeouts) levantan MarcaAguaNoDisponible.
+    """
+    table = TABLES.get(key, key)
+    if not WATERMARK_COLUMN or table in _TABLES_WITHOUT_WATERMARK:
+        return None
+    try:
+        return _fetch_table_watermark(table, WATERMARK_COLUMN)
+    except Exception as e:
+        if not _es_columna_faltante(e):
+            logger.warning(f"⚠️ No se pudo leer la marca de agua de {table}: {e}")
+            raise MarcaAguaNoDisponible(str(e)) from e
+        logger.info(f"Tabla {table} sin marca de agua '{WATERMARK_COLUMN}': {e}")
+        _TABLES_WITHOUT_WATERMARK.add(table)
+        return None
+
+
+def _row_hashes(df: pd.DataFrame) -> pd.Series:
+    if df.empty:
+        return pd.Series(dtype="uint64")
+    ordered = df.reindex(columns=sorted(df.columns, key=str))
+    try:
+        return pd.util.hash_pandas_object(ordered, index=False)
+    except TypeError:
+        return pd.util.hash_pandas_object(ordered.astype(str), index=False)
+
+
+def _load_table(key: str) -> tuple[pd.DataFrame, pd.Series]:
     table = TABLES.get(key, key)
     try:
         rows = _fetch_table_all(table)
         if not rows:
-            return pd.DataFrame()
-        df = pd.DataFrame(rows)
-        df = _alias_columns(df)
-        return df
+            return pd.DataFrame(), pd.Series(dtype="uint64")
+        raw = pd.DataFrame(rows)
+        hashes = _row_hashes(raw)
+        return _alias_columns(raw), hashes
     except Exception as e:
         logger.warning(f"⚠️ No se pudo cargar tabla {table}: {e}")
-        return pd.DataFrame()
+        return pd.DataFrame(), pd.Series(dtype="uint64")
+
+
+def get_table_df(key: str) -> pd.DataFrame:
+    df = _TABLE_CACHE.get(key)
+    if df is None:
+        df, hashes = _SINGLE_FLIGHT.do(("tabla", key), lambda: _load_table(key))
+        _TABLE_CACHE[key] = df
+        _TABLE_ROW_HASHES[key] = hashes
+    return df
+
+
+def get_table_generation(key: str) -> str:
+    """
+    Huella del contenido cacheado de la tabla (filas + suma de hashes por
+    fila). No depende del orden y solo cambia si cambian las filas.
+    """
+    get_table_df(key)
+    hashes = _TABLE_ROW_HASHES.get(key)
+    if hashes is None or hashes.empty:
+        return "0"
+    return f"{len(hashes)}-{int(hashes.to_numpy().sum(dtype='uint64')):x}"
+
+
+def get_cached_watermark(key: str) -> tuple[Any, Any] | None:
+    """Última marca de agua vista en `table_changed`, sin consultar Supabase."""
+    return _TABLE_WATERMARKS.get(key)
+
+
+def clear_table_cache(key: str | None = None) -> None:
+    keys = [key] if key is not None else list(_TABLE_CACHE)
+    for k in keys:
+        _TABLE_CACHE.pop(k, None)
+        _TABLE_ROW_HASHES.pop(k, None)
+        _TABLE_WATERMARKS.pop(k, None)
+
+
+def table_changed(key: str) -> bool | None:
+    """
+    Compara solo la marca de agua; None si la tabla no tiene columna de
+    marca de agua y no se puede saber sin descargarla. Levanta
+    MarcaAguaNoDisponible si la lectura falló.
+    """
+    watermark = get_table_watermark(key)
+    if watermark is None:
+        return None
+    previous = _TABLE_WATERMARKS.get(key)
+    _TABLE_WATERMARKS[key] = watermark
+    return previous is None or previous != watermark
+
+
+def refresh_table(key: str) -> CambioTabla:
+    """
+    Detecta cambios en una tabla de referencia y actualiza su cache.
+
+    Usa primero la marca de agua (conteo + max(updated_at)). Si cambió o la
+    tabla no la tiene, descarga la tabla y compara hashes por fila para
+    devolver solo las filas agregadas/removidas. Si nada cambió se conserva
+    el DataFrame previo, de modo que los índices derivados siguen válidos.
+    """
+    if key not in _TABLE_CACHE:
+        _TABLE_WATERMARKS.pop(key, None)
+        try:
+            table_changed(key)
+        except MarcaAguaNoDisponible:
+            pass
+        get_table_df(key)
+        return CambioTabla(key=key, cambiado=True, metodo="inicial")
+
+    try:
+        changed = table_changed(key)
+    except MarcaAguaNoDisponible:
+        # Se conserva lo cacheado; el próximo refresh vuelve a intentar.
+        return CambioTabla(key=key, cambiado=False, metodo="error")
+    if changed is False:
+        return CambioTabla(key=key, cambiado=False, metodo="watermark")
+
+    df_old = _TABLE_CACHE[key]
+    df_new, hashes_new = _load_table(key)
+    if df_new.empty and not df_old.empty:
+        # Falla transitoria o tabla vacía: no se invalida lo que ya funciona.
+        _TABLE_WATERMARKS.pop(key, None)
+        return CambioTabla(key=key, cambiado=False, metodo="error")
+
+    hashes_old = _TABLE_ROW_HASHES.get(key, pd.Series(dtype="uint64"))
+    old_set = set(hashes_old.tolist())
+    new_set = set(hashes_new.tolist())
+    metodo = "hash" if changed is None else "watermark+hash"
+    if old_set == new_set and len(hashes_old) == len(hashes_new):
+        return CambioTabla(key=key, cambiado=False, metodo=metodo)
+
+    agregadas = df_new[~hashes_new.isin(old_set).to_numpy()]
+    removidas = df_old[~hashes_old.isin(new_set).to_numpy()] if len(hashes_old) == len(df_old) else df_old
+    _TABLE_CACHE[key] = df_new
+    _TABLE_ROW_HASHES[key] = hashes_new
+    return CambioTabla(key=key, cambiado=True, metodo=metodo, agregadas=agregadas, removidas=removidas)
 
 
-@lru_cache(maxsize=256)
 def get_sicetac_valorhora_df(configuracion: str) -> pd.DataFrame:
-    table = TABLES.get("sicetac_valorhora", "sicetac_valorhora_vigentes")
     configuracion_norm = str(configuracion or "").strip().upper()
     if not configuracion_norm:
         return pd.DataFrame()
+    cache = _LOOKUP_CACHES["sicetac_valorhora"]
+    entrada = cache.get(configuracion_norm)
+    if entrada is not None:
+        if entrada.estado == "error":
+            _registrar_error_lookup("sicetac_valorhora")
+        return entrada.valor
     try:
-        rows = _fetch_table_filtered(
-            table,
-            filters=[("configuracion", "ilike", configuracion_norm)],
-            limit=1,
+        df = _SINGLE_FLIGHT.do(
+            ("valorhora", configuracion_norm),
+            lambda: _load_sicetac_valorhora_df(configuracion_norm),
         )
-        if not rows:
-            return pd.DataFrame()
-        return _alias_columns(pd.DataFrame(rows))
     except Exception as e:
         logger.warning(f"⚠️ No se pudo consultar valor hora {configuracion_norm}: {e}")
+        _registrar_error_lookup("sicetac_valorhora")
+        cache.put(configuracion_norm, "error", pd.DataFrame())
         return pd.DataFrame()
+    cache.put(configuracion_norm, "miss" if df.empty else "hit", df)
+    return df
+
+
+def _load_sicetac_valorhora_df(configuracion_norm: str) -> pd.DataFrame:
+    table = TABLES.get("sicetac_valorhora", "sicetac_valorhora_vigentes")
+    rows = _fetch_table_filtered(
+        table,
+        filters=[("configuracion", "ilike", configuracion_norm)],
+        limit=1,
+    )
+    if not rows:
+        return pd.DataFrame()
+    return _alias_columns(pd.DataFrame(rows))
 
 
-@lru_cache(maxsize=4096)
 def get_sicetac_movilizacion_df(origen: str, destino: str, configuracion: str) -> pd.DataFrame:
-    table = TABLES.get("sicetac_movilizacion", "sicetac_movilizacion_vigentes")
+    """
+    Filas de movilización del par en cualquier sentido: primero
+    origen→destino y, si no hay filas, destino→origen.
+
+    Ambos sentidos se guardan en una sola entrada del cache (clave sin
+    orden), de modo que la consulta inversa de un par ya visto no vuelve a
+    Supabase.
+    """
     origen_norm = str(origen or "").strip()
     destino_norm = str(destino or "").strip()
     configuracion_norm = str(configuracion or "").strip().upper()
     if not origen_norm or not destino_norm or not configuracion_norm:
         return pd.DataFrame()
+
+    cache = _LOOKUP_CACHES["sicetac_movilizacion"]
+    clave = (min(origen_norm, destino_norm), max(origen_norm, destino_norm), configuracion_norm)
+    entrada = cache.get(clave)
+    if entrada is not None and entrada.estado == "error":
+        _registrar_error_lookup("sicetac_movilizacion")
+        return pd.DataFrame()
+    sentidos: Dict[tuple, pd.DataFrame] = dict(entrada.valor) if entrada is not None else {}
+
     try:
-        rows = _fetch_table_filtered(
-            table,
-            filters=[
-                ("origen", "eq", origen_norm),
-                ("destino", "eq", destino_norm),
-                ("configuracion", "ilike", configuracion_norm),
-            ],
-        )
-        if not rows:
-            return pd.DataFrame()
-        return _alias_columns(pd.DataFrame(rows))
+        for par in ((origen_norm, destino_norm), (destino_norm, origen_norm)):
+            if par not in sentidos:
+                sentidos[par] = _SINGLE_FLIGHT.do(
+                    ("movilizacion", *par, configuracion_norm),
+                    lambda par=par: _load_sicetac_movilizacion_df(*par, configuracion_norm),
+                )
+            if not sentidos[par].empty:
+                break
     except Exception as e:
         logger.warning(
-            f"⚠️ No se pudo consultar movilización {origen_norm}->{destino_norm} / {configuracion_norm}: {e}"
+            f"⚠️ No se pudo consultar movilización {origen_norm}<->{destino_norm} / {configuracion_norm}: {e}"
         )
+        _registrar_error_lookup("sicetac_movilizacion")
+        cache.put(clave, "error", {})
+        return pd.DataFrame()
+
+    estado = "hit" if any(not df.empty for df in sentidos.values()) else "miss"
+    if entrada is None or len(sentidos) != len(entrada.valor):
+        cache.put(clave, estado, sentidos)
+    df = sentidos[(origen_norm, destino_norm)]
+    return df if not df.empty else sentidos.get((destino_norm, origen_norm), df)
+
+
+def _load_sicetac_movilizacion_df(origen_norm: str, destino_norm: str, configuracion_norm: str) -> pd.DataFrame:
+    table = TABLES.get("sicetac_movilizacion", "sicetac_movilizacion_vigentes")
+    rows = _fetch_table_filtered(
+        table,
+        filters=[
+            ("origen", "eq", origen_norm),
+            ("destino", "eq", destino_norm),
+            ("configuracion", "ilike", configuracion_norm),
+        ],
+    )
+    if not rows:
         return pd.DataFrame()
+    return _alias_columns(pd.DataFrame(rows))
+
+
+def set_lookup_rpc(rpc: Callable[[str, Dict[str, Any]], Any] | None) -> None:
+    """
+    Reemplaza el ejecutor de funciones SQL `rpc(nombre, params) -> data`
+    (por defecto el cliente de Supabase). Permite probar el lookup combinado
+    contra un Postgres local o un fake en memoria; None restaura el default.
+    """
+    global _LOOKUP_RPC_FN, _LOOKUP_RPC_PAUSA_HASTA
+    with _LOOKUP_RPC_LOCK:
+        _LOOKUP_RPC_FN = rpc
+        _LOOKUP_RPC_PAUSA_HASTA = 0.0
+
+
+def get_lookup_rpc_stats() -> Dict[str, Any]:
+    with _LOOKUP_RPC_LOCK:
+        pausa = max(0.0, _LOOKUP_RPC_PAUSA_HASTA - time.monotonic())
+        return {"habilitado": USE_LOOKUP_RPC, "pausa_segundos": round(pausa, 1), **_LOOKUP_RPC_STATS}
+
+
+def _call_rpc(nombre: str, params: Dict[str, Any]) -> Any:
+    return get_client().rpc(nombre, params).execute().data
+
+
+def _lookup_rpc(nombre: str, params: Dict[str, Any], carriles: int) -> Any:
+    global _LOOKUP_RPC_PAUSA_HASTA
+    with _LOOKUP_RPC_LOCK:
+        if not USE_LOOKUP_RPC or time.monotonic() < _LOOKUP_RPC_PAUSA_HASTA:
+            return None
+        rpc = _LOOKUP_RPC_FN or _call_rpc
+    try:
+        data = rpc(nombre, params)
+    except Exception as e:
+        logger.warning(f"⚠️ Lookup combinado {nombre} no disponible, se usan consultas por tabla: {e}")
+        with _LOOKUP_RPC_LOCK:
+            _LOOKUP_RPC_STATS["fallos"] += 1
+            _LOOKUP_RPC_PAUSA_HASTA = time.monotonic() + LOOKUP_RPC_BACKOFF
+        return None
+    with _LOOKUP_RPC_LOCK:
+        _LOOKUP_RPC_STATS["llamadas"] += 1
+        _LOOKUP_RPC_STATS["carriles"] += carriles
+    return data
+
+
+def _df_filas(filas: Any) -> pd.DataFrame:
+    return _alias_columns(pd.DataFrame(filas)) if filas else pd.DataFrame()
+
+
+def _guardar_lookup_carril(carril: tuple[str, str, str, str], item: Dict[str, Any]) -> None:
+    # Deja el resultado de la función SQL en los mismos caches que usan las consultas por tabla.
+    origen, destino, configuracion, ruta = carril
+    movilizacion = _df_filas(item.get("movilizacion"))
+    if item.get("sentido") == "inverso":
+        sentidos = {(origen, destino): pd.DataFrame(), (destino, origen): movilizacion}
+    else:
+        sentidos = {(origen, destino): movilizacion}
+    _LOOKUP_CACHES["sicetac_movilizacion"].put(
+        (min(origen, destino), max(origen, destino), configuracion),
+        "miss" if movilizacion.empty else "hit",
+        sentidos,
+    )
+    valorhora = _df_filas(item.get("valorhora"))
+    _LOOKUP_CACHES["sicetac_valorhora"].put(configuracion, "miss" if valorhora.empty else "hit", valorhora)
+    if ruta and item.get("valor_plaza") is not None:
+        plaza = _df_filas(item.get("valor_plaza"))
+        plaza = _ordenar_valor_plaza(plaza) if not plaza.empty else plaza
+        _LOOKUP_CACHES["valor_plaza"].put((ruta, configuracion), "miss" if plaza.empty else "hit", plaza)
+
+
+def _carril_en_cache(carril: tuple[str, str, str, str]) -> bool:
+    origen, destino, configuracion, ruta = carril
+    return (
+        _LOOKUP_CACHES["sicetac_movilizacion"].contiene((min(origen, destino), max(origen, destino), configuracion))
+        and _LOOKUP_CACHES["sicetac_valorhora"].contiene(configuracion)
+        and (not ruta or _LOOKUP_CACHES["valor_plaza"].contiene((ruta, configuracion)))
+    )
+
+
+def get_lookup_carriles(
+    carriles: List[tuple[str, str, str, str | None]],
+) -> List[Dict[str, pd.DataFrame]]:
+    """
+    Movilización (en cualquier sentido), valor hora y, si viene la ruta,
+    valor plaza de cada carril [(origen, destino, configuracion, route_code)].
+
+    Lo que no esté en cache se trae con una sola llamada a la función SQL
+    (`SICETAC_LOOKUP_RPC` para un carril, `SICETAC_LOOKUP_RPC_LOTE` para
+    varios) y queda en los caches de siempre; si la llamada falla, las
+    lecturas caen a las consultas por tabla.
+    """
+    normalizados = [
+        (
+            str(origen or "").strip(),
+            str(destino or "").strip(),
+            str(configuracion or "").strip().upper(),
+            str(ruta or "").strip(),
+        )
+        for origen, destino, configuracion, ruta in carriles
+    ]
+    pendientes = tuple(dict.fromkeys(
+        c for c in normalizados if c[0] and c[1] and c[2] and not _carril_en_cache(c)
+    ))
+    if pendientes:
+        # Pedidos concurrentes por los mismos carriles comparten una llamada;
+        # cada uno llena los caches desde el resultado compartido.
+        items = _SINGLE_FLIGHT.do(("lookup_rpc", pendientes), lambda: _lookup_rpc_carriles(pendientes))
+        if items is not None and len(items) == len(pendientes):
+            for carril, item in zip(pendientes, items):
+                if isinstance(item, dict):
+                    _guardar_lookup_carril(carril, item)
+        elif items is not None:
+            logger.warning(f"⚠️ Lookup combinado devolvió {len(items)} carriles de {len(pendientes)}; se usan consultas por tabla")
+
+    return [
+        {
+            "movilizacion": get_sicetac_movilizacion_df(origen, destino, configuracion),
+            "valorhora": get_sicetac_valorhora_df(configuracion),
+            "valor_plaza": get_valor_plaza_df(ruta, configuracion) if ruta else pd.DataFrame(),
+        }
+        for origen, destino, configuracion, ruta in normalizados
+    ]
+
+
+def _lookup_rpc_carriles(pendientes: tuple[tuple[str, str, str, str], ...]) -> List[Any] | None:
+    params = [
+        {"origen": o, "destino": d, "configuracion": c, "ruta": r or None}
+        for o, d, c, r in pendientes
+    ]
+    if len(pendientes) == 1:
+        data = _lookup_rpc(LOOKUP_RPC, {f"p_{k}": v for k, v in params[0].items()}, 1)
+        return None if data is None else [data[0] if isinstance(data, list) else data]
+    return _lookup_rpc(LOOKUP_RPC_LOTE, {"p_carriles": params}, len(pendientes))
+
+
+def get_lookup_carril(origen: str, destino: str, configuracion: str, route_code: str | None = None) -> Dict[str, pd.DataFrame]:
+    return get_lookup_carriles([(origen, destino, configuracion, route_code)])[0]
 
 
-@lru_cache(maxsize=4096)
 def get_valor_plaza_df(route_code: str, configuracion: str) -> pd.DataFrame:
-    table = TABLES.get("valor_plaza", "valor_en_plaza_mensual_descriptiva")
     route_norm = str(route_code or "").strip()
     configuracion_norm = str(configuracion or "").strip().upper()
     if not route_norm or not configuracion_norm:
         return pd.DataFrame()
+    cache = _LOOKUP_CACHES["valor_plaza"]
+    entrada = cache.get((route_norm, configuracion_norm))
+    if entrada is not None:
+        if entrada.estado == "error":
+            _registrar_error_lookup("valor_plaza")
+        return entrada.valor
     try:
-        rows = _fetch_table_filtered(
-            table,
-            filters=[
-                ("ruta", "eq", route_norm),
-                ("configuracion", "ilike", configuracion_norm),
-            ],
+        df = _SINGLE_FLIGHT.do(
+            ("valor_plaza", route_norm, configuracion_norm),
+            lambda: _load_valor_plaza_df(route_norm, configuracion_norm),
         )
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo consultar valor plaza {route_norm} / {configuracion_norm}: {e}")
+        _registrar_error_lookup("valor_plaza")
+        cache.put((route_norm, configuracion_norm), "error", pd.DataFrame())
+        return pd.DataFrame()
+    cache.put((route_norm, configuracion_norm), "miss" if df.empty else "hit", df)
+    return df
+
+
+def _ordenar_valor_plaza(df: pd.DataFrame) -> pd.DataFrame:
+    if "mes_codigo" in df.columns:
+        df["mes_codigo"] = pd.to_numeric(df["mes_codigo"], errors="coerce")
+        df = df.sort_values(by="mes_codigo", ascending=False, na_position="last")
+    return df
+
+
+def _load_valor_plaza_df(route_norm: str, configuracion_norm: str) -> pd.DataFrame:
+    table = TABLES.get("valor_plaza", "valor_en_plaza_mensual_descriptiva")
+    rows = _fetch_table_filtered(
+        table,
+        filters=[
+            ("ruta", "eq", route_norm),
+            ("configuracion", "ilike", configuracion_norm),
+        ],
+    )
+    if not rows:
+        return pd.DataFrame()
+    return _ordenar_valor_plaza(_alias_columns(pd.DataFrame(rows)))
+
+
+def _restar_meses(mes_codigo: int, meses: int) -> int:
+    year, month = divmod(int(mes_codigo), 100)
+    total = year * 12 + (month - 1) - meses
+    return (total // 12) * 100 + (total % 12) + 1
+
+
+def get_valor_plaza_recent_df(meses: int = 12) -> pd.DataFrame:
+    """
+    Descarga en bloque `valor_en_plaza_mensual_descriptiva` para los últimos
+    `meses` meses (contados desde el mes_codigo más reciente de la tabla).
+    """
+    return _SINGLE_FLIGHT.do(("valor_plaza_bloque", int(meses)), lambda: _load_valor_plaza_recent_df(meses))
+
+
+def _load_valor_plaza_recent_df(meses: int) -> pd.DataFrame:
+    table = TABLES.get("valor_plaza", "valor_en_plaza_mensual_descriptiva")
+    try:
+        latest_rows = _fetch_table_filtered(table, select="mes_codigo", order=("mes_codigo", True), limit=1)
+        if not latest_rows:
+            return pd.DataFrame()
+        latest = int(float(latest_rows[0]["mes_codigo"]))
+        desde = _restar_meses(latest, max(int(meses), 1) - 1)
+        rows = _fetch_table_filtered_all(table, filters=[("mes_codigo", "gte", desde)])
         if not rows:
             return pd.DataFrame()
         df = _alias_columns(pd.DataFrame(rows))
-        if "mes_codigo" in df.columns:
-            df["mes_codigo"] = pd.to_numeric(df["mes_codigo"], errors="coerce")
-            df = df.sort_values(by="mes_codigo", ascending=False, na_position="last")
+        df["mes_codigo"] = pd.to_numeric(df["mes_codigo"], errors="coerce")
         return df
     except Exception as e:
-        logger.warning(f"⚠️ No se pudo consultar valor plaza {route_norm} / {configuracion_norm}: {e}")
+        logger.warning(f"⚠️ No se pudo cargar valor plaza en bloque: {e}")
         return pd.DataFrame()
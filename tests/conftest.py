@@ -0,0 +1,178 @@
+"""
+Datos de referencia mínimos para probar el servicio sin Supabase.
+
+`tablas` arma las seis tablas de referencia con tres MES, tres vehículos y
+unas pocas rutas; `servicio` deja `sicetac_service` leyéndolas desde memoria,
+con el cache recién refrescado, el valor plaza de `valor_plaza` en el índice
+en memoria y sin cubo, tier de meses cerrados ni lookup del consolidado (cada
+prueba los activa si los necesita). `cache_local` y `reloj` aíslan los caches
+de `supabase_data` y su reloj monotónico.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import time
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from supabase_data import _alias_columns  # noqa: E402
+
+MESES = [202501, 202502, 202503]
+BOGOTA, MEDELLIN, CALI, BUCARAMANGA, VILLAVICENCIO = "11001", "05001", "76001", "68001", "50001"
+
+_TERRENOS = ("plano", "ondulado", "montana", "urbano", "afirmado")
+
+
+def _parametros(vehiculo: str, mes: int, factor: float) -> dict:
+    fila = {"TIPO_VEHICULO": vehiculo, "MES": mes}
+    for i, terreno in enumerate(_TERRENOS):
+        fila[f"vel_{terreno}_cargado"] = (60 - 8 * i) * factor
+        fila[f"consumo_{terreno}_cargado"] = (9 - i) / factor
+        fila[f"vel_{terreno}_vacio"] = (70 - 8 * i) * factor
+        fila[f"consumo_{terreno}_vacio"] = (11 - i) / factor
+    fila["VALOR COMBUSTIBLE GALÓN ACPM"] = 9000 + 100 * MESES.index(mes)
+    fila["COSTOS VARIABLES"] = 1200 * factor
+    return fila
+
+
+def _ruta(origen: str, destino: str, id_sice: int, nombre: str, km: tuple[float, ...]) -> dict:
+    columnas = ("KM_PLANO", "KM_ONDULADO", "KM_MONTAÑOSO", "KM_URBANO", "KM_DESPAVIMENTADO")
+    return {
+        "CODIGO_DANE_ORIGEN": origen,
+        "CODIGO_DANE_DESTINO": destino,
+        "ID_SICE": id_sice,
+        "NOMBRE_SICE": nombre,
+        **dict(zip(columnas, km)),
+    }
+
+
+@pytest.fixture
+def tablas() -> dict[str, pd.DataFrame]:
+    # Como llega de `get_table_df`: con alias en mayúscula.
+    municipios = _alias_columns(pd.DataFrame([
+        {"codigo_dane": BOGOTA, "nombre_oficial": "BOGOTA", "variacion_1": "BOGOTA D.C.", "departamento": "BOGOTA"},
+        {"codigo_dane": MEDELLIN, "nombre_oficial": "MEDELLIN", "variacion_1": None, "departamento": "ANTIOQUIA"},
+        {"codigo_dane": CALI, "nombre_oficial": "CALI", "variacion_1": "SANTIAGO DE CALI", "departamento": "VALLE DEL CAUCA"},
+        {"codigo_dane": BUCARAMANGA, "nombre_oficial": "BUCARAMANGA", "variacion_1": None, "departamento": "SANTANDER"},
+        {"codigo_dane": VILLAVICENCIO, "nombre_oficial": "VILLAVICENCIO", "variacion_1": None, "departamento": "META"},
+        {"codigo_dane": "05664", "nombre_oficial": "SAN PEDRO", "variacion_1": None, "departamento": "ANTIOQUIA"},
+        {"codigo_dane": "76670", "nombre_oficial": "SAN PEDRO", "variacion_1": None, "departamento": "VALLE DEL CAUCA"},
+    ]))
+    vehiculos = pd.DataFrame([
+        {"TIPO_VEHICULO": "C2", "EJES_CONFIGURACION": "2", "CONFIGURACION_SICETAC_LOOKUP": "C2"},
+        {"TIPO_VEHICULO": "C3", "EJES_CONFIGURACION": "3", "CONFIGURACION_SICETAC_LOOKUP": "C3"},
+        {"TIPO_VEHICULO": "C3S3", "EJES_CONFIGURACION": "3S3", "CONFIGURACION_SICETAC_LOOKUP": "3S3"},
+    ])
+    # C3 no tiene parámetros en el último MES.
+    parametros = pd.DataFrame(
+        [_parametros("C2", mes, 1.1) for mes in MESES]
+        + [_parametros("C3", mes, 1.0) for mes in MESES[:-1]]
+        + [_parametros("C3S3", mes, 0.9) for mes in MESES]
+    )
+    costos_fijos = pd.DataFrame(
+        [
+            {"TIPO_VEHICULO": v, "MES": mes, "TIPO_CARROCERIA": "GENERAL", "COSTO FIJO": base + 1000 * MESES.index(mes)}
+            for v, base in (("C2", 9_000_000), ("C3", 12_000_000), ("C3S3", 18_000_000))
+            for mes in MESES
+        ]
+        # Solo C3S3 tiene costo fijo REFRIGERADO.
+        + [{"TIPO_VEHICULO": "C3S3", "MES": mes, "TIPO_CARROCERIA": "REFRIGERADO", "COSTO FIJO": 21_000_000} for mes in MESES]
+    )
+    rutas = pd.DataFrame([
+        _ruta(BOGOTA, MEDELLIN, 101, "BOGOTA - MEDELLIN (HONDA)", (180, 90, 120, 15, 0)),
+        _ruta(BOGOTA, MEDELLIN, 102, "BOGOTA - MEDELLIN (LA DORADA)", (250, 60, 40, 15, 10)),
+        _ruta(MEDELLIN, CALI, 201, "MEDELLIN - CALI", (220, 120, 60, 20, 0)),
+        _ruta(BOGOTA, BUCARAMANGA, 301, "BOGOTA - BUCARAMANGA", (150, 140, 100, 10, 0)),
+        _ruta(VILLAVICENCIO, BOGOTA, 401, "VILLAVICENCIO - BOGOTA", (20, 30, 60, 10, 0)),
+    ])
+    peajes = pd.DataFrame([
+        {"ID_SICE": id_sice, "EJES_CONFIGURACION": ejes, "VALOR_PEAJE": valor * factor}
+        for id_sice, valor in ((101, 80_000), (102, 95_000), (201, 70_000), (301, 60_000), (401, 30_000))
+        for ejes, factor in (("2", 1.0), ("3", 1.5), ("3S3", 2.5))
+    ])
+    return {
+        "municipios": municipios,
+        "vehiculos": vehiculos,
+        "parametros": parametros,
+        "costos_fijos": costos_fijos,
+        "peajes": peajes,
+        "rutas": rutas,
+    }
+
+
+@pytest.fixture
+def valor_plaza() -> pd.DataFrame:
+    return pd.DataFrame([
+        {
+            "ruta": f"{BOGOTA}-{MEDELLIN}",
+            "configuracion": configuracion,
+            "mes_codigo": mes,
+            "valor_en_plaza_carga_normal": valor + 10_000 * i,
+            "fuente_carga_normal": "encuesta",
+        }
+        for configuracion, valor in (("C2", 1_800_000), ("3S3", 2_400_000))
+        for i, mes in enumerate(MESES)
+    ])
+
+
+@pytest.fixture
+def cache_local(monkeypatch):
+    """Caches de tablas y lookups vacíos y lookup combinado sin pausa, sin tocar los del módulo."""
+    import supabase_data
+
+    monkeypatch.setattr(supabase_data, "_TABLE_CACHE", {})
+    monkeypatch.setattr(supabase_data, "_TABLE_ROW_HASHES", {})
+    monkeypatch.setattr(supabase_data, "_TABLE_WATERMARKS", {})
+    monkeypatch.setattr(supabase_data, "_TABLES_WITHOUT_WATERMARK", set())
+    monkeypatch.setattr(supabase_data, "_SINGLE_FLIGHT", supabase_data.SingleFlight())
+    monkeypatch.setattr(supabase_data, "_LOOKUP_CACHES", {
+        key: supabase_data.LookupCache(ttl_hit=60, ttl_miss=30, ttl_error=5)
+        for key in ("sicetac_movilizacion", "sicetac_valorhora", "valor_plaza")
+    })
+    monkeypatch.setattr(supabase_data, "_LOOKUP_RPC_FN", None)
+    monkeypatch.setattr(supabase_data, "_LOOKUP_RPC_PAUSA_HASTA", 0.0)
+    monkeypatch.setattr(supabase_data, "_LOOKUP_RPC_STATS", {"llamadas": 0, "carriles": 0, "fallos": 0})
+
+
+class _Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    """`time.monotonic` controlado por la prueba (`reloj.ahora += segundos`)."""
+    import supabase_data
+
+    reloj = _Reloj()
+    monkeypatch.setattr(supabase_data.time, "monotonic", reloj)
+    return reloj
+
+
+@pytest.fixture
+def servicio(monkeypatch, tablas, valor_plaza):
+    import sicetac_service
+    from valor_plaza_store import ValorPlazaStore
+
+    monkeypatch.setattr(sicetac_service, "get_table_df", lambda key: tablas[key])
+    for nombre in (
+        "_RUTAS_INDEX", "_PEAJES_INDEX", "_CUBO", "_GENERACION_DATOS",
+        "_MESES_DISPONIBLES", "_VEHICLE_REGISTRY", "_GRAFO_RUTAS", "_HELPER_MUNICIPIOS",
+    ):
+        monkeypatch.setattr(sicetac_service, nombre, None)
+    monkeypatch.setattr(sicetac_service, "_TARIFAS_INDEX", {})
+    monkeypatch.setattr(sicetac_service, "_CUBO_VALIDADO", False)
+    monkeypatch.setattr(sicetac_service, "_VALOR_PLAZA_STORE", ValorPlazaStore(valor_plaza))
+    monkeypatch.setattr(sicetac_service, "_VALOR_PLAZA_STORE_CARGADO", True)
+    monkeypatch.setattr(sicetac_service, "_LAST_REFRESH_TS", time.time())
+    monkeypatch.setattr(sicetac_service, "_USE_CUBO_OD", False)
+    monkeypatch.setattr(sicetac_service, "_USE_MESES_CERRADOS", False)
+    monkeypatch.setattr(sicetac_service, "_USE_CONSOLIDATED_LOOKUP", False)
+    return sicetac_service
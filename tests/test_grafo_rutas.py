@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from grafo_rutas import GrafoRutas
+
+
+def _rutas() -> pd.DataFrame:
+    # A-B-C en línea, atajo A-C más largo que pasar por B y D aislado de C.
+    filas = [
+        ("1", "2", 100, 10), ("2", "3", 50, 20), ("1", "3", 200, 30), ("4", "5", 10, 40),
+        # Dos rutas para el mismo par: se conserva la de menor km.
+        ("3", "2", 30, 21),
+    ]
+    return pd.DataFrame([
+        {"CODIGO_DANE_ORIGEN": o, "CODIGO_DANE_DESTINO": d, "ID_SICE": i, "KM_PLANO": km, "KM_ONDULADO": 0,
+         "KM_MONTAÑOSO": 0, "KM_URBANO": 0, "KM_DESPAVIMENTADO": 0}
+        for o, d, km, i in filas
+    ])
+
+
+@pytest.mark.parametrize("hubs", [0, 1, 5])
+def test_camino_minimo_en_km_igual_con_y_sin_hubs(hubs):
+    rutas = _rutas()
+    grafo = GrafoRutas(rutas, hubs=hubs)
+    tramos = grafo.camino("1", "3")
+    assert [(rutas["ID_SICE"].iloc[f], desde, hasta) for f, desde, hasta in tramos] == [(10, "1", "2"), (21, "2", "3")]
+    # En sentido contrario los tramos se recorren al revés.
+    assert grafo.camino("3", "1") == [(f, hasta, desde) for f, desde, hasta in tramos[::-1]]
+
+
+def test_sin_conexion_o_mismo_nodo():
+    grafo = GrafoRutas(_rutas())
+    assert grafo.camino("1", "5") is None
+    assert grafo.camino("1", "1") is None
+    assert grafo.camino("1", "99") is None
+    assert len(GrafoRutas(pd.DataFrame())) == 0
+
+
+def test_peso_en_horas_requiere_velocidades():
+    rutas = _rutas()
+    with pytest.raises(ValueError):
+        GrafoRutas(rutas).camino("1", "3", peso="horas")
+    with pytest.raises(ValueError):
+        GrafoRutas(rutas).camino("1", "3", peso="peajes")
+    # Con la misma velocidad en todo terreno, horas y km dan el mismo camino.
+    grafo = GrafoRutas(rutas, velocidades=np.full(5, 50.0))
+    assert grafo.camino("1", "3", peso="horas") == grafo.camino("1", "3")
@@ -0,0 +1,90 @@
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+import supabase_data
+from supabase_data import _alias_columns
+
+MOVILIZACION = {"RUTASID": "101", "GENERAL_ESTACAS_CARGADO": 1_500_000}
+VALOR_HORA = {"configuracion": "C2", "GENERAL_ESTACAS_CARGADO": 40_000}
+CONSULTA = {"origen": "BOGOTA", "destino": "BUCARAMANGA", "vehiculo": "C2"}
+
+
+@pytest.fixture
+def cliente(monkeypatch, servicio, cache_local):
+    import main
+
+    monkeypatch.setattr(servicio, "_USE_CONSOLIDATED_LOOKUP", True)
+    monkeypatch.setattr(servicio, "get_table_generation", lambda key: "1")
+    monkeypatch.setattr(supabase_data, "USE_LOOKUP_RPC", False)
+    monkeypatch.setattr(
+        supabase_data, "_load_sicetac_valorhora_df", lambda configuracion: _alias_columns(pd.DataFrame([VALOR_HORA]))
+    )
+    return TestClient(main.app)
+
+
+def _movilizacion(origen, destino, configuracion):
+    if (origen, destino) != ("11001", "68001"):
+        return pd.DataFrame()
+    return _alias_columns(pd.DataFrame([MOVILIZACION]))
+
+
+def _caido(origen, destino, configuracion):
+    raise TimeoutError("read timed out")
+
+
+@pytest.mark.parametrize("endpoint", ["/consulta", "/consulta_resumen"])
+def test_etag_y_304_con_el_lookup_disponible(monkeypatch, cliente, endpoint):
+    monkeypatch.setattr(supabase_data, "_load_sicetac_movilizacion_df", _movilizacion)
+    respuesta = cliente.post(endpoint, json=CONSULTA)
+    assert respuesta.status_code == 200
+    assert respuesta.json()["metodo"] == "lookup_consolidado"
+    assert respuesta.json()["totales"]["H2"] == 1_580_000
+    etag = respuesta.headers["ETag"]
+    assert respuesta.headers["Cache-Control"] == "private, no-cache"
+
+    no_modificada = cliente.post(endpoint, json=CONSULTA, headers={"If-None-Match": etag})
+    assert no_modificada.status_code == 304
+    assert cliente.post(endpoint, json={**CONSULTA, "vehiculo": "C3S3"}, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_respuesta_con_lookup_caido_no_lleva_etag(monkeypatch, cliente):
+    monkeypatch.setattr(supabase_data, "_load_sicetac_movilizacion_df", _caido)
+    caida = cliente.post("/consulta_resumen", json=CONSULTA)
+    assert caida.status_code == 200
+    assert "metodo" not in caida.json()
+    assert "ETag" not in caida.headers
+    assert caida.headers["Cache-Control"] == "no-store"
+    # Mientras dura el error en cache sigue sin validador.
+    assert "ETag" not in cliente.post("/consulta_resumen", json=CONSULTA).headers
+
+    # Recuperado el lookup, la respuesta vuelve a tener ETag y es otra.
+    monkeypatch.setattr(supabase_data, "_load_sicetac_movilizacion_df", _movilizacion)
+    supabase_data.clear_lookup_cache()
+    sana = cliente.post("/consulta_resumen", json=CONSULTA)
+    assert sana.json()["metodo"] == "lookup_consolidado"
+    assert sana.json()["totales"] != caida.json()["totales"]
+    assert "ETag" in sana.headers
+
+
+def test_lote_con_un_lookup_caido_no_lleva_etag(monkeypatch, cliente):
+    monkeypatch.setattr(supabase_data, "_load_sicetac_movilizacion_df", _caido)
+    lote = cliente.post("/consulta_lote", json={"consultas": [CONSULTA, {**CONSULTA, "vehiculo": "C3S3"}]})
+    assert lote.status_code == 200
+    assert lote.json()["ok"] == 2
+    assert (lote.headers["Cache-Control"], "ETag" in lote.headers) == ("no-store", False)
+
+
+def test_seguimiento_lookups_solo_registra_errores():
+    with supabase_data.seguimiento_lookups() as errores:
+        supabase_data._registrar_error_lookup("valor_plaza")
+        with supabase_data.seguimiento_lookups() as internos:
+            supabase_data._registrar_error_lookup("sicetac_valorhora")
+    assert (errores, internos) == (["valor_plaza"], ["sicetac_valorhora"])
+    supabase_data._registrar_error_lookup("valor_plaza")
+
+
+def test_nombre_ambiguo_responde_409(cliente):
+    respuesta = cliente.post("/consulta_resumen", json={**CONSULTA, "origen": "SAN PEDRO"})
+    assert respuesta.status_code == 409
+    assert len(respuesta.json()["detail"]["candidatos"]) == 2
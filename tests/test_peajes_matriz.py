@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from peajes_matriz import MatrizPeajes
+
+
+def _peajes() -> pd.DataFrame:
+    return pd.DataFrame([
+        {"ID_SICE": 101, "EJES_CONFIGURACION": "2", "VALOR_PEAJE": 80_000},
+        {"ID_SICE": "101", "EJES_CONFIGURACION": "3S3", "VALOR_PEAJE": 200_000},
+        # Clave repetida: la política decide.
+        {"ID_SICE": " 101", "EJES_CONFIGURACION": 2, "VALOR_PEAJE": 90_000},
+        {"ID_SICE": 201, "EJES_CONFIGURACION": "2", "VALOR_PEAJE": 70_000},
+        {"ID_SICE": 201, "EJES_CONFIGURACION": "3", "VALOR_PEAJE": None},
+    ])
+
+
+@pytest.mark.parametrize("politica, esperado", [("first", 80_000), ("sum", 170_000), ("max", 90_000)])
+def test_valor_aplica_la_politica_de_duplicados(politica, esperado):
+    matriz = MatrizPeajes(_peajes(), politica=politica)
+    assert matriz.valor(101, "2") == esperado
+    assert matriz.valor("101", "3S3") == 200_000
+    # Valor vacío cuenta como peaje 0; clave inexistente es None.
+    assert matriz.valor(201, 3) == 0.0
+    assert matriz.valor(201, "3S3") is None
+    assert matriz.valor(999, "2") is None
+    assert matriz.duplicados() == {"politica": politica, "claves": 4, "claves_duplicadas": 1, "filas_duplicadas": 1}
+
+
+def test_politica_desconocida():
+    with pytest.raises(ValueError):
+        MatrizPeajes(_peajes(), politica="min")
+
+
+def test_matriz_igual_a_valor_escalar():
+    matriz = MatrizPeajes(_peajes())
+    ids, ejes = [101, 201, 999], ["2", "33", "3", "5"]
+    tabla = matriz.matriz(ids, ejes, faltante=-1.0)
+    esperado = [[matriz.valor(i, e) if matriz.valor(i, e) is not None else -1.0 for e in ejes] for i in ids]
+    np.testing.assert_array_equal(tabla, np.array(esperado))
+
+
+def test_actualizar_ids_igual_a_reconstruir():
+    df = _peajes()
+    matriz = MatrizPeajes(df)
+    df = df[df["ID_SICE"].astype(float) != 201]
+    df = pd.concat([df, pd.DataFrame([
+        {"ID_SICE": 201, "EJES_CONFIGURACION": "2", "VALOR_PEAJE": 71_000},
+        {"ID_SICE": 301, "EJES_CONFIGURACION": "4", "VALOR_PEAJE": 120_000},
+    ])], ignore_index=True)
+
+    assert matriz.actualizar_ids(df, [201, "301", None]) == 2
+    completa = MatrizPeajes(df)
+    ids, ejes = list(completa.ids), list(completa.ejes)
+    np.testing.assert_array_equal(matriz.matriz(ids, ejes), completa.matriz(ids, ejes))
+    assert matriz.valor(201, "3") is None
+    assert matriz.valor(301, "4") == 120_000
+    assert matriz.valor(101, "2") == 80_000
+    assert matriz.actualizar_ids(df, []) == 0
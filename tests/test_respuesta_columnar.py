@@ -0,0 +1,80 @@
+import pytest
+
+from respuesta_columnar import (
+    MEDIA_JSON,
+    MEDIA_MSGPACK,
+    negociar_formato,
+    serializar_columnar,
+    tabla_columnar,
+)
+
+
+def _resumen(servicio, **campos):
+    data = servicio.ConsultaInput(**{"origen": "BOGOTA", "destino": "MEDELLIN", "vehiculo": "C2", **campos})
+    return servicio.calcular_sicetac_resumen(data, adjuntar_valor_plaza=False)
+
+
+def _filas(tabla):
+    return [dict(zip(tabla, valores)) for valores in zip(*tabla.values())]
+
+
+def test_una_fila_por_variante_con_todas(servicio):
+    respuesta = _resumen(servicio)
+    filas = _filas(tabla_columnar([respuesta]))
+    assert [(f["id_sice"], f["configuracion"], f["seleccion_variante"]) for f in filas] == [
+        ("101", "C2", None),
+        ("102", "C2", None),
+    ]
+    assert [f["H2"] for f in filas] == [v["totales"]["H2"] for v in respuesta["variantes"]]
+    assert filas[0]["route_code"] == "11001-05001"
+
+
+def test_politica_de_variantes_conserva_la_ruta_elegida(servicio):
+    respuesta = _resumen(servicio, politica_variantes="MAS_BARATA")
+    (fila,) = _filas(tabla_columnar([respuesta]))
+    assert (fila["id_sice"], fila["seleccion_variante"]) == ("102", "MAS_BARATA")
+    assert fila["H8"] == respuesta["totales"]["H8"]
+
+
+def test_consulta_sin_variantes_da_una_fila(servicio):
+    respuesta = _resumen(servicio, destino="BUCARAMANGA")
+    (fila,) = _filas(tabla_columnar([respuesta]))
+    assert (fila["route_code"], fila["configuracion"]) == ("11001-68001", "C2")
+    assert fila["H2"] == respuesta["totales"]["H2"]
+
+
+def test_flota_da_una_fila_por_vehiculo(servicio):
+    con_variantes = _resumen(servicio, vehiculo="*")
+    sin_variantes = _resumen(servicio, destino="BUCARAMANGA", vehiculos=["C2", "C3S3"])
+    filas = _filas(tabla_columnar([con_variantes, sin_variantes]))
+    assert [(f["indice"], f["id_sice"], f["configuracion"]) for f in filas] == [
+        (0, "101", "C2"),
+        (0, "101", "C3S3"),
+        (0, "102", "C2"),
+        (0, "102", "C3S3"),
+        (1, None, "C2"),
+        (1, None, "C3S3"),
+    ]
+    esperados = [item["totales"]["H4"] for v in con_variantes["variantes"] for item in v["flota"]]
+    esperados += [item["totales"]["H4"] for item in sin_variantes["flota"]]
+    assert [f["H4"] for f in filas] == esperados
+
+
+def test_error_de_lote_da_una_fila_con_su_estado():
+    tabla = tabla_columnar([
+        {"error": {"mensaje": "Nombre ambiguo", "candidatos": []}, "status_code": 409},
+        {"error": "Origen o destino no encontrado", "status_code": 404},
+    ])
+    assert tabla["status_code"] == [409, 404]
+    assert tabla["error"] == ["Nombre ambiguo", "Origen o destino no encontrado"]
+    assert tabla["route_code"] == [None, None]
+
+
+def test_msgpack_y_negociacion(servicio):
+    msgpack = pytest.importorskip("msgpack")
+    tabla = tabla_columnar([_resumen(servicio, politica_variantes="MAS_CORTA")])
+    assert msgpack.unpackb(serializar_columnar(tabla, MEDIA_MSGPACK), raw=False) == tabla
+
+    assert negociar_formato(None) == MEDIA_JSON
+    assert negociar_formato("application/x-msgpack;q=0.9, application/json;q=0.5") == MEDIA_MSGPACK
+    assert negociar_formato("application/msgpack;q=0.2, application/json") == MEDIA_JSON
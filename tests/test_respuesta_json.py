@@ -0,0 +1,51 @@
+import json
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import respuesta_json
+from respuesta_json import dumps_json
+
+CONTENIDO = {
+    "mes": np.int64(202503),
+    "totales": np.array([1_746_952.66, np.nan]),
+    "horas": [np.float32(0.5), np.int32(2)],
+    "actualizado": pd.Timestamp("2025-03-01 10:30"),
+    "fecha": np.datetime64("2025-03-01"),
+    "sin_fecha": pd.NaT,
+    "sin_valor": pd.NA,
+    "mixto": np.array([pd.NA, 1], dtype=object),
+    "valor_plaza": Decimal("1810000.50"),
+    "decimal_nan": Decimal("NaN"),
+    "ruta": "BOGOTA - MEDELLIN (LA DORADA)",
+}
+
+ESPERADO = {
+    "mes": 202503,
+    "totales": [1_746_952.66, None],
+    "horas": [0.5, 2],
+    "actualizado": "2025-03-01T10:30:00",
+    "fecha": "2025-03-01T00:00:00",
+    "sin_fecha": None,
+    "sin_valor": None,
+    "mixto": [None, 1],
+    "valor_plaza": 1_810_000.5,
+    "decimal_nan": None,
+    "ruta": "BOGOTA - MEDELLIN (LA DORADA)",
+}
+
+
+@pytest.mark.parametrize("con_orjson", [True, False])
+def test_dumps_json_convierte_tipos_de_pandas_numpy_y_decimal(monkeypatch, con_orjson):
+    if con_orjson:
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(respuesta_json, "orjson", None)
+    assert json.loads(dumps_json(CONTENIDO)) == ESPERADO
+
+
+def test_dumps_json_rechaza_tipos_desconocidos():
+    with pytest.raises(TypeError):
+        dumps_json({"x": object()})
@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+import sicetac_cubo
+from modelo_sicetac import calcular_modelo_sicetac_extendido
+from modelo_sicetac_vacio import calcular_modelo_sicetac_extendido_vacio
+from peajes_matriz import MatrizPeajes
+from vehicle_registry import VehicleRegistry
+
+MES = 202503
+
+
+def _construir(tablas, directorio):
+    registry = VehicleRegistry(tablas["vehiculos"])
+    return sicetac_cubo.actualizar_cubo(
+        mes=MES,
+        df_vehiculos=tablas["vehiculos"],
+        df_parametros=tablas["parametros"],
+        df_costos_fijos=tablas["costos_fijos"],
+        df_rutas=tablas["rutas"],
+        peajes_index=MatrizPeajes(tablas["peajes"]),
+        ejes_para=lambda v: registry.ejes.get(v, ""),
+        directorio=str(directorio),
+    )
+
+
+def _modelo_escalar(tablas):
+    registry = VehicleRegistry(tablas["vehiculos"])
+    peajes = MatrizPeajes(tablas["peajes"])
+    rutas = tablas["rutas"]
+
+    def calcular(r, vehiculo, carroceria, modo, horas):
+        fila = rutas.iloc[r]
+        modelo = calcular_modelo_sicetac_extendido_vacio if modo == "VACIO" else calcular_modelo_sicetac_extendido
+        res = modelo(
+            origen="",
+            destino="",
+            configuracion=vehiculo,
+            serie=MES,
+            distancias={
+                "km_plano": fila["KM_PLANO"],
+                "km_ondulado": fila["KM_ONDULADO"],
+                "km_montanoso": fila["KM_MONTAÑOSO"],
+                "km_urbano": fila["KM_URBANO"],
+                "km_despavimentado": fila["KM_DESPAVIMENTADO"],
+            },
+            valor_peaje_manual=0,
+            matriz_parametros=tablas["parametros"],
+            matriz_costos_fijos=tablas["costos_fijos"],
+            matriz_vehicular=tablas["vehiculos"],
+            rutas_df=rutas,
+            peajes_df=tablas["peajes"],
+            carroceria_especial=carroceria,
+            ruta_oficial=fila,
+            horas_logisticas=horas,
+            valor_peaje_override=peajes.valor(fila["ID_SICE"], registry.ejes[vehiculo]) or 0.0,
+        )
+        return res.get("total_viaje", res.get("total_viaje_vacio"))
+
+    return calcular
+
+
+def test_cubo_coincide_con_el_modelo_escalar_en_cada_celda(tablas, tmp_path):
+    resumen = _construir(tablas, tmp_path)
+    assert resumen["modo"] == "completo"
+    cubo = sicetac_cubo.cargar_cubo(MES, str(tmp_path))
+    assert cubo.totales.dtype == np.float64
+    assert cubo.modos == ["CARGADO", "VACIO"]
+    assert cubo.horas == sicetac_cubo.CUBO_HORAS
+    assert set(cubo.carrocerias) == {"GENERAL", "REFRIGERADO"}
+
+    calcular = _modelo_escalar(tablas)
+    revisadas = 0
+    for m, modo in enumerate(cubo.modos):
+        for c, carroceria in enumerate(cubo.carrocerias):
+            for r in range(len(cubo.rutas)):
+                for v, vehiculo in enumerate(cubo.vehiculos):
+                    for h, horas in enumerate(cubo.horas):
+                        celda = float(cubo.totales[m, c, r, v, h])
+                        try:
+                            esperado = calcular(r, vehiculo, carroceria, modo, horas)
+                        except (ValueError, IndexError):
+                            # Sin costo fijo para la carrocería o sin parámetros del MES.
+                            assert np.isnan(celda), (modo, carroceria, r, vehiculo, horas)
+                            continue
+                        assert celda == pytest.approx(esperado, abs=0.01), (modo, carroceria, r, vehiculo, horas)
+                        revisadas += 1
+
+    # C2 y C3S3 en GENERAL, solo C3S3 en REFRIGERADO; C3 no tiene parámetros del MES.
+    assert revisadas == 2 * len(cubo.rutas) * len(cubo.horas) * (2 + 1)
+    refrigerado = cubo.carrocerias.index("REFRIGERADO")
+    assert np.isnan(cubo.totales[:, refrigerado, :, cubo.vehiculos.index("C2"), :]).all()
+
+    verificacion = sicetac_cubo.verificar_cubo(cubo, calcular, muestras=50)
+    assert verificacion["ok"], verificacion
+    assert verificacion["muestras"] == 50
+
+
+def test_reconstruccion_incremental_igual_a_la_completa(tablas, tmp_path):
+    _construir(tablas, tmp_path / "incremental")
+    parametros = tablas["parametros"]
+    fila = (parametros["TIPO_VEHICULO"] == "C2") & (parametros["MES"] == MES)
+    tablas["parametros"] = parametros.assign(
+        **{"VALOR COMBUSTIBLE GALÓN ACPM": parametros["VALOR COMBUSTIBLE GALÓN ACPM"].where(~fila, 9900)}
+    )
+
+    resumen = _construir(tablas, tmp_path / "incremental")
+    assert resumen["modo"] == "incremental"
+    assert resumen["vehiculos_recalculados"] == 1
+    assert resumen["rutas_recalculadas"] == 0
+    assert _construir(tablas, tmp_path / "completo")["modo"] == "completo"
+
+    incremental = sicetac_cubo.cargar_cubo(MES, str(tmp_path / "incremental"))
+    completo = sicetac_cubo.cargar_cubo(MES, str(tmp_path / "completo"))
+    assert incremental.huella == completo.huella
+    np.testing.assert_array_equal(np.asarray(incremental.totales), np.asarray(completo.totales))
+    assert _construir(tablas, tmp_path / "incremental")["modo"] == "sin_cambios"
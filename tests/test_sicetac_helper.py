@@ -0,0 +1,72 @@
+import pandas as pd
+import pytest
+
+from sicetac_helper import SICETACHelper
+
+MUNICIPIOS = pd.DataFrame([
+    {"codigo_dane": "76001", "nombre_oficial": "CALI", "variacion_1": "SANTIAGO DE CALI", "departamento": "VALLE DEL CAUCA"},
+    {"codigo_dane": "47001", "nombre_oficial": "SANTA MARTA", "variacion_1": None, "departamento": "MAGDALENA"},
+    {"codigo_dane": "68679", "nombre_oficial": "SAN GIL", "variacion_1": None, "departamento": "SANTANDER"},
+    {"codigo_dane": "88001", "nombre_oficial": "SAN ANDRÉS", "variacion_1": "SAN ANDRES ISLA", "departamento": "SAN ANDRES"},
+    {"codigo_dane": "54720", "nombre_oficial": "SARDINATA", "variacion_1": None, "departamento": "NORTE DE SANTANDER"},
+    {"codigo_dane": "05664", "nombre_oficial": "SAN PEDRO", "variacion_1": None, "departamento": "ANTIOQUIA"},
+    {"codigo_dane": "76670", "nombre_oficial": "SAN PEDRO", "variacion_1": None, "departamento": "VALLE DEL CAUCA"},
+    {"codigo_dane": "15673", "nombre_oficial": "SAN", "variacion_1": None, "departamento": "BOYACA"},
+    {"codigo_dane": "11001", "nombre_oficial": "BOGOTA", "variacion_1": "SANTAFE DE BOGOTA", "departamento": "BOGOTA"},
+])
+
+
+def _por_barrido(helper, texto, limite):
+    """Ranking de referencia: recorre todas las filas con `_candidate_priority`."""
+    prefijo = helper._normalize_name(texto)
+    candidatos = []
+    for _, fila in helper.df_municipios.iterrows():
+        for col in helper.columnas_municipios:
+            valor = fila.get(col)
+            if valor is None or pd.isna(valor):
+                continue
+            clave = helper._normalize_name(valor)
+            if clave.startswith(prefijo):
+                candidatos.append((-helper._candidate_priority(fila, col, texto), clave, fila["codigo_dane"]))
+    vistos, codigos = set(), []
+    for _, _, codigo in sorted(candidatos, key=lambda c: (c[0], c[1])):
+        if codigo not in vistos:
+            vistos.add(codigo)
+            codigos.append(codigo)
+    return codigos[:limite]
+
+
+@pytest.mark.parametrize("texto", ["san", "SAN ", "santa", "san pedro", "Sar", "s", "cal", "bog"])
+def test_sugerencias_iguales_al_barrido_con_candidate_priority(texto):
+    helper = SICETACHelper(MUNICIPIOS)
+    sugeridos = [s["codigo_dane"] for s in helper.sugerir_municipios(texto, limite=20)]
+    assert sugeridos == _por_barrido(helper, texto, 20)
+
+
+def test_sugerencias_priorizan_nombre_oficial_exacto_y_un_resultado_por_codigo():
+    helper = SICETACHelper(MUNICIPIOS)
+    sugerencias = helper.sugerir_municipios("san", limite=4)
+    # El nombre oficial exacto va primero; luego los nombres oficiales más cortos.
+    assert [s["nombre_oficial"] for s in sugerencias] == ["SAN", "SAN GIL", "SAN PEDRO", "SAN PEDRO"]
+    assert sugerencias[0] == {
+        "codigo_dane": "15673",
+        "nombre_oficial": "SAN",
+        "departamento": "BOYACA",
+        "coincidencia": "SAN",
+        "columna": "nombre_oficial",
+    }
+
+    # Por variación: una sola entrada por código aunque coincidan oficial y variación.
+    andres = helper.sugerir_municipios("san andres")
+    assert [(s["codigo_dane"], s["columna"]) for s in andres] == [("88001", "nombre_oficial")]
+    cali = helper.sugerir_municipios("santiago")
+    assert [(s["nombre_oficial"], s["columna"]) for s in cali] == [("CALI", "variacion_1")]
+    assert helper.sugerir_municipios("xyz") == []
+    assert helper.sugerir_municipios("  ") == []
+
+
+def test_sugerir_municipios_del_servicio_acota_el_limite(monkeypatch, servicio):
+    monkeypatch.setattr(servicio, "_SUGERENCIAS_MAX", 2)
+    sugerencias = servicio.sugerir_municipios("san", limite=50)
+    assert [s["codigo_dane"] for s in sugerencias] == ["05664", "76670"]
+    assert servicio.sugerir_municipios("bog", limite=0)[0]["codigo_dane"] == "11001"
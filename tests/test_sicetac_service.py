@@ -0,0 +1,357 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import resultados_cerrados
+from conftest import BOGOTA, MEDELLIN
+from valor_plaza_store import ValorPlazaStore
+
+
+def _consulta(servicio, **campos):
+    return servicio.ConsultaInput(**{"origen": "BOGOTA", "destino": "MEDELLIN", "vehiculo": "C2", **campos})
+
+
+def test_lote_adjunta_valor_plaza_en_una_busqueda_y_reporta_errores_por_item(monkeypatch, servicio):
+    llamadas = []
+    resumen_lote = ValorPlazaStore.resumen_lote
+    monkeypatch.setattr(
+        ValorPlazaStore, "resumen_lote", lambda self, *a, **k: llamadas.append(a) or resumen_lote(self, *a, **k)
+    )
+    monkeypatch.setattr(servicio, "get_valor_plaza_df", lambda *a: pytest.fail("consulta de valor plaza por carril"))
+
+    lote = servicio.calcular_sicetac_lote([
+        _consulta(servicio),
+        # C2 no tiene costo fijo REFRIGERADO: error del modelo en el ítem.
+        _consulta(servicio, carroceria="REFRIGERADO"),
+        _consulta(servicio, origen="NO EXISTE"),
+        _consulta(servicio, vehiculo="C3S3"),
+    ])
+
+    assert (lote["total"], lote["ok"]) == (4, 2)
+    ok, sin_costo, sin_municipio, c3s3 = lote["resultados"]
+    assert sin_costo["status_code"] == 500 and "REFRIGERADO" in sin_costo["error"]
+    assert sin_municipio == {"error": "Origen o destino no encontrado", "status_code": 404}
+    assert len(llamadas) == 1
+    assert ok["valor_plaza"]["route_code"] == f"{BOGOTA}-{MEDELLIN}"
+    assert [m["valor"] for m in ok["valor_plaza"]["meses"]] == [1_820_000, 1_810_000, 1_800_000]
+    assert c3s3["valor_plaza"]["configuracion_analisis"] == "3S3"
+    assert c3s3["valor_plaza"]["promedio_ultimos_meses"] == 2_410_000
+
+
+def test_lote_de_flota_adjunta_valor_plaza_por_vehiculo(servicio):
+    lote = servicio.calcular_sicetac_lote([_consulta(servicio, vehiculos=["C2", "C3S3"])])
+
+    (flota,) = lote["resultados"]
+    assert "valor_plaza" not in flota
+    # Dos variantes SICE (101 y 102): cada ítem de cada variante trae el de su vehículo.
+    assert len(flota["variantes"]) == 2
+    for variante in flota["variantes"]:
+        assert "valor_plaza" not in variante
+        plazas = {i["vehiculo"]: i["valor_plaza"] for i in variante["flota"]}
+        assert list(plazas) == ["C2", "C3S3"]
+        assert plazas["C2"]["promedio_ultimos_meses"] == 1_810_000
+        assert plazas["C3S3"]["configuracion_analisis"] == "3S3"
+        assert plazas["C3S3"]["promedio_ultimos_meses"] == 2_410_000
+
+
+def test_lote_rechaza_mas_consultas_que_el_maximo(monkeypatch, servicio):
+    monkeypatch.setattr(servicio, "_LOTE_MAX", 2)
+    with pytest.raises(servicio.SicetacError) as ex:
+        servicio.calcular_sicetac_lote([_consulta(servicio)] * 3)
+    assert ex.value.status_code == 400
+
+
+def test_snapshot_repartido_en_procesos_igual_al_secuencial(monkeypatch, servicio):
+    monkeypatch.setattr(servicio, "_SNAPSHOT_START_METHOD", "fork")
+    secuencial = list(servicio.iterar_snapshot(filas_por_bloque=1, workers=1))
+    pools = []
+    pool_shards = servicio._pool_shards
+    monkeypatch.setattr(servicio, "_pool_shards", lambda *a: pools.append(pool_shards(*a)) or pools[-1])
+    progreso = []
+    repartido = list(servicio.iterar_snapshot(
+        filas_por_bloque=1, workers=2, progreso=lambda hechas, total: progreso.append(hechas)
+    ))
+    assert len(pools) == 1 and pools[0] is not None
+    assert len(repartido) == len(secuencial) == 5
+    for bloque, esperado in zip(repartido, secuencial):
+        pd.testing.assert_frame_equal(bloque, esperado)
+    assert progreso == [1, 2, 3, 4, 5]
+    assert repartido[0]["id_sice"].tolist() == [101, 101, 101]
+
+
+def test_snapshot_largo_igual_a_un_snapshot_por_variante(servicio):
+    largo = servicio.generar_snapshot(carroceria="*", modo_viaje="AMBOS")
+    assert set(zip(largo["carroceria"], largo["modo_viaje"])) == {
+        (c, m) for c in ("GENERAL", "REFRIGERADO") for m in ("CARGADO", "VACIO")
+    }
+    # Sin costo fijo REFRIGERADO solo queda C3S3.
+    assert set(largo.loc[largo["carroceria"] == "REFRIGERADO", "vehiculo"]) == {"C3S3"}
+
+    for modo in ("CARGADO", "VACIO"):
+        ancho = servicio.generar_snapshot(carroceria="GENERAL", modo_viaje=modo)
+        assert "carroceria" not in ancho.columns
+        parte = largo[(largo["carroceria"] == "GENERAL") & (largo["modo_viaje"] == modo)]
+        pd.testing.assert_frame_equal(
+            parte.drop(columns=["carroceria", "modo_viaje"]).reset_index(drop=True), ancho
+        )
+
+
+def test_variantes_snapshot_interpreta_listas_y_comodines(servicio):
+    assert servicio.variantes_snapshot("general, refrigerado", "vacio") == (["GENERAL", "REFRIGERADO"], ["VACIO"], True)
+    assert servicio.variantes_snapshot("GENERAL", "CARGADO") == (["GENERAL"], ["CARGADO"], False)
+    assert servicio.variantes_snapshot("*", "AMBOS") == (None, ["CARGADO", "VACIO"], True)
+    with pytest.raises(servicio.SicetacError) as ex:
+        servicio.variantes_snapshot("GENERAL", "IDA_VUELTA")
+    assert ex.value.status_code == 400
+
+
+@pytest.mark.parametrize("destino", ["BUCARAMANGA", "MEDELLIN"])
+def test_ida_vuelta_suma_ida_cargado_y_vuelta_vacio(servicio, destino):
+    def _totales(modo):
+        return servicio.calcular_sicetac_resumen(
+            _consulta(servicio, destino=destino, modo_viaje=modo, politica_variantes="MAS_BARATA")
+        )
+
+    ida_vuelta, cargado, vacio = _totales("ida_vuelta"), _totales("CARGADO"), _totales("VACIO")
+    assert ida_vuelta["modo_viaje"] == "IDA_VUELTA"
+    assert ida_vuelta["tramos"]["ida"] == {"modo_viaje": "CARGADO", "totales": cargado["totales"]}
+    assert ida_vuelta["tramos"]["vuelta"]["modo_viaje"] == "VACIO"
+    for hora, valor in ida_vuelta["totales"].items():
+        assert ida_vuelta["tramos"]["vuelta"]["totales"][hora] == pytest.approx(vacio["totales"][hora], abs=0.01)
+        assert valor == pytest.approx(cargado["totales"][hora] + vacio["totales"][hora], abs=0.02)
+
+
+
+def _resolver(servicio, **campos):
+    data = servicio.ConsultaInput(**{"destino": "MEDELLIN", **campos})
+    return servicio._resolve_route_inputs(data, servicio._helper_municipios())[2]
+
+
+def test_nombre_repetido_sin_departamento_es_409_con_candidatos(servicio):
+    with pytest.raises(servicio.SicetacError) as ex:
+        _resolver(servicio, origen="SAN PEDRO")
+    assert ex.value.status_code == 409
+    assert ex.value.detail["campo"] == "origen"
+    assert [(c["codigo_dane"], c["departamento"]) for c in ex.value.detail["candidatos"]] == [
+        ("05664", "ANTIOQUIA"),
+        ("76670", "VALLE DEL CAUCA"),
+    ]
+
+
+@pytest.mark.parametrize(
+    ("campos", "codigo", "modo"),
+    [
+        ({"origen": "SAN PEDRO", "departamento_origen": "valle"}, "76670", "name"),
+        ({"origen": "San Pedro, Antioquia"}, "05664", "name"),
+        ({"origen": "SAN PEDRO", "codigo_dane_origen": "05664"}, "05664", "code"),
+    ],
+)
+def test_departamento_o_codigo_desambiguan(servicio, campos, codigo, modo):
+    resolved = _resolver(servicio, **campos)
+    assert (resolved["codigo_dane_origen"], resolved["origen_resolution_mode"]) == (codigo, modo)
+    assert resolved["route_code"] == f"{codigo}-{MEDELLIN}"
+
+
+def test_departamento_que_no_corresponde_es_404(servicio):
+    with pytest.raises(servicio.SicetacError) as ex:
+        _resolver(servicio, origen="SAN PEDRO", departamento_origen="META")
+    assert ex.value.status_code == 404
+
+
+def test_sensibilidad_igual_a_recotizar_con_los_parametros_editados(monkeypatch, servicio, tablas):
+    consultas = [
+        _consulta(servicio),
+        _consulta(servicio, destino="BUCARAMANGA", vehiculo="C3S3", modo_viaje="IDA_VUELTA"),
+        _consulta(servicio, origen="NO EXISTE"),
+    ]
+    barrido = servicio.calcular_sensibilidad(servicio.SensibilidadInput(
+        consultas=consultas,
+        escenarios=[servicio.EscenarioInput(nombre="h2", horas_logisticas=2)],
+        grilla={"acpm_pct": [10], "horas_logisticas": [2], "factor_peajes": [0, 1]},
+    ))
+    assert [e["nombre"] for e in barrido["escenarios"]] == [
+        "base",
+        "h2",
+        "acpm_pct=10,factor_peajes=0,horas_logisticas=2",
+        "acpm_pct=10,factor_peajes=1,horas_logisticas=2",
+    ]
+    assert [(c["indice"], c["id_sice"]) for c in barrido["carriles"]] == [(0, 101), (0, 102), (1, 301)]
+    assert barrido["errores"] == [{"indice": 2, "error": "Origen o destino no encontrado", "status_code": 404}]
+    totales = np.array(barrido["totales"])
+    assert barrido["variacion_pct"][0][0] == 0.0
+
+    # Escenario h2 = cotización normal a 2 horas.
+    bog_med = servicio.calcular_sicetac_resumen(consultas[0])["variantes"]
+    ida_vuelta = servicio.calcular_sicetac_resumen(consultas[1])
+    assert totales[:, 1].tolist() == [v["totales"]["H2"] for v in bog_med] + [ida_vuelta["totales"]["H2"]]
+
+    # ACPM +10 % = recotizar con el precio del galón editado en la tabla.
+    parametros = tablas["parametros"]
+    tablas["parametros"] = parametros.assign(**{
+        "VALOR COMBUSTIBLE GALÓN ACPM": parametros["VALOR COMBUSTIBLE GALÓN ACPM"] * 1.1
+    })
+    monkeypatch.setattr(servicio, "_TARIFAS_INDEX", {})
+    editado = [v["totales"]["H2"] for v in servicio.calcular_sicetac_resumen(consultas[0])["variantes"]]
+    editado.append(servicio.calcular_sicetac_resumen(consultas[1])["totales"]["H2"])
+    np.testing.assert_allclose(totales[:, 3], editado, atol=0.02)
+
+    # Sin peajes, en las variantes cargadas la diferencia es proporcional al peaje de cada una.
+    proporcion = (totales[:2, 3] - totales[:2, 2]) / [80_000, 95_000]
+    assert proporcion[0] == pytest.approx(proporcion[1]) and proporcion[0] > 1
+    assert totales[2, 3] - totales[2, 2] > 2 * 150_000
+
+
+def test_sensibilidad_rechaza_grillas_demasiado_grandes(monkeypatch, servicio):
+    monkeypatch.setattr(servicio, "_SENSIBILIDAD_MAX_ESCENARIOS", 3)
+    with pytest.raises(servicio.SicetacError) as ex:
+        servicio.calcular_sensibilidad(servicio.SensibilidadInput(
+            consultas=[_consulta(servicio)], grilla={"acpm_pct": [1, 2, 3]}
+        ))
+    assert ex.value.status_code == 400
+
+
+def test_historial_mes_sin_parametros_queda_en_null_sin_tumbar_el_carril(servicio):
+    # C3 no tiene parámetros en el último MES; C2 no tiene costo fijo REFRIGERADO.
+    historial = servicio.calcular_historial(servicio.HistorialInput(consultas=[
+        _consulta(servicio, vehiculo="C3"),
+        _consulta(servicio, carroceria="REFRIGERADO"),
+        _consulta(servicio, vehiculo="NO EXISTE"),
+    ]))
+
+    assert historial["meses"] == [202501, 202502, 202503]
+    c3 = [c for c in historial["carriles"] if c["indice"] == 0]
+    assert len(c3) == 2
+    for carril in c3:
+        enero, febrero, marzo = carril["serie"]
+        assert enero["totales"]["H2"] > 0 and febrero["totales"]["H2"] > 0
+        assert marzo["totales"] is None
+        assert marzo["error"] == "Vehículo 'C3' sin parámetros para el MES 202503"
+    refrigerado = [c for c in historial["carriles"] if c["indice"] == 1]
+    assert refrigerado and all(p["totales"] is None and "REFRIGERADO" in p["error"] for c in refrigerado for p in c["serie"])
+    assert [(e["indice"], e["status_code"]) for e in historial["errores"]] == [(2, 400)]
+
+
+def test_refresh_completo_purga_meses_cerrados_y_el_arranque_no(monkeypatch, servicio, cache_local, tmp_path):
+    cerrados = resultados_cerrados.ResultadosCerrados(str(tmp_path / "cerrados.sqlite"))
+    monkeypatch.setattr(resultados_cerrados, "get_store", lambda: cerrados)
+    monkeypatch.setattr(servicio, "_USE_MESES_CERRADOS", True)
+    clave = {"mes": 202501, "carril": "101", "vehiculo": "C2", "carroceria": "GENERAL", "modo": "CARGADO", "huella": "h"}
+    cerrados.guardar(**clave, totales={2.0: 1_000_000.0})
+
+    # Primer refresh del proceso: el tier sobrevive al reinicio.
+    monkeypatch.setattr(servicio, "_LAST_REFRESH_TS", None)
+    assert servicio._refresh_cache() == {"modo": "completo"}
+    assert cerrados.obtener(**clave, horas=[2]) == {"H2": 1_000_000.0}
+
+    assert servicio._refresh_cache(completo=True) == {"modo": "completo", "resultados_cerrados_purgados": 1}
+    assert cerrados.obtener(**clave, horas=[2]) is None
+    assert cerrados.stats()["filas"] == 0
+
+
+@pytest.mark.parametrize("grafia", ["c3s3", "3S3"])
+def test_alias_de_vehiculo_cotiza_igual_que_el_tipo(servicio, grafia):
+    esperado = servicio.calcular_sicetac(_consulta(servicio, vehiculo="C3S3"))
+    alias = servicio.calcular_sicetac(_consulta(servicio, vehiculo=grafia))
+    assert len(esperado["variantes"]) == 2
+    assert alias["variantes"] == esperado["variantes"]
+
+
+def test_par_sin_ruta_directa_se_compone_por_tramos(servicio):
+    # Villavicencio-Medellín no está en rutas: 401 hasta Bogotá y la variante más corta (102).
+    compuesta = servicio.calcular_sicetac(_consulta(servicio, origen="VILLAVICENCIO"))
+
+    detalle = compuesta["ruta_compuesta"]
+    assert [(t["origen"], t["destino"], t["id_sice"], t["peaje"]) for t in detalle["tramos"]] == [
+        ("50001", BOGOTA, 401, 30_000),
+        (BOGOTA, MEDELLIN, 102, 95_000),
+    ]
+    assert (detalle["km_total"], detalle["peaje_total"]) == (495, 125_000)
+    manual = servicio.calcular_sicetac(_consulta(
+        servicio,
+        origen="VILLAVICENCIO",
+        manual_mode=True,
+        km_plano=270, km_ondulado=90, km_montanoso=100, km_urbano=25, km_despavimentado=10,
+        valor_peaje_manual=125_000,
+    ))
+    assert compuesta["totales"] == manual["totales"]
+
+
+def test_par_sin_camino_es_404(servicio):
+    with pytest.raises(servicio.SicetacError) as ex:
+        servicio.calcular_sicetac(_consulta(servicio, destino="SAN PEDRO", departamento_destino="ANTIOQUIA"))
+    assert ex.value.status_code == 404
+
+
+def test_viaje_con_paradas_igual_a_cotizar_cada_tramo(servicio):
+    viaje = servicio.calcular_viaje(servicio.ViajeInput(
+        vehiculo="C2",
+        paradas=[
+            {"municipio": "BOGOTA", "horas_logisticas": 2},
+            {"municipio": "MEDELLIN", "horas_logisticas": 2},
+            {"codigo_dane": "76001", "horas_logisticas": 8},
+        ],
+    ))
+
+    assert [p["codigo_dane"] for p in viaje["paradas"]] == [BOGOTA, MEDELLIN, "76001"]
+    primero, segundo = viaje["tramos"]
+    # Las horas de la primera parada se cargan al primer tramo.
+    assert [v["horas_logisticas"] for v in primero["variantes"]] == [4, 4]
+    bog_med = servicio.calcular_sicetac(_consulta(servicio))
+    assert [v["total"] for v in primero["variantes"]] == [v["totales"]["H4"] for v in bog_med["variantes"]]
+    med_cali = servicio.calcular_sicetac(_consulta(servicio, origen="MEDELLIN", destino="CALI"))
+    assert segundo["total"] == med_cali["totales"]["H8"]
+    assert primero["total"] == primero["variantes"][0]["total"]
+    assert viaje["total"] == pytest.approx(primero["total"] + segundo["total"])
+    assert viaje["km_total"] == 405 + 420
+
+
+def test_viaje_rechaza_paradas_invalidas(servicio):
+    with pytest.raises(servicio.SicetacError) as ex:
+        servicio.calcular_viaje(servicio.ViajeInput(paradas=[{"municipio": "BOGOTA"}]))
+    assert ex.value.status_code == 400
+    with pytest.raises(servicio.SicetacError) as ex:
+        servicio.calcular_viaje(servicio.ViajeInput(paradas=[{"municipio": "BOGOTA"}, {"municipio": "NO EXISTE"}]))
+    assert ex.value.status_code == 404
+    with pytest.raises(servicio.SicetacError) as ex:
+        servicio.calcular_viaje(servicio.ViajeInput(
+            paradas=[{"municipio": "BOGOTA"}, {"municipio": "MEDELLIN"}], modo_viaje="IDA_VUELTA"
+        ))
+    assert ex.value.status_code == 400
+
+
+def test_politica_de_variantes_elige_entre_las_variantes_de_todas(servicio):
+    todas = servicio.calcular_sicetac(_consulta(servicio, agregar_variantes=True))["variantes"]
+    por_id = {v["ID_SICE"]: v for v in todas}
+    assert set(por_id) == {101, 102}
+    mas_barata = min(todas, key=lambda v: v["totales"]["H2"])["ID_SICE"]
+
+    # La Dorada (102) es la más corta: 375 km contra 405 por Honda.
+    for politica, esperada in (("MAS_BARATA", mas_barata), ("MAS_CORTA", 102)):
+        respuesta = servicio.calcular_sicetac(_consulta(servicio, politica_variantes=politica))
+        assert "variantes" not in respuesta
+        seleccion = respuesta["seleccion_variante"]
+        assert (seleccion["politica"], seleccion["ID_SICE"], seleccion["candidatas"]) == (politica, esperada, 2)
+        assert respuesta["totales"] == por_id[esperada]["totales"]
+    rapida = servicio.calcular_sicetac(_consulta(servicio, politica_variantes="mas_rapida"))
+    assert rapida["seleccion_variante"]["evaluadas"] == 1
+    assert rapida["totales"] == por_id[rapida["seleccion_variante"]["ID_SICE"]]["totales"]
+
+
+def test_agregado_de_variantes_resume_todas(servicio):
+    respuesta = servicio.calcular_sicetac(_consulta(servicio, agregar_variantes=True, politica_variantes="MAS_CORTA"))
+    agregado = respuesta["agregado_variantes"]
+    # Con agregado se evalúan todas aunque la política elija una.
+    assert respuesta["seleccion_variante"]["evaluadas"] == 2
+    todas = servicio.calcular_sicetac(_consulta(servicio))["variantes"]
+    for hora in ("H2", "H4", "H8"):
+        valores = [v["totales"][hora] for v in todas]
+        assert agregado["min"][hora] == pytest.approx(min(valores))
+        assert agregado["max"][hora] == pytest.approx(max(valores))
+        assert agregado["mediana"][hora] == pytest.approx(float(np.median(valores)))
+    assert agregado["variantes"] == 2
+
+
+def test_politica_de_variantes_desconocida_es_400(servicio):
+    with pytest.raises(servicio.SicetacError) as ex:
+        servicio.calcular_sicetac(_consulta(servicio, politica_variantes="MAS_BONITA"))
+    assert ex.value.status_code == 400
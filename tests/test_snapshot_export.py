@@ -0,0 +1,80 @@
+import os
+
+import pandas as pd
+import pytest
+
+from snapshot_export import exportar_bloques, subir_archivo
+
+
+def test_exportar_csv_por_bloques_igual_al_snapshot_completo(servicio, tmp_path):
+    completo = servicio.generar_snapshot()
+    assert completo[["origen_nombre", "destino_nombre"]].iloc[0].tolist() == ["BOGOTA", "MEDELLIN"]
+    progreso = []
+    export = exportar_bloques(
+        servicio.iterar_snapshot(filas_por_bloque=2, progreso=lambda hechas, total: progreso.append((hechas, total))),
+        formato="csv",
+        directorio=str(tmp_path),
+    )
+    try:
+        assert progreso == [(2, 5), (4, 5), (5, 5)]
+        assert (export.filas, export.mes, export.columnas) == (len(completo), 202503, list(completo.columns))
+        assert export.bytes == os.path.getsize(export.ruta)
+        leido = pd.read_csv(export.ruta, dtype={"codigo_origen": str, "codigo_destino": str})
+        pd.testing.assert_frame_equal(leido, completo, check_dtype=False)
+    finally:
+        os.remove(export.ruta)
+
+
+def test_exportar_omite_bloques_vacios_y_borra_el_temporal_si_falla(tmp_path):
+    bloque = pd.DataFrame({"mes": [202503, 202503], "H2": [1.5, None]})
+    export = exportar_bloques([pd.DataFrame(), bloque, bloque], formato="csv", directorio=str(tmp_path))
+    assert export.filas == 4
+    with open(export.ruta, encoding="utf-8") as fh:
+        assert fh.read().splitlines() == ["mes,H2", "202503,1.5", "202503,", "202503,1.5", "202503,"]
+    os.remove(export.ruta)
+
+    def _bloques():
+        yield bloque
+        raise RuntimeError("falló el bloque")
+
+    with pytest.raises(RuntimeError):
+        exportar_bloques(_bloques(), formato="csv", directorio=str(tmp_path))
+    assert os.listdir(tmp_path) == []
+    with pytest.raises(ValueError):
+        exportar_bloques([bloque], formato="ods", directorio=str(tmp_path))
+
+
+def test_xlsx_separa_una_hoja_por_variante(tmp_path):
+    pytest.importorskip("xlsxwriter")
+    bloque = pd.DataFrame({
+        "mes": [202503] * 3,
+        "carroceria": ["GENERAL", "GENERAL", "REFRIGERADO"],
+        "modo_viaje": ["CARGADO", "VACIO", "CARGADO"],
+        "H2": [1.0, 2.0, 3.0],
+    })
+    export = exportar_bloques([bloque, bloque], formato="xlsx", directorio=str(tmp_path), separar_por=["carroceria", "modo_viaje"])
+    try:
+        import zipfile
+
+        with zipfile.ZipFile(export.ruta) as libro:
+            hojas = [n for n in libro.namelist() if n.startswith("xl/worksheets/sheet")]
+            indice = libro.read("xl/workbook.xml").decode()
+        assert len(hojas) == 3
+        for nombre in ("GENERAL CARGADO", "GENERAL VACIO", "REFRIGERADO CARGADO"):
+            assert f'name="{nombre}"' in indice
+        assert export.filas == 6
+    finally:
+        os.remove(export.ruta)
+
+
+def test_subir_archivo_envia_el_archivo_desde_disco(tmp_path):
+    ruta = tmp_path / "snapshot.csv"
+    ruta.write_text("mes\n202503\n", encoding="utf-8")
+    subidas = []
+
+    class _Bucket:
+        def upload(self, nombre, fh, opciones):
+            subidas.append((nombre, fh.read(), opciones))
+
+    subir_archivo(_Bucket(), "sicetac_snapshot_202503_all.csv", str(ruta), "csv")
+    assert subidas == [("sicetac_snapshot_202503_all.csv", b"mes\n202503\n", {"content-type": "text/csv", "upsert": True})]
@@ -0,0 +1,117 @@
+import time
+
+import pytest
+
+import snapshot_jobs
+import supabase_data
+from snapshot_jobs import CANCELADO, COMPLETADO, ERROR, SnapshotCancelado, SnapshotJobs
+
+
+# Trabajos falsos a nivel de módulo: el pool (fork) los recibe por referencia.
+def _job_rapido(job_id, carroceria, modo_viaje, formato, hojas, progreso, cancelados):
+    progreso[job_id] = {"fase": "calculando", "rutas_hechas": 2, "rutas_total": 2, "iniciado": time.time()}
+    return {"ok": True, "file": f"{carroceria}_{modo_viaje}.{formato}"}
+
+
+def _job_cancelable(job_id, carroceria, modo_viaje, formato, hojas, progreso, cancelados):
+    progreso[job_id] = {"fase": "calculando", "rutas_hechas": 1, "rutas_total": 4, "iniciado": time.time()}
+    limite = time.time() + 10
+    while not cancelados.get(job_id):
+        if time.time() > limite:
+            return {"ok": True}
+        time.sleep(0.01)
+    raise SnapshotCancelado(job_id)
+
+
+def _job_falla(job_id, carroceria, modo_viaje, formato, hojas, progreso, cancelados):
+    raise RuntimeError("Snapshot vacío")
+
+
+@pytest.fixture
+def jobs():
+    jobs = SnapshotJobs(workers=2, start_method="fork")
+    yield jobs
+    if jobs._executor is not None:
+        jobs._executor.shutdown(wait=True, cancel_futures=True)
+        jobs._manager.shutdown()
+
+
+def _esperar_progreso(jobs, job, timeout=10.0):
+    limite = time.monotonic() + timeout
+    while not jobs.estado(job)["progreso"]["rutas_hechas"]:
+        assert time.monotonic() < limite, "el job no reportó progreso"
+        time.sleep(0.01)
+
+
+def test_jobs_activos_se_deduplican_y_se_pueden_cancelar(monkeypatch, jobs):
+    monkeypatch.setattr(snapshot_jobs, "_ejecutar_snapshot", _job_cancelable)
+    job, creado = jobs.enviar(mes=202503, carroceria="general", modo_viaje="cargado", formato="csv")
+    assert creado
+    mismo, creado = jobs.enviar(mes=202503, carroceria=" GENERAL ", modo_viaje="CARGADO", formato="xlsx")
+    assert (mismo, creado) == (job, False)
+
+    _esperar_progreso(jobs, job)
+    estado = jobs.estado(job)
+    assert estado["estado"] == "ejecutando"
+    assert estado["progreso"]["porcentaje"] == 25.0
+    assert estado["progreso"]["eta_segundos"] is not None
+
+    assert jobs.cancelar(job.id).id == job.id
+    assert jobs.estado(job)["cancelacion_solicitada"] is True
+    jobs.esperar(job.id, timeout=10)
+    assert job.estado == CANCELADO
+    assert jobs.estado(job)["progreso"]["fase"] == CANCELADO
+
+    # Terminado el job, la misma clave vuelve a encolar uno nuevo.
+    monkeypatch.setattr(snapshot_jobs, "_ejecutar_snapshot", _job_rapido)
+    otro, creado = jobs.enviar(mes=202503, carroceria="GENERAL", modo_viaje="CARGADO", formato="csv")
+    assert creado and otro.id != job.id
+    jobs.esperar(otro.id, timeout=10)
+    assert jobs.estado(otro)["resultado"] == {"ok": True, "file": "GENERAL_CARGADO.csv"}
+    assert [j["job_id"] for j in jobs.listar()] == [otro.id, job.id]
+
+
+def test_job_con_error_queda_en_error(monkeypatch, jobs):
+    monkeypatch.setattr(snapshot_jobs, "_ejecutar_snapshot", _job_falla)
+    job, _ = jobs.enviar(mes=202503, carroceria="GENERAL", modo_viaje="VACIO", formato="csv")
+    jobs.esperar(job.id, timeout=10)
+    estado = jobs.estado(job)
+    assert (estado["estado"], estado["error"]) == (ERROR, "Snapshot vacío")
+
+
+def test_ejecutar_snapshot_exporta_sube_y_borra_el_temporal(monkeypatch, servicio, tmp_path):
+    subidas = []
+
+    class _Bucket:
+        def upload(self, nombre, fh, opciones):
+            subidas.append((nombre, fh.read().decode().splitlines()))
+
+        def get_public_url(self, nombre):
+            return f"https://bucket/{nombre}"
+
+    class _Cliente:
+        class storage:
+            @staticmethod
+            def from_(nombre):
+                assert nombre == "snapshots"
+                return _Bucket()
+
+    monkeypatch.setattr(supabase_data, "get_client", lambda: _Cliente())
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+    progreso, cancelados = {}, {}
+
+    resultado = snapshot_jobs._ejecutar_snapshot("j1", "*", "AMBOS", "csv", False, progreso, cancelados)
+
+    assert resultado["file"] == "sicetac_snapshot_202503_todas_ambos.csv"
+    assert resultado["url"] == f"https://bucket/{resultado['file']}"
+    assert progreso["j1"]["fase"] == "subiendo"
+    assert (progreso["j1"]["rutas_hechas"], progreso["j1"]["rutas_total"]) == (5, 5)
+    (nombre, lineas), = subidas
+    assert lineas[0].split(",")[5:8] == ["vehiculo", "carroceria", "modo_viaje"]
+    assert resultado["export"]["filas"] == len(lineas) - 1
+    assert list(tmp_path.iterdir()) == []
+
+    cancelados["j2"] = True
+    with pytest.raises(SnapshotCancelado):
+        snapshot_jobs._ejecutar_snapshot("j2", "GENERAL", "CARGADO", "csv", False, progreso, cancelados)
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,368 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+import supabase_data
+from supabase_data import CambioTabla, LookupCache, MarcaAguaNoDisponible, SingleFlight
+
+
+def _sin_marca_de_agua(table, column):
+    raise Exception({"code": "42703", "message": f"column {table}.{column} does not exist"})
+
+
+def test_refresh_table_sin_marca_de_agua_compara_hashes_por_fila(monkeypatch, cache_local):
+    filas = [
+        {"TIPO_VEHICULO": "C2", "MES": 202501, "COSTOS VARIABLES": 1200},
+        {"TIPO_VEHICULO": "C2", "MES": 202502, "COSTOS VARIABLES": 1250},
+        {"TIPO_VEHICULO": "C3S3", "MES": 202502, "COSTOS VARIABLES": 1500},
+    ]
+    monkeypatch.setattr(supabase_data, "_fetch_table_all", lambda table, page_size=1000: [dict(f) for f in filas])
+    monkeypatch.setattr(supabase_data, "_fetch_table_watermark", _sin_marca_de_agua)
+
+    assert supabase_data.refresh_table("parametros").metodo == "inicial"
+    generacion = supabase_data.get_table_generation("parametros")
+    df_inicial = supabase_data.get_table_df("parametros")
+
+    sin_cambios = supabase_data.refresh_table("parametros")
+    assert (sin_cambios.cambiado, sin_cambios.metodo) == (False, "hash")
+    assert supabase_data.get_table_df("parametros") is df_inicial
+
+    # Mismas filas en otro orden: no es un cambio.
+    filas.reverse()
+    assert supabase_data.refresh_table("parametros").cambiado is False
+
+    filas[0] = {"TIPO_VEHICULO": "C3S3", "MES": 202502, "COSTOS VARIABLES": 1550}
+    cambio = supabase_data.refresh_table("parametros")
+    assert (cambio.cambiado, cambio.metodo) == (True, "hash")
+    assert cambio.agregadas["COSTOS VARIABLES"].tolist() == [1550]
+    assert cambio.removidas["COSTOS VARIABLES"].tolist() == [1500]
+    assert supabase_data.get_table_generation("parametros") != generacion
+    # La tabla sin columna de marca de agua se recuerda y no se vuelve a consultar.
+    assert "parametros_vigentes" in supabase_data._TABLES_WITHOUT_WATERMARK
+
+
+def test_refresh_table_con_marca_de_agua_igual_no_descarga(monkeypatch, cache_local):
+    descargas = []
+
+    def _fetch(table, page_size=1000):
+        descargas.append(table)
+        return [{"ID_SICE": 101, "EJES_CONFIGURACION": "2", "VALOR_PEAJE": 80000}]
+
+    monkeypatch.setattr(supabase_data, "_fetch_table_all", _fetch)
+    monkeypatch.setattr(supabase_data, "_fetch_table_watermark", lambda table, column: (1, "2025-03-01T00:00:00"))
+
+    supabase_data.refresh_table("peajes")
+    cambio = supabase_data.refresh_table("peajes")
+    assert (cambio.cambiado, cambio.metodo) == (False, "watermark")
+    assert len(descargas) == 1
+
+
+def test_refresh_table_error_transitorio_de_marca_de_agua_se_reintenta(monkeypatch, cache_local):
+    monkeypatch.setattr(supabase_data, "_fetch_table_all", lambda table, page_size=1000: [{"ID_SICE": 101}])
+    monkeypatch.setattr(supabase_data, "_fetch_table_watermark", lambda table, column: (1, "2025-03-01"))
+    supabase_data.refresh_table("rutas")
+
+    def _timeout(table, column):
+        raise TimeoutError("read timed out")
+
+    monkeypatch.setattr(supabase_data, "_fetch_table_watermark", _timeout)
+    with pytest.raises(MarcaAguaNoDisponible):
+        supabase_data.table_changed("rutas")
+    cambio = supabase_data.refresh_table("rutas")
+    assert (cambio.cambiado, cambio.metodo) == (False, "error")
+    assert not supabase_data._TABLES_WITHOUT_WATERMARK
+
+    monkeypatch.setattr(supabase_data, "_fetch_table_watermark", lambda table, column: (1, "2025-03-01"))
+    assert supabase_data.table_changed("rutas") is False
+
+
+def test_refresh_cache_incremental_invalida_solo_los_meses_cambiados(monkeypatch, servicio, tablas):
+    df_parametros, df_costos = tablas["parametros"], tablas["costos_fijos"]
+    enero = servicio._get_tarifa_mes(df_parametros, df_costos, 202501, tablas["vehiculos"])
+    servicio._get_tarifa_mes(df_parametros, df_costos, 202502, tablas["vehiculos"])
+    peajes_index = servicio._get_peajes_index(tablas["peajes"])
+    rutas_index = servicio._get_rutas_index(tablas["rutas"])
+    ruta_bog_med = rutas_index[("11001", "05001")]
+
+    cambiadas = df_parametros[df_parametros["MES"] == 202502].head(1)
+    peajes = tablas["peajes"].copy()
+    peajes.loc[(peajes["ID_SICE"] == 201) & (peajes["EJES_CONFIGURACION"] == "2"), "VALOR_PEAJE"] = 71_000
+    tablas["peajes"] = peajes
+
+    def _refresh_table(key):
+        if key == "parametros":
+            return CambioTabla(key=key, cambiado=True, metodo="hash", agregadas=cambiadas, removidas=cambiadas)
+        if key == "peajes":
+            fila = peajes[peajes["ID_SICE"] == 201].head(1)
+            return CambioTabla(key=key, cambiado=True, metodo="hash", agregadas=fila)
+        return CambioTabla(key=key, cambiado=False, metodo="watermark")
+
+    monkeypatch.setattr(servicio, "refresh_table", _refresh_table)
+    monkeypatch.setattr(servicio, "table_changed", lambda key: False)
+    monkeypatch.setattr(servicio, "_CUBO_AUTO_UPDATE", False)
+
+    detalle = servicio._refresh_cache(force=True)
+    assert detalle["tarifas_invalidadas"] == [202502]
+    assert detalle["peajes_id_sice_reindexados"] == 1
+    assert servicio._TARIFAS_INDEX == {202501: enero}
+    # Índices de peajes y rutas actualizados en sitio, no reconstruidos.
+    assert servicio._PEAJES_INDEX is peajes_index
+    assert peajes_index.valor(201, "2") == 71_000
+    assert peajes_index.valor(101, "2") == 80_000
+    assert servicio._RUTAS_INDEX[("11001", "05001")] is ruta_bog_med
+
+
+def _esperar(condicion, timeout=5.0):
+    limite = time.monotonic() + timeout
+    while not condicion():
+        assert time.monotonic() < limite, "tiempo de espera agotado"
+        time.sleep(0.005)
+
+
+def test_lecturas_concurrentes_de_una_tabla_se_coalescen(monkeypatch, cache_local):
+    liberar = threading.Event()
+    descargas = []
+
+    def _fetch(table, page_size=1000):
+        descargas.append(table)
+        liberar.wait(5)
+        return [{"TIPO_VEHICULO": "C2", "EJES_CONFIGURACION": "2"}]
+
+    monkeypatch.setattr(supabase_data, "_fetch_table_all", _fetch)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futuros = [pool.submit(supabase_data.get_table_df, "vehiculos") for _ in range(8)]
+        _esperar(lambda: supabase_data.get_singleflight_stats()["total"]["compartidas"] == 7)
+        liberar.set()
+        resultados = [f.result() for f in futuros]
+
+    assert len(descargas) == 1
+    assert all(df is resultados[0] for df in resultados)
+    stats = supabase_data.get_singleflight_stats()
+    assert stats["por_tipo"]["tabla"] == {"llamadas": 8, "ejecutadas": 1, "compartidas": 7}
+    assert stats["en_vuelo"] == 0
+
+
+def test_single_flight_comparte_la_excepcion_y_no_cachea():
+    vuelo = SingleFlight()
+    liberar = threading.Event()
+    ejecuciones = []
+
+    def _falla():
+        ejecuciones.append(1)
+        liberar.wait(5)
+        raise TimeoutError("read timed out")
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futuros = [pool.submit(vuelo.do, ("lookup", 1), _falla) for _ in range(3)]
+        _esperar(lambda: vuelo.stats()["total"]["compartidas"] == 2)
+        liberar.set()
+        for futuro in futuros:
+            with pytest.raises(TimeoutError):
+                futuro.result()
+
+    assert len(ejecuciones) == 1
+    # Terminada la llamada, la siguiente vuelve a ejecutar.
+    assert vuelo.do(("lookup", 1), lambda: "ok") == "ok"
+    assert vuelo.stats()["por_tipo"]["lookup"]["ejecutadas"] == 2
+
+
+def test_lookup_cache_expira_cada_resultado_con_su_ttl(reloj):
+    cache = LookupCache(ttl_hit=60, ttl_miss=30, ttl_error=5)
+    cache.put("hit", "hit", 1)
+    cache.put("miss", "miss", None)
+    cache.put("error", "error", None)
+
+    reloj.ahora += 5
+    assert cache.get("error") is None
+    assert cache.get("miss").estado == "miss"
+    reloj.ahora += 25
+    assert cache.get("miss") is None
+    assert cache.get("hit").valor == 1
+    reloj.ahora += 30
+    assert not cache.contiene("hit")
+
+    stats = cache.stats()
+    assert stats["entradas"] == 1
+    assert stats["aciertos"] == {"consultas": 4, "expiradas": 2, "hit": 1, "miss": 1, "error": 0}
+
+
+def test_lookup_cache_descarta_la_entrada_mas_antigua_al_llenarse(reloj):
+    cache = LookupCache(ttl_hit=60, ttl_miss=30, ttl_error=5, maxsize=2)
+    for clave in ("a", "b", "c"):
+        cache.put(clave, "hit", clave)
+    assert [cache.contiene(c) for c in ("a", "b", "c")] == [False, True, True]
+
+
+def test_movilizacion_cachea_errores_poco_tiempo_y_ambos_sentidos(monkeypatch, cache_local, reloj):
+    consultas = []
+    falla = [True]
+
+    def _load(origen, destino, configuracion):
+        consultas.append((origen, destino))
+        if falla[0]:
+            raise TimeoutError("read timed out")
+        if (origen, destino) == ("05001", "11001"):
+            return pd.DataFrame([{"origen": origen, "destino": destino, "valor": 1_500_000}])
+        return pd.DataFrame()
+
+    monkeypatch.setattr(supabase_data, "_load_sicetac_movilizacion_df", _load)
+
+    assert supabase_data.get_sicetac_movilizacion_df("11001", "05001", "c2").empty
+    assert supabase_data.get_sicetac_movilizacion_df("11001", "05001", "C2").empty
+    assert len(consultas) == 1
+    estados = supabase_data.get_lookup_cache_stats()["sicetac_movilizacion"]["por_estado"]
+    assert estados == {"hit": 0, "miss": 0, "error": 1}
+
+    # Pasado el TTL de error se vuelve a consultar: directo vacío, inverso con filas.
+    falla[0] = False
+    reloj.ahora += 5
+    df = supabase_data.get_sicetac_movilizacion_df("11001", "05001", "C2")
+    assert df["valor"].tolist() == [1_500_000]
+    assert consultas[1:] == [("11001", "05001"), ("05001", "11001")]
+
+    # El par inverso sale del mismo cache, sin ir a Supabase.
+    assert supabase_data.get_sicetac_movilizacion_df("05001", "11001", "C2")["valor"].tolist() == [1_500_000]
+    assert len(consultas) == 3
+    reloj.ahora += 60
+    supabase_data.get_sicetac_movilizacion_df("05001", "11001", "C2")
+    assert consultas[3:] == [("05001", "11001")]
+
+
+_CONSOLIDADO = {
+    "sicetac_movilizacion_vigentes": [
+        {"origen": "11001", "destino": "05001", "configuracion": "C2", "valor": 1_500_000},
+        {"origen": "76001", "destino": "05001", "configuracion": "3S3", "valor": 2_900_000},
+    ],
+    "sicetac_valorhora_vigentes": [
+        {"configuracion": "C2", "valor_hora": 40_000},
+        {"configuracion": "3S3", "valor_hora": 65_000},
+    ],
+    "valor_en_plaza_mensual_descriptiva": [
+        {"ruta": "11001-05001", "configuracion": "C2", "mes_codigo": 202502, "valor_en_plaza_carga_normal": 1_810_000},
+        {"ruta": "11001-05001", "configuracion": "C2", "mes_codigo": 202503, "valor_en_plaza_carga_normal": 1_820_000},
+    ],
+}
+
+
+def _coincide(fila, filtros):
+    return all(
+        str(fila[col]) == str(valor) if op == "eq" else str(fila[col]).upper() == str(valor).upper()
+        for col, op, valor in filtros
+    )
+
+
+def _fetch_consolidado(table, *, select="*", filters=None, limit=None, order=None):
+    filas = [dict(f) for f in _CONSOLIDADO[table] if _coincide(f, filters or [])]
+    return filas[:limit] if limit is not None else filas
+
+
+def _rpc_consolidado(nombre, params):
+    # Lo mismo que sql/sicetac_lookup.sql sobre las tablas en memoria.
+    def _carril(origen, destino, configuracion, ruta):
+        movilizacion, sentido = _fetch_consolidado(
+            "sicetac_movilizacion_vigentes",
+            filters=[("origen", "eq", origen), ("destino", "eq", destino), ("configuracion", "ilike", configuracion)],
+        ), "directo"
+        if not movilizacion:
+            movilizacion, sentido = _fetch_consolidado(
+                "sicetac_movilizacion_vigentes",
+                filters=[("origen", "eq", destino), ("destino", "eq", origen), ("configuracion", "ilike", configuracion)],
+            ), "inverso"
+        plaza = None
+        if ruta is not None:
+            plaza = _fetch_consolidado(
+                "valor_en_plaza_mensual_descriptiva", filters=[("ruta", "eq", ruta), ("configuracion", "ilike", configuracion)]
+            )
+            plaza.sort(key=lambda f: f["mes_codigo"], reverse=True)
+        return {
+            "sentido": sentido,
+            "movilizacion": movilizacion,
+            "valorhora": _fetch_consolidado("sicetac_valorhora_vigentes", filters=[("configuracion", "ilike", configuracion)], limit=1),
+            "valor_plaza": plaza,
+        }
+
+    if nombre == supabase_data.LOOKUP_RPC:
+        return _carril(params["p_origen"], params["p_destino"], params["p_configuracion"], params["p_ruta"])
+    assert nombre == supabase_data.LOOKUP_RPC_LOTE
+    return [_carril(c["origen"], c["destino"], c["configuracion"], c["ruta"]) for c in params["p_carriles"]]
+
+
+_CARRILES = [
+    ("11001", "05001", "c2", "11001-05001"),
+    # Solo hay fila en el sentido inverso.
+    ("05001", "76001", "3S3", None),
+    ("11001", "68001", "C2", None),
+]
+
+
+def _lookups_como_listas(resultados):
+    return [{k: df.to_dict("records") for k, df in r.items()} for r in resultados]
+
+
+@pytest.mark.parametrize("carriles", [_CARRILES, _CARRILES[1:2]], ids=["lote", "un_carril"])
+def test_lookup_combinado_igual_a_consultas_por_tabla(monkeypatch, cache_local, carriles):
+    consultas = []
+    monkeypatch.setattr(
+        supabase_data, "_fetch_table_filtered", lambda table, **k: consultas.append(table) or _fetch_consolidado(table, **k)
+    )
+    monkeypatch.setattr(supabase_data, "USE_LOOKUP_RPC", False)
+    por_tabla = _lookups_como_listas(supabase_data.get_lookup_carriles(carriles))
+    assert consultas
+
+    for cache in supabase_data._LOOKUP_CACHES.values():
+        cache.clear()
+    consultas.clear()
+    llamadas = []
+    monkeypatch.setattr(supabase_data, "USE_LOOKUP_RPC", True)
+    supabase_data.set_lookup_rpc(lambda nombre, params: llamadas.append(nombre) or _rpc_consolidado(nombre, params))
+    combinado = _lookups_como_listas(supabase_data.get_lookup_carriles(carriles))
+
+    assert combinado == por_tabla
+    assert consultas == [] and len(llamadas) == 1
+    assert supabase_data.get_lookup_rpc_stats()["carriles"] == len(carriles)
+    assert por_tabla[0]["movilizacion"][0]["valor"] == (1_500_000 if len(carriles) > 1 else 2_900_000)
+
+
+def test_lookup_combinado_sentido_inverso_guarda_ambas_claves(monkeypatch, cache_local):
+    monkeypatch.setattr(supabase_data, "_fetch_table_filtered", lambda *a, **k: pytest.fail("consulta por tabla"))
+    monkeypatch.setattr(supabase_data, "USE_LOOKUP_RPC", True)
+    supabase_data.set_lookup_rpc(_rpc_consolidado)
+    supabase_data.get_lookup_carriles([("05001", "76001", "3S3", None)])
+
+    entrada = supabase_data._LOOKUP_CACHES["sicetac_movilizacion"].get(("05001", "76001", "3S3"))
+    assert entrada.estado == "hit"
+    assert entrada.valor[("05001", "76001")].empty
+    assert entrada.valor[("76001", "05001")]["valor"].tolist() == [2_900_000]
+    # Ambos sentidos salen del cache sin volver a Supabase.
+    for origen, destino in (("05001", "76001"), ("76001", "05001")):
+        assert supabase_data.get_sicetac_movilizacion_df(origen, destino, "3S3")["valor"].tolist() == [2_900_000]
+
+
+def test_lookup_combinado_que_falla_cae_a_tablas_y_pausa(monkeypatch, cache_local, reloj):
+    monkeypatch.setattr(supabase_data, "_fetch_table_filtered", _fetch_consolidado)
+    monkeypatch.setattr(supabase_data, "USE_LOOKUP_RPC", True)
+    llamadas = []
+
+    def _rpc_caido(nombre, params):
+        llamadas.append(nombre)
+        raise Exception({"code": "PGRST202", "message": "Could not find the function"})
+
+    supabase_data.set_lookup_rpc(_rpc_caido)
+    resultado = supabase_data.get_lookup_carriles(_CARRILES[:1])
+    assert resultado[0]["movilizacion"]["valor"].tolist() == [1_500_000]
+    assert resultado[0]["valorhora"]["valor_hora"].tolist() == [40_000]
+    assert resultado[0]["valor_plaza"]["mes_codigo"].tolist() == [202503, 202502]
+    stats = supabase_data.get_lookup_rpc_stats()
+    assert (stats["fallos"], stats["llamadas"], stats["pausa_segundos"]) == (1, 0, supabase_data.LOOKUP_RPC_BACKOFF)
+
+    # Durante la pausa los carriles nuevos van directo a las tablas.
+    reloj.ahora += supabase_data.LOOKUP_RPC_BACKOFF - 1
+    assert supabase_data.get_lookup_carriles([_CARRILES[1]])[0]["movilizacion"]["valor"].tolist() == [2_900_000]
+    assert len(llamadas) == 1
+    reloj.ahora += 1
+    supabase_data.get_lookup_carriles([_CARRILES[2]])
+    assert len(llamadas) == 2
+    assert supabase_data.get_lookup_rpc_stats()["fallos"] == 2
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+from valor_plaza_store import ValorPlazaStore
+
+_NORMAL = ("valor_en_plaza_carga_normal", "Carga normal", "fuente_carga_normal")
+_REFRIGERADA = ("valor_en_plaza_refrigerada", "Refrigerada", "fuente_refrigerada")
+
+
+def _store() -> ValorPlazaStore:
+    filas = []
+    for mes, normal, refrigerada in ((202501, 100.0, 130.0), (202502, 110.0, np.nan), (202503, 120.0, 150.0), (202412, 90.0, 120.0)):
+        filas.append({
+            "ruta": "11001-05001",
+            "configuracion": "3s3",
+            "mes_codigo": mes,
+            "valor_en_plaza_carga_normal": normal,
+            "valor_en_plaza_refrigerada": refrigerada,
+            "fuente_carga_normal": "encuesta",
+            "fuente_refrigerada": "gremio",
+        })
+    filas.append({"ruta": "05001-76001", "configuracion": "C2", "mes_codigo": 202503, "valor_en_plaza_carga_normal": 80.0})
+    filas.append({"ruta": "05001-76001", "configuracion": "C2", "mes_codigo": None, "valor_en_plaza_carga_normal": 70.0})
+    return ValorPlazaStore(pd.DataFrame(filas))
+
+
+def test_resumen_toma_los_ultimos_meses_con_valor():
+    resumen = _store().resumen("11001-05001", "3S3", columna=_NORMAL[0], label=_NORMAL[1], columna_fuente=_NORMAL[2])
+    assert [m["mes_codigo"] for m in resumen["meses"]] == [202503, 202502, 202501]
+    assert [m["mes_label"] for m in resumen["meses"]] == ["2025-03", "2025-02", "2025-01"]
+    assert resumen["promedio_ultimos_meses"] == 110.0
+    assert resumen["fallback_to_carga_normal"] is False
+    assert resumen["meses"][0]["fuente"] == "encuesta"
+
+
+def test_resumen_refrigerada_cae_a_carga_normal_en_meses_sin_valor():
+    resumen = _store().resumen(
+        "11001-05001", "3S3", columna=_REFRIGERADA[0], label=_REFRIGERADA[1], columna_fuente=_REFRIGERADA[2]
+    )
+    assert [(m["valor"], m["tipo_carga_usado"], m["fuente"]) for m in resumen["meses"]] == [
+        (150.0, "Refrigerada", "gremio"),
+        (110.0, "Carga normal", "encuesta"),
+        (130.0, "Refrigerada", "gremio"),
+    ]
+    assert resumen["fallback_to_carga_normal"] is True
+
+
+def test_resumen_lote_igual_a_resumen_por_carril():
+    store = _store()
+    consultas = [
+        ("11001-05001", "3S3", *_NORMAL),
+        ("05001-76001", "c2", *_REFRIGERADA),
+        ("11001-05001", "3S3", *_REFRIGERADA),
+        ("99999-00000", "C2", *_NORMAL),
+    ]
+    lote = store.resumen_lote(consultas, max_months=2)
+    por_carril = [
+        store.resumen(r, c, columna=col, label=label, columna_fuente=fuente, max_months=2)
+        for r, c, col, label, fuente in consultas
+    ]
+    assert lote == por_carril
+    assert lote[3] is None
+    # Meses sin mes_codigo quedan al final.
+    assert [m["mes_codigo"] for m in lote[1]["meses"]] == [202503, None]
@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+from vehicle_registry import VehicleRegistry
+
+
+def _registry() -> VehicleRegistry:
+    return VehicleRegistry(pd.DataFrame([
+        {"TIPO_VEHICULO": "C2", "EJES_CONFIGURACION": "2", "CONFIGURACION_SICETAC_LOOKUP": "c2"},
+        {"TIPO_VEHICULO": "C3S3", "EJES_CONFIGURACION": "3S3", "CONFIGURACION_SICETAC_LOOKUP": None, "CONFIGURACION_ANALISIS": "3s3"},
+        # Fila repetida: gana la primera.
+        {"TIPO_VEHICULO": "C3S3", "EJES_CONFIGURACION": "99", "CONFIGURACION_SICETAC_LOOKUP": "OTRO"},
+        {"TIPO_VEHICULO": "2", "EJES_CONFIGURACION": "2", "CONFIGURACION_SICETAC_LOOKUP": None},
+    ]))
+
+
+@pytest.mark.parametrize("grafia", ["C3S3", "c3s3", " 3S3 ", "3s3"])
+def test_grafias_equivalentes_resuelven_al_mismo_registro(grafia):
+    registro = _registry().resolver(grafia)
+    assert registro is not None
+    assert (registro.tipo, registro.ejes, registro.configuracion_lookup) == ("C3S3", "33", "3S3")
+
+
+def test_grafia_exacta_tiene_prioridad_sobre_alias():
+    registry = _registry()
+    assert registry.resolver("2").tipo == "2"
+    assert registry.resolver("c2").tipo == "C2"
+    # Sin columna de lookup cae a EJES_CONFIGURACION.
+    assert registry.resolver("2").configuracion_lookup == "2"
+
+
+def test_vehiculo_desconocido_no_resuelve():
+    registry = _registry()
+    assert registry.resolver("C9") is None
+    assert registry.resolver(None) is None
+    assert "C9" not in registry and "3s3" in registry
+    assert len(registry) == 3
+    assert registry.tipos == ["C2", "C3S3", "2"]
+    assert registry.ejes == {"C2": "2", "C3S3": "33", "2": "2"}
+
+
+def test_registry_vacio():
+    assert len(VehicleRegistry(pd.DataFrame())) == 0
+    assert VehicleRegistry(None).resolver("C2") is None
@@ -0,0 +1,158 @@
+"""
+Índice en memoria de `valor_en_plaza_mensual_descriptiva`.
+
+Las filas se ordenan por (ruta|configuración, mes_codigo desc) en arreglos
+columnares; cada consulta es un `searchsorted` sobre las claves y una
+extracción vectorizada de los últimos N meses válidos. `resumen_lote`
+resuelve muchos carriles con una sola búsqueda vectorizada.
+"""
+from __future__ import annotations
+
+import re
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+COLUMNA_FALLBACK = "valor_en_plaza_carga_normal"
+FUENTE_FALLBACK = "fuente_carga_normal"
+_COLUMNAS_VALOR = ("valor_en_plaza_carga_normal", "valor_en_plaza_refrigerada")
+_COLUMNAS_FUENTE = ("fuente_carga_normal", "fuente_refrigerada")
+
+
+def _clave(route_code: Any, configuracion: Any) -> str:
+    return f"{str(route_code or '').strip()}|{str(configuracion or '').strip().upper()}"
+
+
+def _mes_label(mes_codigo: Any) -> str:
+    digits = re.sub(r"\D", "", str(mes_codigo or ""))
+    if len(digits) >= 6:
+        return f"{digits[:4]}-{digits[4:6]}"
+    return str(mes_codigo or "")
+
+
+class ValorPlazaStore:
+    def __init__(self, df: pd.DataFrame):
+        if df is None or df.empty or "ruta" not in df.columns or "configuracion" not in df.columns:
+            df = pd.DataFrame(columns=["ruta", "configuracion", "mes_codigo"])
+        claves = np.array(
+            [_clave(r, c) for r, c in zip(df["ruta"], df["configuracion"])],
+            dtype=str,
+        )
+        mes = pd.to_numeric(df.get("mes_codigo"), errors="coerce").to_numpy(dtype=float) if len(df) else np.empty(0)
+        # Orden: clave asc, mes desc con NaN al final.
+        orden = np.lexsort((np.where(np.isnan(mes), np.inf, -mes), claves))
+        self._claves = claves[orden]
+        self._mes = mes[orden]
+        self._valores = {
+            col: (
+                pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float)[orden]
+                if col in df.columns else np.full(len(orden), np.nan)
+            )
+            for col in _COLUMNAS_VALOR
+        }
+        self._fuentes = {
+            col: (df[col].to_numpy(dtype=object)[orden] if col in df.columns else np.full(len(orden), None, dtype=object))
+            for col in _COLUMNAS_FUENTE
+        }
+
+    def __len__(self) -> int:
+        return len(self._claves)
+
+    def _rangos(self, claves: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        buscadas = np.array(claves, dtype=str)
+        return (
+            np.searchsorted(self._claves, buscadas, side="left"),
+            np.searchsorted(self._claves, buscadas, side="right"),
+        )
+
+    def _resumen_rango(
+        self,
+        lo: int,
+        hi: int,
+        *,
+        route_code: str,
+        configuracion: str,
+        columna: str,
+        label: str,
+        columna_fuente: str | None,
+        max_months: int,
+    ) -> dict[str, Any] | None:
+        if hi <= lo:
+            return None
+        preferido = self._valores.get(columna, np.full(len(self._claves), np.nan))[lo:hi]
+        respaldo = self._valores[COLUMNA_FALLBACK][lo:hi]
+        usa_respaldo = np.isnan(preferido) & (columna != COLUMNA_FALLBACK)
+        valores = np.where(usa_respaldo, respaldo, preferido)
+        validos = np.flatnonzero(~np.isnan(valores))[:max_months]
+        if not len(validos):
+            return None
+        # Igual que el recorrido fila a fila: el respaldo cuenta hasta la última fila usada.
+        fallback_used = bool(usa_respaldo[: validos[-1] + 1].any())
+
+        fuente_pref = self._fuentes.get(columna_fuente) if columna_fuente else None
+        fuente_resp = self._fuentes[FUENTE_FALLBACK]
+        meses: list[dict[str, Any]] = []
+        for i in validos:
+            pos = lo + i
+            fuente = fuente_resp[pos] if usa_respaldo[i] else (fuente_pref[pos] if fuente_pref is not None else None)
+            mes = self._mes[pos]
+            meses.append(
+                {
+                    "mes_codigo": int(mes) if not np.isnan(mes) else None,
+                    "mes_label": _mes_label(int(mes) if not np.isnan(mes) else None),
+                    "valor": float(valores[i]),
+                    "fuente": None if pd.isna(fuente) else (str(fuente).strip() or None),
+                    "tipo_carga_usado": "Carga normal" if usa_respaldo[i] else label,
+                }
+            )
+        return {
+            "route_code": route_code,
+            "configuracion_analisis": configuracion,
+            "tipo_carga_label": label,
+            "tipo_carga_column": columna,
+            "fallback_to_carga_normal": fallback_used,
+            "meses": meses,
+            "promedio_ultimos_meses": float(valores[validos].mean()),
+        }
+
+    def resumen(
+        self,
+        route_code: str,
+        configuracion: str,
+        *,
+        columna: str,
+        label: str,
+        columna_fuente: str | None,
+        max_months: int = 3,
+    ) -> dict[str, Any] | None:
+        return self.resumen_lote(
+            [(route_code, configuracion, columna, label, columna_fuente)],
+            max_months=max_months,
+        )[0]
+
+    def resumen_lote(
+        self,
+        consultas: list[tuple[str, str, str, str, str | None]],
+        *,
+        max_months: int = 3,
+    ) -> list[dict[str, Any] | None]:
+        """
+        `consultas` = [(route_code, configuracion, columna, label, columna_fuente)].
+        """
+        if not consultas:
+            return []
+        los, his = self._rangos([_clave(r, c) for r, c, *_ in consultas])
+        return [
+            self._resumen_rango(
+                int(lo),
+                int(hi),
+                route_code=str(route_code or "").strip(),
+                configuracion=str(configuracion or "").strip().upper(),
+                columna=columna,
+                label=label,
+                columna_fuente=columna_fuente,
+                max_months=max_months,
+            )
+            for (route_code, configuracion, columna, label, columna_fuente), lo, hi in zip(consultas, los, his)
+        ]
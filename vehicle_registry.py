@@ -0,0 +1,102 @@
+"""
+Registro de vehículos precalculado.
+
+Se construye una vez por generación de `configuracion_vehicular`. Cada
+grafía aceptada de un vehículo (`C3S3`, `c3s3`, `3S3`) apunta al mismo
+`VehiculoRegistro` con sus ejes y la configuración de lookup del consolidado,
+de modo que validar un vehículo es una búsqueda en un dict. Parámetros y
+costos fijos por vehículo se leen de la tarifa compilada del MES
+(`TarifaMes.posiciones`).
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+import re
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+# Orden de preferencia para la configuración del lookup consolidado.
+_COLUMNAS_LOOKUP = (
+    "CONFIGURACION_SICETAC_LOOKUP",
+    "configuracion_sicetac_lookup",
+    "CONFIGURACION_ANALISIS",
+    "EJES_CONFIGURACION",
+)
+
+
+@dataclass(frozen=True)
+class VehiculoRegistro:
+    tipo: str
+    ejes: str
+    configuracion_lookup: str
+
+
+def _ejes_limpios(valor: Any) -> str:
+    # Igual que `_clean_id` del servicio: dígitos de EJES_CONFIGURACION.
+    s = str(valor or "").strip()
+    if not s:
+        return ""
+    digits = re.sub(r"\D", "", s)
+    return digits or s
+
+
+def _configuracion_lookup(fila: pd.Series, tipo: str) -> str:
+    for columna in _COLUMNAS_LOOKUP:
+        valor = fila.get(columna)
+        if valor is not None and not (isinstance(valor, float) and np.isnan(valor)) and str(valor).strip():
+            return str(valor).strip().upper()
+    return tipo.strip().upper()
+
+
+def alias_vehiculo(vehiculo: str) -> list[str]:
+    """Grafías equivalentes, de la más a la menos estricta."""
+    exacto = str(vehiculo or "").strip()
+    upper = exacto.upper()
+    return list(dict.fromkeys([exacto, upper, upper.removeprefix("C"), upper.replace("C", "")]))
+
+
+class VehicleRegistry:
+    def __init__(self, df_vehiculos: pd.DataFrame):
+        self._registros: dict[str, VehiculoRegistro] = {}
+        if df_vehiculos is not None and not df_vehiculos.empty and "TIPO_VEHICULO" in df_vehiculos.columns:
+            # Primera fila por TIPO_VEHICULO, como el filtro `.iloc[0]` anterior.
+            for _, fila in df_vehiculos.drop_duplicates(subset="TIPO_VEHICULO", keep="first").iterrows():
+                tipo = str(fila["TIPO_VEHICULO"]).strip()
+                if not tipo or tipo in self._registros:
+                    continue
+                self._registros[tipo] = VehiculoRegistro(
+                    tipo=tipo,
+                    ejes=_ejes_limpios(fila.get("EJES_CONFIGURACION")),
+                    configuracion_lookup=_configuracion_lookup(fila, tipo),
+                )
+        self._ejes = {tipo: r.ejes for tipo, r in self._registros.items()}
+
+        # Las grafías exactas tienen prioridad; entre alias gana el primer vehículo.
+        self._alias: dict[str, VehiculoRegistro] = {tipo: r for tipo, r in self._registros.items()}
+        for registro in self._registros.values():
+            for alias in alias_vehiculo(registro.tipo):
+                self._alias.setdefault(alias, registro)
+
+    def __len__(self) -> int:
+        return len(self._registros)
+
+    def __contains__(self, vehiculo: str) -> bool:
+        return self.resolver(vehiculo) is not None
+
+    @property
+    def tipos(self) -> list[str]:
+        return list(self._registros)
+
+    @property
+    def ejes(self) -> dict[str, str]:
+        # Calculado una vez en el constructor; no modificar.
+        return self._ejes
+
+    def resolver(self, vehiculo: str | None) -> VehiculoRegistro | None:
+        for alias in alias_vehiculo(vehiculo or ""):
+            registro = self._alias.get(alias)
+            if registro is not None:
+                return registro
+        return None